@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+路径规划基准测试
+Path Planning Benchmark
+
+在空旷堆场和杂乱堆场上比较A*与跳点搜索(JPS)的展开节点数和耗时，
+并校验两者的路径长度一致。
+
+用法:
+    python benchmarks/bench_pathfinding.py
+    python benchmarks/bench_pathfinding.py --grid 500 500 --queries 50 --output results.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tms_system import PathPlanner, Position
+
+# 堆场类型 -> 障碍物密度
+DEFAULT_YARDS = {'open': 0.0, 'sparse': 0.05, 'cluttered': 0.2}
+
+def build_planner(grid_size, density: float, seed: int) -> PathPlanner:
+    """按随机种子生成堆场，关闭路径缓存以便测量每次搜索"""
+    rng = random.Random(seed)
+    planner = PathPlanner(grid_size, cache_size=0)
+    width, height = grid_size
+    for _ in range(int(width * height * density)):
+        planner.add_obstacle(Position(rng.randrange(width), rng.randrange(height)))
+    return planner
+
+def random_queries(planner: PathPlanner, count: int, seed: int):
+    """生成起点和终点都可通行的查询"""
+    rng = random.Random(seed + 1)
+    queries = []
+    while len(queries) < count:
+        start = Position(rng.randrange(planner.grid_width), rng.randrange(planner.grid_height))
+        goal = Position(rng.randrange(planner.grid_width), rng.randrange(planner.grid_height))
+        if not planner.is_blocked(start) and not planner.is_blocked(goal):
+            queries.append((start, goal))
+    return queries
+
+def run_case(planner: PathPlanner, queries, algorithm: str) -> dict:
+    """对同一组查询运行一种算法，返回每次查询的路径长度和汇总指标"""
+    lengths = []
+    expanded = 0
+    elapsed = 0.0
+    for start, goal in queries:
+        begin = time.perf_counter()
+        path = planner.a_star_path(start, goal, algorithm=algorithm)
+        elapsed += time.perf_counter() - begin
+        expanded += planner.last_search_stats['expanded']
+        lengths.append(len(path))
+    return {
+        'algorithm': algorithm,
+        'queries': len(queries),
+        'found': sum(1 for length in lengths if length),
+        'expanded': expanded,
+        'seconds': elapsed,
+        'lengths': lengths
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="路径规划基准测试")
+    parser.add_argument('--grid', type=int, nargs=2, default=[300, 300], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--queries', type=int, default=30, help="每种堆场的查询数量")
+    parser.add_argument('--yards', nargs='+', default=list(DEFAULT_YARDS), choices=list(DEFAULT_YARDS))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="将结果写入JSON文件")
+    args = parser.parse_args()
+    
+    grid_size = tuple(args.grid)
+    results = []
+    print(f"{'堆场':>10} {'算法':>6} {'可达':>6} {'展开节点':>12} {'耗时(s)':>10}")
+    for yard in args.yards:
+        planner = build_planner(grid_size, DEFAULT_YARDS[yard], args.seed)
+        queries = random_queries(planner, args.queries, args.seed)
+        cases = [run_case(planner, queries, algorithm) for algorithm in PathPlanner.ALGORITHMS]
+        
+        # 两种算法的路径长度必须一致
+        if any(case['lengths'] != cases[0]['lengths'] for case in cases):
+            raise SystemExit(f"{yard} 堆场上各算法的路径长度不一致")
+        
+        for case in cases:
+            case.pop('lengths')
+            case.update({'yard': yard, 'grid': list(grid_size), 'density': DEFAULT_YARDS[yard]})
+            results.append(case)
+            print(f"{yard:>10} {case['algorithm']:>6} {case['found']:>6} "
+                  f"{case['expanded']:>12} {case['seconds']:>10.3f}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'pathfinding', 'seed': args.seed, 'results': results},
+                      f, indent=2, ensure_ascii=False)
+        print(f"结果已写入 {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+任务调度基准测试
+Task Scheduling Benchmark
+
+比较贪心调度与最小代价匹配调度在不同规模下的总行驶距离和求解耗时。
+
+用法:
+    python benchmarks/bench_scheduling.py
+    python benchmarks/bench_scheduling.py --sizes 100 1000 --output results.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tms_system import TMSSystem, TerminalWarehouse, FrameTruck, Position
+
+# 默认规模：任务数 -> 车头数
+DEFAULT_FLEET = {100: 50, 1000: 200, 10000: 500}
+
+def build_system(db_path: str, n_tasks: int, n_trucks: int, seed: int,
+                 grid_size=(200, 200), n_warehouses: int = 50) -> TMSSystem:
+    """按随机种子构建一个可复现的调度场景"""
+    rng = random.Random(seed)
+    tms = TMSSystem(grid_size=grid_size, db_path=db_path, write_behind=True)
+    
+    def random_position() -> Position:
+        return Position(rng.randrange(grid_size[0]), rng.randrange(grid_size[1]))
+    
+    warehouses = [TerminalWarehouse(f"W{i:04d}", f"仓库{i}", random_position(), 10000.0)
+                  for i in range(n_warehouses)]
+    tms.add_warehouses_bulk(warehouses)
+    tms.add_equipment_bulk([FrameTruck(f"T{i:05d}", f"车头{i}", random_position())
+                            for i in range(n_trucks)])
+    
+    now = datetime.now()
+    for _ in range(n_tasks):
+        source, target = rng.sample(warehouses, 2)
+        task = tms.create_internal_transfer_task(source.id, target.id, {"P001": 1})
+        task.priority = rng.randint(1, 5)
+        task.deadline = now + timedelta(hours=rng.uniform(0.5, 48))
+    return tms
+
+def total_distance(tms: TMSSystem, schedule) -> float:
+    """已分配任务的设备到任务起点的总距离"""
+    distance = 0.0
+    for task_id in schedule:
+        task = tms.tasks[task_id]
+        equipment = tms.equipment[task.assigned_equipment]
+        distance += equipment.position.distance_to(tms._get_task_position(task))
+    return distance
+
+def run_case(n_tasks: int, n_trucks: int, mode: str, seed: int) -> dict:
+    """运行单个规模和模式的测试"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tms = build_system(os.path.join(tmp_dir, "bench.db"), n_tasks, n_trucks, seed)
+        try:
+            start = time.perf_counter()
+            schedule = tms.optimize_task_schedule(mode=mode)
+            elapsed = time.perf_counter() - start
+            
+            priorities = [tms.tasks[task_id].priority for task_id in schedule]
+            return {
+                'tasks': n_tasks,
+                'equipment': n_trucks,
+                'mode': mode,
+                'assigned': len(schedule),
+                'total_distance': total_distance(tms, schedule),
+                'mean_priority': sum(priorities) / len(priorities) if priorities else 0.0,
+                'solve_seconds': elapsed
+            }
+        finally:
+            tms.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="任务调度基准测试")
+    parser.add_argument('--sizes', type=int, nargs='+', default=sorted(DEFAULT_FLEET),
+                        help="任务数量列表")
+    parser.add_argument('--fleet', type=int, default=None,
+                        help="车头数量（默认按任务规模取 50/200/500）")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="将结果写入JSON文件")
+    args = parser.parse_args()
+    
+    logging.disable(logging.INFO)
+    
+    results = []
+    print(f"{'任务数':>8} {'设备数':>6} {'模式':>8} {'已分配':>6} {'总距离':>12} {'平均优先级':>10} {'耗时(s)':>10}")
+    for n_tasks in args.sizes:
+        n_trucks = args.fleet or DEFAULT_FLEET.get(n_tasks, max(1, n_tasks // 20))
+        for mode in TMSSystem.SCHEDULE_MODES:
+            result = run_case(n_tasks, n_trucks, mode, args.seed)
+            results.append(result)
+            print(f"{result['tasks']:>8} {result['equipment']:>6} {mode:>8} {result['assigned']:>6} "
+                  f"{result['total_distance']:>12.1f} {result['mean_priority']:>10.2f} "
+                  f"{result['solve_seconds']:>10.3f}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'scheduling', 'seed': args.seed, 'results': results},
+                      f, indent=2, ensure_ascii=False)
+        print(f"结果已写入 {args.output}")
+
+if __name__ == '__main__':
+    main()
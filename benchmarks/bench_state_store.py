@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+共享状态存储多进程基准测试
+Multi-process State Store Benchmark
+
+模拟预派生的多个API工作进程：每个进程持有自己的 TMSSystem，通过同一个
+SQLite（WAL）状态存储共享状态，按给定的读写比例执行操作。
+读操作 = 同步其他进程的修改 + 查询系统状态和设备快照；
+写操作 = 创建内转任务 -> 分配最近的空闲车头 -> 执行（乐观并发，冲突时重试或放弃）。
+输出不同进程数下的总吞吐量和相对单进程的加速比，并在结束后校验库存守恒和设备状态。
+
+用法:
+    python benchmarks/bench_state_store.py
+    python benchmarks/bench_state_store.py --workers 1 2 4 8 --ops 5000 --write-ratio 0.2
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tms_system import TMSSystem, TaskType, EquipmentStatus, ProductWarehouse
+from tms_state_store import SQLiteStateStore
+from tms_workload import WorkloadConfig, generate_workload
+
+def populate(state_path: str, db_path: str, config: WorkloadConfig):
+    """把场景的主数据和初始库存写入共享状态存储"""
+    tms = TMSSystem(grid_size=config.grid_size, db_path=db_path,
+                    state_store=SQLiteStateStore(state_path))
+    try:
+        with tms.state_transaction():
+            generate_workload(config).populate(tms)
+    finally:
+        tms.shutdown()
+
+def worker(index: int, state_path: str, db_dir: str, config: WorkloadConfig, ops: int,
+           write_ratio: float, start_event, results):
+    logging.disable(logging.WARNING)
+    tms = TMSSystem(grid_size=config.grid_size, db_path=os.path.join(db_dir, f"worker{index}.db"),
+                    state_store=SQLiteStateStore(state_path))
+    rng = random.Random(config.seed * 1000 + index)
+    sources = [w.id for w in tms.warehouses.values() if isinstance(w, ProductWarehouse)]
+    targets = list(tms.warehouses)
+    equipment_ids = list(tms.equipment)
+    counts = {'reads': 0, 'writes': 0, 'executed': 0, 'no_equipment': 0}
+    
+    start_event.wait()
+    begin = time.perf_counter()
+    for _ in range(ops):
+        if rng.random() >= write_ratio:
+            tms.sync_state()
+            tms.get_system_status()
+            tms.equipment[rng.choice(equipment_ids)].snapshot()
+            counts['reads'] += 1
+            continue
+        
+        counts['writes'] += 1
+        source = tms.warehouses[rng.choice(sources)]
+        target_id = rng.choice([w for w in targets if w != source.id])
+        stock = list(source.products)
+        products = {rng.choice(stock): 1} if stock else {}
+        task = tms.create_internal_transfer_task(source.id, target_id, products)
+        equipment = tms.equipment_index.nearest(TaskType.INTERNAL_TRANSFER, source.position)
+        if equipment is None or not tms.assign_equipment_to_task(task.id, equipment.id):
+            counts['no_equipment'] += 1
+            continue
+        counts['executed'] += tms.execute_task(task.id)
+    elapsed = time.perf_counter() - begin
+    
+    results.put(dict(counts, index=index, elapsed=elapsed, sync=tms.state_sync.summary()))
+    tms.shutdown()
+
+def run(workers: int, config: WorkloadConfig, ops: int, write_ratio: float) -> dict:
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        state_path = os.path.join(tmp_dir, "state.db")
+        populate(state_path, os.path.join(tmp_dir, "setup.db"), config)
+        
+        start_event = context.Event()
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(i, state_path, tmp_dir, config, ops,
+                                                 write_ratio, start_event, results))
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        # 等待各进程完成初始同步后同时开始计时
+        time.sleep(0.5 + 0.2 * workers)
+        start_event.set()
+        reports = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        
+        check = verify(state_path, os.path.join(tmp_dir, "verify.db"), config)
+    
+    wall = max(report['elapsed'] for report in reports)
+    total_ops = sum(report['reads'] + report['writes'] for report in reports)
+    return {
+        'workers': workers,
+        'total_ops': total_ops,
+        'wall_seconds': wall,
+        'ops_per_second': total_ops / wall if wall > 0 else None,
+        'executed_tasks': sum(report['executed'] for report in reports),
+        'conflicts': sum(report['sync']['conflicts'] for report in reports),
+        'no_equipment': sum(report['no_equipment'] for report in reports),
+        'check': check
+    }
+
+def verify(state_path: str, db_path: str, config: WorkloadConfig) -> dict:
+    """从存储重新加载全部状态，校验库存守恒、设备全部空闲以及计数器一致"""
+    tms = TMSSystem(grid_size=config.grid_size, db_path=db_path,
+                    state_store=SQLiteStateStore(state_path))
+    try:
+        expected = {}
+        for stock in generate_workload(config).inventory.values():
+            for product_id, quantity in stock.items():
+                expected[product_id] = expected.get(product_id, 0) + quantity
+        actual = {}
+        for warehouse in tms.warehouses.values():
+            for product_id, quantity in warehouse.products.items():
+                actual[product_id] = actual.get(product_id, 0) + quantity
+        return {
+            'inventory_conserved': actual == expected,
+            'busy_equipment': sum(1 for e in tms.equipment.values() if e.status != EquipmentStatus.IDLE),
+            'counter_mismatches': len(tms.verify_status_counters())
+        }
+    finally:
+        tms.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description="共享状态存储多进程基准测试")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="要测试的进程数")
+    parser.add_argument('--ops', type=int, default=2000, help="每个进程执行的操作数")
+    parser.add_argument('--write-ratio', type=float, default=0.1, help="写操作的比例")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="将结果写入JSON文件")
+    args = parser.parse_args()
+    
+    logging.disable(logging.WARNING)
+    config = WorkloadConfig(seed=args.seed, grid_size=(100, 100), products=50, warehouses=10,
+                            equipment=40, ship_plans=50)
+    
+    results = []
+    baseline = None
+    print(f"{'进程数':>6} {'操作/秒':>10} {'加速比':>8} {'执行任务':>8} {'冲突':>6} {'校验':>6}")
+    for workers in args.workers:
+        result = run(workers, config, args.ops, args.write_ratio)
+        baseline = baseline or result['ops_per_second']
+        result['speedup'] = result['ops_per_second'] / baseline
+        results.append(result)
+        check = result['check']
+        ok = check['inventory_conserved'] and not check['busy_equipment'] and not check['counter_mismatches']
+        print(f"{workers:>6} {result['ops_per_second']:>10.0f} {result['speedup']:>8.2f} "
+              f"{result['executed_tasks']:>8} {result['conflicts']:>6} {'通过' if ok else '失败':>6}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'benchmark': 'state_store', 'cpu_count': os.cpu_count(),
+                       'write_ratio': args.write_ratio, 'results': results}, f, indent=2, ensure_ascii=False)
+        print(f"结果已写入 {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+大规模负载基准测试
+Workload Benchmark
+
+用 tms_workload 生成可复现的场景，按到达时刻分批驱动 create_ship_transport_task、
+optimize_task_schedule、execute_task 和 a_star_path，记录各操作的吞吐量、p50/p99延迟，
+并在单独的一轮中用 tracemalloc 测量峰值内存（tracemalloc 会拖慢计时，因此不与计时同轮）。
+结果写入JSON文件，便于在不同版本之间比较。
+
+用法:
+    python benchmarks/bench_workload.py
+    python benchmarks/bench_workload.py --scales small medium --output results.json
+    python benchmarks/bench_workload.py --scales large --skip-memory
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tms_system import TMSSystem
+from tms_workload import WorkloadConfig, generate_workload
+
+# 预设规模：产品数、仓库数、设备数、船运计划数、每小时到达数
+SCALES = {
+    'small': dict(products=50, warehouses=10, equipment=20, ship_plans=200, arrival_rate=60.0),
+    'medium': dict(products=500, warehouses=50, equipment=200, ship_plans=2000, arrival_rate=400.0),
+    'large': dict(products=2000, warehouses=200, equipment=1000, ship_plans=10000, arrival_rate=2000.0)
+}
+
+OPERATIONS = ('create_ship_transport_task', 'optimize_task_schedule', 'execute_task', 'a_star_path')
+
+def latency_summary(samples) -> dict:
+    """吞吐量（次/秒）和延迟分位数（毫秒）"""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    total = sum(ordered)
+    
+    def percentile(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000
+    
+    return {
+        'count': len(ordered),
+        'total_seconds': total,
+        'throughput_per_second': len(ordered) / total if total > 0 else None,
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99),
+        'max_ms': ordered[-1] * 1000
+    }
+
+def run_scenario(config: WorkloadConfig, tick_seconds: float, mode: str, path_queries: int) -> dict:
+    """生成场景并按批驱动系统，返回每个操作的耗时样本和汇总计数"""
+    workload = generate_workload(config)
+    samples = {operation: [] for operation in OPERATIONS}
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tms = TMSSystem(grid_size=config.grid_size, db_path=os.path.join(tmp_dir, "bench.db"),
+                        write_behind=True)
+        try:
+            scenario_start = time.perf_counter()
+            workload.populate(tms)
+            
+            # 每个批次：创建本批到达的船运任务 -> 调度 -> 执行已分配的任务；
+            # 全部到达后继续调度，直到没有任务可以分配
+            executed = failed = 0
+            arrivals = workload.arrivals
+            index = 0
+            tick_end = tick_seconds
+            while True:
+                while index < len(arrivals) and arrivals[index][0] <= tick_end:
+                    begin = time.perf_counter()
+                    tms.create_ship_transport_task(arrivals[index][1])
+                    samples['create_ship_transport_task'].append(time.perf_counter() - begin)
+                    index += 1
+                
+                begin = time.perf_counter()
+                schedule = tms.optimize_task_schedule(mode=mode)
+                samples['optimize_task_schedule'].append(time.perf_counter() - begin)
+                
+                for task_id in schedule:
+                    begin = time.perf_counter()
+                    success = tms.execute_task(task_id)
+                    samples['execute_task'].append(time.perf_counter() - begin)
+                    executed += success
+                    failed += not success
+                if index >= len(arrivals) and not schedule:
+                    break
+                tick_end += tick_seconds
+            
+            # 仓库之间的路径查询（路径缓存按系统默认配置生效）
+            rng = random.Random(config.seed + 1)
+            positions = [warehouse.position for warehouse in workload.warehouses]
+            for _ in range(path_queries):
+                start, goal = rng.sample(positions, 2)
+                begin = time.perf_counter()
+                tms.path_planner.a_star_path(start, goal)
+                samples['a_star_path'].append(time.perf_counter() - begin)
+            
+            elapsed = time.perf_counter() - scenario_start
+            return {
+                'samples': samples,
+                'executed_tasks': executed,
+                'failed_tasks': failed,
+                'pending_tasks': len(tms.tasks) - executed - failed,
+                'scenario_seconds': elapsed,
+                'path_cache': tms.path_planner.path_cache_stats()
+            }
+        finally:
+            tms.shutdown()
+
+def measure_peak_memory(config: WorkloadConfig, tick_seconds: float, mode: str, path_queries: int) -> float:
+    """在 tracemalloc 下完整运行一次场景，返回Python对象分配的峰值（MB）"""
+    tracemalloc.start()
+    try:
+        run_scenario(config, tick_seconds, mode, path_queries)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+def git_revision() -> str:
+    """当前代码版本（不在git仓库中时返回unknown）"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def main():
+    parser = argparse.ArgumentParser(description="大规模负载基准测试")
+    parser.add_argument('--scales', nargs='+', default=['small', 'medium'], choices=sorted(SCALES),
+                        help="要运行的规模")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--grid', type=int, nargs=2, default=[200, 200], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--tick', type=float, default=900.0, help="每批处理的到达时间跨度（秒）")
+    parser.add_argument('--mode', default='greedy', choices=TMSSystem.SCHEDULE_MODES, help="调度模式")
+    parser.add_argument('--path-queries', type=int, default=500, help="仓库之间的路径查询次数")
+    parser.add_argument('--skip-memory', action='store_true', help="不测量峰值内存")
+    parser.add_argument('--output', help="将结果写入JSON文件")
+    args = parser.parse_args()
+    
+    logging.disable(logging.INFO)
+    
+    results = []
+    for scale in args.scales:
+        config = WorkloadConfig(seed=args.seed, grid_size=tuple(args.grid), **SCALES[scale])
+        run = run_scenario(config, args.tick, args.mode, args.path_queries)
+        operations = {operation: latency_summary(samples) for operation, samples in run['samples'].items()}
+        result = {
+            'scale': scale,
+            'workload': config.to_dict(),
+            'operations': operations,
+            'executed_tasks': run['executed_tasks'],
+            'failed_tasks': run['failed_tasks'],
+            'pending_tasks': run['pending_tasks'],
+            'scenario_seconds': run['scenario_seconds'],
+            'tasks_per_second': run['executed_tasks'] / run['scenario_seconds'],
+            'path_cache': run['path_cache'],
+            'peak_memory_mb': None if args.skip_memory else measure_peak_memory(
+                config, args.tick, args.mode, args.path_queries)
+        }
+        results.append(result)
+        
+        print(f"\n== {scale}: {config.products} 产品 / {config.warehouses} 仓库 / "
+              f"{config.equipment} 设备 / {config.ship_plans} 船运计划")
+        print(f"{'操作':<28} {'次数':>8} {'次/秒':>10} {'p50(ms)':>10} {'p99(ms)':>10}")
+        for operation, summary in operations.items():
+            if summary['count']:
+                print(f"{operation:<28} {summary['count']:>8} {summary['throughput_per_second']:>10.1f} "
+                      f"{summary['p50_ms']:>10.3f} {summary['p99_ms']:>10.3f}")
+        memory = f"{result['peak_memory_mb']:.1f} MB" if result['peak_memory_mb'] is not None else "未测量"
+        print(f"执行任务 {result['executed_tasks']} 个，{result['tasks_per_second']:.1f} 个/秒，峰值内存 {memory}")
+    
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'benchmark': 'workload',
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'timestamp': datetime.now().isoformat(),
+                'seed': args.seed,
+                'mode': args.mode,
+                'tick_seconds': args.tick,
+                'results': results
+            }, f, indent=2, ensure_ascii=False)
+        print(f"结果已写入 {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Flask接口的测试：使用测试客户端调用接口，系统实例使用内存数据库
+"""
+
+import pytest
+
+import tms_api
+from tms_system import TMSSystem, Product, ProductWarehouse, TerminalWarehouse, FrameTruck, Position
+
+
+@pytest.fixture
+def tms(monkeypatch):
+    system = TMSSystem(db_path=':memory:')
+    monkeypatch.setitem(vars(tms_api), 'tms_system', system)
+    yield system
+    system.shutdown()
+
+
+def move(client, equipment_id, x, y):
+    return client.post(f'/api/equipment/{equipment_id}/move', json={'target_x': x, 'target_y': y})
+
+
+def test_move_equipment_plans_from_its_own_cell(tms):
+    tms.add_equipment(FrameTruck("F1", "车头1", Position(3, 3)))
+    client = tms_api.app.test_client()
+    
+    response = move(client, "F1", 8, 5)
+    
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['path'][0] == {'x': 3, 'y': 3}
+    assert data['path'][-1] == {'x': 8, 'y': 5}
+    assert data['path_cost'] == 7
+    assert tms.equipment["F1"].position == Position(8, 5)
+    assert tms.path_planner.grid[5, 8] == 1
+    assert tms.path_planner.grid[3, 3] == 0
+
+
+def test_repeated_move_hits_path_cache(tms):
+    tms.add_equipment(FrameTruck("F1", "车头1", Position(3, 3)))
+    client = tms_api.app.test_client()
+    
+    assert move(client, "F1", 8, 5).status_code == 200
+    assert move(client, "F1", 3, 3).status_code == 200
+    hits = tms.path_planner.path_cache_stats()['hits']
+    
+    assert move(client, "F1", 8, 5).status_code == 200
+    assert tms.path_planner.path_cache_stats()['hits'] == hits + 1
+
+
+def test_move_equipment_onto_occupied_cell_is_rejected(tms):
+    tms.add_equipment(FrameTruck("F1", "车头1", Position(3, 3)))
+    tms.add_equipment(FrameTruck("F2", "车头2", Position(8, 5)))
+    client = tms_api.app.test_client()
+    
+    response = move(client, "F1", 8, 5)
+    
+    assert response.status_code == 400
+    assert tms.equipment["F1"].position == Position(3, 3)
+
+
+def test_list_without_limit_returns_everything(tms):
+    for i in range(150):
+        tms.add_product(Product(f"P{i:03d}", f"产品{i}", 1.0, 1.0, "金属", 10.0))
+    client = tms_api.app.test_client()
+    
+    body = client.get('/api/products').get_json()
+    assert body['count'] == 150 and body['next_cursor'] is None
+    assert list(body['data']) == [f"P{i:03d}" for i in range(150)]
+    
+    first = client.get('/api/products?limit=100').get_json()
+    assert first['count'] == 100
+    second = client.get(f"/api/products?cursor={first['next_cursor']}").get_json()
+    assert second['count'] == 50 and second['next_cursor'] is None
+    assert list(first['data']) + list(second['data']) == list(body['data'])
+
+
+def test_task_list_without_limit_returns_everything(tms):
+    tms.add_warehouse(TerminalWarehouse("TW001", "末端库1", Position(1, 1), 1000.0))
+    tms.add_warehouse(ProductWarehouse("PW001", "成品库1", Position(8, 8), 1000.0))
+    for _ in range(120):
+        tms.create_internal_transfer_task("TW001", "PW001", {"P001": 1})
+    client = tms_api.app.test_client()
+    
+    body = client.get('/api/tasks').get_json()
+    assert body['count'] == 120 and body['next_cursor'] is None
+    assert client.get('/api/tasks?limit=100').get_json()['next_cursor'] is not None
@@ -0,0 +1,77 @@
+"""
+ASGI接口的测试：直接按ASGI协议调用应用，不需要启动服务器
+"""
+
+import asyncio
+import json
+
+import pytest
+
+import tms_api
+import tms_asgi
+from tms_system import TMSSystem
+
+
+async def call(app, method, path, query=b'', payload=None):
+    """发送一个请求，返回 (状态码, 响应头, 响应体)"""
+    body = json.dumps(payload).encode() if payload is not None else b''
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    never = asyncio.Event()
+    
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await never.wait()
+    
+    sent = []
+    
+    async def send(message):
+        sent.append(message)
+    
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+             'headers': [(b'content-type', b'application/json')]}
+    await app(scope, receive, send)
+    headers = {name.decode(): value.decode() for name, value in sent[0]['headers']}
+    return sent[0]['status'], headers, b''.join(message.get('body', b'') for message in sent[1:])
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # 重置接口用默认路径创建新实例，数据库文件写到临时目录
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(vars(tms_api), 'tms_system', TMSSystem(db_path=':memory:'))
+    application = tms_asgi.create_app(max_workers=4)
+    yield application
+    application._stop()
+    vars(tms_api)['tms_system'].shutdown()
+
+
+def test_import_does_not_create_system():
+    assert isinstance(tms_asgi.app, tms_asgi.TMSAsgiApp)
+    assert tms_asgi.app._listening is None
+
+
+def test_watch_wakes_after_reset(app):
+    async def scenario():
+        since = tms_api.get_tms_system().change_version
+        watch = asyncio.ensure_future(call(app, 'GET', tms_asgi.TMSAsgiApp.WATCH_PATH,
+                                           f'since={since}&timeout=2'.encode()))
+        await asyncio.sleep(0.05)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        status, _, _ = await call(app, 'POST', '/api/system/reset')
+        assert status == 200
+        status, _, _ = await call(app, 'POST', '/api/products',
+                                  payload={'name': '钢板', 'weight': 2.0, 'volume': 1.0})
+        assert status in (200, 201)
+        status, headers, body = await watch
+        return since, loop.time() - start, status, headers, json.loads(body)
+    
+    since, elapsed, status, headers, body = asyncio.run(scenario())
+    
+    assert status == 200
+    assert elapsed < 1.0
+    assert int(headers[tms_asgi.TMSAsgiApp.VERSION_HEADER.lower()]) > since
+    # 长轮询改为监听重置之后的新实例
+    assert app.tms is tms_api.get_tms_system()
+    assert app.tms.change_listeners == [app._on_state_changed]
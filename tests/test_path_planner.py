@@ -0,0 +1,183 @@
+"""
+路径规划的测试：各种搜索算法在随机网格上的路径代价与参考Dijkstra一致
+"""
+
+import heapq
+import math
+import random
+
+import pytest
+
+from tms_system import PathPlanner, Position, RouteTable
+
+
+def random_planner(rng, size, obstacle_ratio=0.25):
+    planner = PathPlanner((size, size))
+    for x in range(size):
+        for y in range(size):
+            if rng.random() < obstacle_ratio:
+                planner.add_obstacle(Position(x, y))
+    return planner
+
+
+def free_cells(planner):
+    return [Position(x, y) for y in range(planner.grid_height) for x in range(planner.grid_width)
+            if not planner.grid[y, x]]
+
+
+def reference_cost(planner, start, goal):
+    """按 step_cost 在全部相邻格子上做Dijkstra，不可达时返回None"""
+    start_cell, goal_cell = planner.encode(start), planner.encode(goal)
+    distances = {start_cell: 0}
+    heap = [(0, start_cell)]
+    while heap:
+        distance, cell = heapq.heappop(heap)
+        if cell == goal_cell:
+            return distance
+        if distance > distances[cell]:
+            continue
+        for neighbor in planner.get_neighbors(planner.decode(cell)):
+            neighbor_cell = planner.encode(neighbor)
+            candidate = distance + planner.step_cost(cell, neighbor_cell)
+            if candidate < distances.get(neighbor_cell, math.inf):
+                distances[neighbor_cell] = candidate
+                heapq.heappush(heap, (candidate, neighbor_cell))
+    return None
+
+
+def assert_valid_path(planner, path, start, goal):
+    assert path[0] == start and path[-1] == goal
+    assert all(planner.step_cost(planner.encode(a), planner.encode(b)) < math.inf
+               for a, b in zip(path, path[1:]))
+
+
+def assert_matches_reference(planner, rng, queries=20, algorithm="astar"):
+    cells = free_cells(planner)
+    for _ in range(queries):
+        start, goal = rng.sample(cells, 2)
+        path = planner.a_star_path(start, goal, algorithm=algorithm)
+        expected = reference_cost(planner, start, goal)
+        if expected is None:
+            assert path == []
+        else:
+            assert_valid_path(planner, path, start, goal)
+            assert planner.path_cost(path) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_astar_matches_reference(seed):
+    rng = random.Random(seed)
+    assert_matches_reference(random_planner(rng, 20), rng)
+
+
+def test_cached_path_follows_obstacle_changes():
+    rng = random.Random(0)
+    planner = random_planner(rng, 15)
+    cells = free_cells(planner)
+    queries = [tuple(rng.sample(cells, 2)) for _ in range(15)]
+    for _ in range(20):
+        cell = rng.choice(cells)
+        if planner.grid[cell.y, cell.x]:
+            planner.remove_obstacle(cell)
+        else:
+            planner.add_obstacle(cell)
+        for start, goal in queries:
+            path = planner.a_star_path(start, goal)
+            if planner.is_blocked(start) or planner.is_blocked(goal):
+                assert path == []
+                continue
+            expected = reference_cost(planner, start, goal)
+            assert (planner.path_cost(path) if path else None) == expected
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_alt_bounds_keep_costs_optimal(seed):
+    rng = random.Random(seed)
+    planner = random_planner(rng, 20)
+    route_table = RouteTable(planner)
+    landmarks = {f"L{i}": cell for i, cell in enumerate(rng.sample(free_cells(planner), 4))}
+    for name, cell in landmarks.items():
+        route_table.add_landmark(name, cell)
+    route_table.refresh()
+    for _ in range(5):
+        # 障碍物变化使部分距离场过期，只刷新其中一部分，过期的距离场不能给出错误的下界
+        cell = rng.choice(free_cells(planner))
+        if cell not in landmarks.values():
+            planner.add_obstacle(cell)
+        planner.remove_obstacle(Position(*rng.choice(sorted(planner.obstacles))))
+        route_table.refresh(rng.sample(list(landmarks), 2))
+        assert_matches_reference(planner, rng, queries=10)
+    
+    for a, b in [rng.sample(list(landmarks), 2) for _ in range(5)]:
+        assert route_table.distance(a, b) == reference_cost(planner, landmarks[a], landmarks[b])
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_jps_matches_astar_cost(seed):
+    rng = random.Random(seed)
+    planner = random_planner(rng, 25, obstacle_ratio=rng.choice([0.1, 0.25, 0.35]))
+    cells = free_cells(planner)
+    for _ in range(20):
+        # 两种算法共用路径缓存，直接调用搜索函数才能比较各自的结果
+        start, goal = rng.sample(cells, 2)
+        jps_path = planner._jps_cells(planner.encode(start), planner.encode(goal))
+        astar_path = planner._search_cells(planner.encode(start), planner.encode(goal))
+        assert len(jps_path) == len(astar_path)
+    assert_matches_reference(planner, rng, algorithm="jps")
+
+
+def random_terrain(rng, size, connectivity):
+    planner = PathPlanner((size, size), connectivity=connectivity)
+    for x in range(size):
+        for y in range(size):
+            roll = rng.random()
+            if roll < 0.15:
+                planner.add_obstacle(Position(x, y))
+            elif roll < 0.35:
+                planner.set_cell_cost(Position(x, y), rng.randint(2, 9))
+            elif roll < 0.45:
+                planner.set_one_way(Position(x, y), rng.choice(PathPlanner.DIRECTIONS))
+    return planner
+
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+@pytest.mark.parametrize('seed', range(8))
+def test_weighted_search_matches_reference(seed, connectivity):
+    rng = random.Random(seed)
+    planner = random_terrain(rng, 18, connectivity)
+    assert not planner.is_uniform
+    assert_matches_reference(planner, random.Random(seed))
+    
+    # 代价变化后重复同样的查询，缓存中的路径也要保持最优
+    for _ in range(10):
+        cell = rng.choice(free_cells(planner))
+        planner.set_cell_cost(cell, rng.randint(1, 9))
+    assert_matches_reference(planner, random.Random(seed))
+
+
+@pytest.mark.parametrize('algorithm', PathPlanner.ALGORITHMS)
+@pytest.mark.parametrize('weighted', [False, True])
+def test_parallel_plan_many_matches_serial(monkeypatch, algorithm, weighted):
+    rng = random.Random(7)
+    planner = random_terrain(rng, 20, 4) if weighted else random_planner(rng, 20)
+    serial = planner.copy()
+    cells = free_cells(planner)
+    requests = [tuple(rng.sample(cells, 2)) for _ in range(40)]
+    requests += [(cells[0], Position(*next(iter(planner.obstacles))))]
+    
+    monkeypatch.setattr(PathPlanner, 'PARALLEL_MIN_BATCH', 8)
+    try:
+        parallel_paths = planner.plan_many(requests, algorithm=algorithm, max_workers=2)
+        assert planner._pool is not None
+    finally:
+        planner.close_pool()
+    serial_paths = serial.plan_many(requests, algorithm=algorithm, max_workers=1)
+    
+    assert parallel_paths[-1] == []
+    assert [planner.path_cost(path) for path in parallel_paths] == \
+        [serial.path_cost(path) for path in serial_paths]
+    # 并行结果写回了缓存
+    hits = planner.path_cache_stats()['hits']
+    assert planner.plan_many(requests, algorithm=algorithm, max_workers=1) == parallel_paths
+    distinct = {(planner.encode(start), planner.encode(goal)) for start, goal in requests[:-1]}
+    assert planner.path_cache_stats()['hits'] == hits + len(distinct)
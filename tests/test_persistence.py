@@ -0,0 +1,118 @@
+"""
+数据库持久化的测试：修改状态、关闭系统，再从同一个数据库恢复
+"""
+
+import random
+import sqlite3
+
+import pytest
+
+from tms_system import (
+    TMSSystem, Product, ProductWarehouse, TerminalWarehouse, FrameTruck, Position,
+    EquipmentStatus, TaskStatus
+)
+
+
+@pytest.mark.parametrize('write_behind', [False, True])
+def test_equipment_moves_and_status_survive_restart(tmp_path, write_behind):
+    db_path = str(tmp_path / "tms.db")
+    tms = TMSSystem(db_path=db_path, write_behind=write_behind)
+    tms.add_equipment(FrameTruck("F1", "车头1", Position(3, 3)))
+    truck = tms.equipment["F1"]
+    assert truck.move_to(Position(10, 10))
+    truck.status = EquipmentStatus.MAINTENANCE
+    tms.shutdown()
+    
+    restored = TMSSystem(db_path=db_path, load_from_db=True)
+    truck = restored.equipment["F1"]
+    
+    assert truck.position == Position(10, 10)
+    assert truck.status == EquipmentStatus.MAINTENANCE
+    assert restored.path_planner.grid[10, 10] == 1
+    assert restored.path_planner.grid[3, 3] == 0
+    restored.shutdown()
+
+
+def transfer_system(db_path, **kwargs):
+    tms = TMSSystem(db_path=db_path, **kwargs)
+    tms.add_product(Product("P001", "钢板", 2.0, 1.0, "金属", 100.0))
+    tms.add_warehouse(TerminalWarehouse("TW001", "末端库1", Position(1, 1), 1000.0))
+    tms.add_warehouse(ProductWarehouse("PW001", "成品库1", Position(8, 8), 1000.0))
+    tms.warehouses["TW001"].add_product("P001", 100, 1.0)
+    return tms
+
+
+def stored_task_status(db_path, task_id):
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute("SELECT status FROM tasks WHERE id = ?", (task_id,)).fetchone()
+    return row[0] if row else None
+
+
+def test_write_behind_coalesces_task_writes_until_flush(tmp_path):
+    db_path = str(tmp_path / "tms.db")
+    # 刷新间隔足够长，后台线程在测试期间不会自行落盘
+    tms = transfer_system(db_path, write_behind=True, flush_interval=60)
+    task = tms.create_internal_transfer_task("TW001", "PW001", {"P001": 10})
+    assert tms.execute_task(task.id)
+    
+    assert stored_task_status(db_path, task.id) is None
+    assert tms.db_manager.write_queue.stats['coalesced'] > 0
+    
+    tms.flush()
+    assert stored_task_status(db_path, task.id) == TaskStatus.COMPLETED.value
+    assert len(tms.db_manager.write_queue) == 0
+    tms.shutdown()
+
+
+def test_shutdown_drains_write_behind_queue(tmp_path):
+    db_path = str(tmp_path / "tms.db")
+    tms = transfer_system(db_path, write_behind=True, flush_interval=60)
+    task = tms.create_internal_transfer_task("TW001", "PW001", {"P001": 10})
+    assert tms.execute_task(task.id)
+    tms.shutdown()
+    
+    restored = TMSSystem(db_path=db_path, load_from_db=True)
+    assert restored.tasks[task.id].status == TaskStatus.COMPLETED
+    assert restored.warehouses["TW001"].products["P001"] == 90
+    assert restored.warehouses["PW001"].products["P001"] == 10
+    restored.shutdown()
+
+
+def stored_inventory(db_path):
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT warehouse_id, product_id, quantity, last_updated FROM inventory")
+        return {(warehouse_id, product_id): (quantity, last_updated)
+                for warehouse_id, product_id, quantity, last_updated in rows}
+
+
+@pytest.mark.parametrize('write_behind', [False, True])
+def test_inventory_table_follows_stock_changes(tmp_path, write_behind):
+    db_path = str(tmp_path / "tms.db")
+    tms = transfer_system(db_path, write_behind=write_behind, flush_interval=60)
+    warehouse = tms.warehouses["TW001"]
+    rng = random.Random(0)
+    for _ in range(200):
+        product_id = rng.choice(["P001", "P002", "P003"])
+        if rng.random() < 0.5:
+            warehouse.add_product(product_id, rng.randint(1, 5))
+        else:
+            stock = warehouse.products.get(product_id, 0)
+            warehouse.remove_product(product_id, min(stock, rng.randint(1, 5)))
+    tms.flush()
+    
+    inventory = stored_inventory(db_path)
+    assert {key: quantity for key, (quantity, _) in inventory.items()} == \
+        {("TW001", product_id): quantity for product_id, quantity in warehouse.products.items()}
+    with sqlite3.connect(db_path) as conn:
+        volume, = conn.execute("SELECT current_volume FROM warehouses WHERE id = 'TW001'").fetchone()
+    assert volume == pytest.approx(warehouse.current_volume)
+    
+    # 只更新变化的产品行，其他行保持不变
+    changed = next(iter(warehouse.products))
+    warehouse.add_product(changed, 1)
+    tms.flush()
+    after = stored_inventory(db_path)
+    assert after[("TW001", changed)][0] == inventory[("TW001", changed)][0] + 1
+    assert {key: row for key, row in after.items() if key[1] != changed} == \
+        {key: row for key, row in inventory.items() if key[1] != changed}
+    tms.shutdown()
@@ -0,0 +1,63 @@
+"""
+增量重规划的测试：D* Lite 修复后的路径代价与重新规划的最短路径代价一致
+"""
+
+import random
+
+import pytest
+
+from tms_replanning import IncrementalReplanner
+from tms_system import PathPlanner, Position
+
+
+def random_planner(rng, size, connectivity):
+    planner = PathPlanner((size, size), connectivity=connectivity)
+    for x in range(size):
+        for y in range(size):
+            roll = rng.random()
+            if roll < 0.2:
+                planner.add_obstacle(Position(x, y))
+            elif roll < 0.4:
+                planner.set_cell_cost(Position(x, y), rng.randint(2, 5))
+    return planner
+
+
+def free_cells(planner):
+    return [Position(x, y) for y in range(planner.grid_height) for x in range(planner.grid_width)
+            if not planner.grid[y, x]]
+
+
+@pytest.mark.parametrize('connectivity', [4, 8])
+@pytest.mark.parametrize('seed', range(60))
+def test_incremental_cost_matches_fresh_search(seed, connectivity):
+    rng = random.Random(seed)
+    planner = random_planner(rng, 15, connectivity)
+    replanner = IncrementalReplanner(planner)
+    cells = free_cells(planner)
+    start, goal = rng.sample(cells, 2)
+    path = replanner.open_route('R', start, goal)
+    position = start
+    
+    for _ in range(8):
+        op = rng.choice(('along', 'jump', 'block', 'open'))
+        if op == 'along' and len(path) > 1:
+            position = path[rng.randint(1, len(path) - 1)]
+        elif op == 'jump':
+            # 偏离当前路径到任意格子，期间没有障碍物变化
+            position = rng.choice(free_cells(planner))
+        elif op == 'block':
+            cell = rng.choice(free_cells(planner))
+            if cell not in (position, goal):
+                planner.add_obstacle(cell)
+        elif op == 'open':
+            blocked = [Position(x, y) for x, y in planner.obstacles]
+            if blocked:
+                planner.remove_obstacle(rng.choice(blocked))
+        path = replanner.advance('R', position)
+        
+        expected = planner.travel_cost(position, goal)
+        if expected is None:
+            assert path == []
+        else:
+            assert path[0] == position and path[-1] == goal
+            assert planner.path_cost(path) == pytest.approx(expected)
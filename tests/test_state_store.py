@@ -0,0 +1,143 @@
+"""
+多进程共享状态的测试：两个 TMSSystem 共享同一个 InMemoryStateStore，
+行为与两个工作进程共享SQLite状态存储相同
+"""
+
+import threading
+
+import pytest
+
+import tms_api
+from tms_state_store import InMemoryStateStore
+from tms_system import (
+    TMSSystem, Product, ProductWarehouse, TerminalWarehouse, FrameTruck, Position,
+    TaskStatus, EquipmentStatus, VersionConflict
+)
+
+
+@pytest.fixture
+def systems():
+    store = InMemoryStateStore()
+    a = TMSSystem(db_path=":memory:", state_store=store)
+    b = TMSSystem(db_path=":memory:", state_store=store)
+    a.add_product(Product("P001", "钢板", 2.0, 1.0, "金属", 100.0))
+    a.add_warehouse(TerminalWarehouse("TW001", "末端库1", Position(1, 1), 1000.0))
+    a.add_warehouse(ProductWarehouse("PW001", "成品库1", Position(8, 8), 1000.0))
+    a.add_equipment(FrameTruck("F001", "车头1", Position(3, 3)))
+    with a.state_transaction():
+        a.warehouses["TW001"].add_product("P001", 100, 1.0)
+    b.sync_state()
+    yield a, b
+    a.shutdown()
+    b.shutdown()
+
+
+def skip_syncs(tms, count=1):
+    """让接下来的 count 次同步不拉取其他进程的修改，模拟同步之后、提交之前其他进程提交了修改"""
+    sync = tms.state_sync.sync
+    calls = []
+    
+    def stale_sync():
+        if len(calls) < count:
+            calls.append(None)
+            return 0
+        return sync()
+    
+    tms.state_sync.sync = stale_sync
+
+
+def test_conflicting_commit_is_rolled_back(systems):
+    a, b = systems
+    
+    with pytest.raises(VersionConflict):
+        with b.state_transaction():
+            b.equipment["F001"].move_to(Position(5, 5))
+            with a.state_transaction():
+                a.equipment["F001"].move_to(Position(6, 6))
+    
+    # b 的本地修改被撤销，设备和规划网格中的障碍都回到 a 提交的位置
+    assert b.equipment["F001"].position == Position(6, 6)
+    assert b.path_planner.grid[6, 6] == 1
+    assert b.path_planner.grid[5, 5] == 0
+    assert b.path_planner.grid[3, 3] == 0
+    assert b.state_sync.stats['conflicts'] == 1
+
+
+def test_api_returns_409_on_conflict(systems, monkeypatch):
+    a, b = systems
+    # 直接替换模块字典中的实例，避免 getattr 触发按需创建默认的系统
+    monkeypatch.setitem(vars(tms_api), 'tms_system', b)
+    with a.state_transaction():
+        a.warehouses["TW001"].add_product("P001", 5, 1.0)
+    # 请求开始时和事务开始时各同步一次
+    skip_syncs(b, 2)
+    
+    response = tms_api.app.test_client().post(
+        '/api/warehouses/TW001/inventory', json={'product_id': 'P001', 'quantity': 10})
+    
+    assert response.status_code == 409
+    # 本地库存回滚为 a 提交的版本，重试的请求成功
+    assert b.warehouses["TW001"].products["P001"] == 105
+    response = tms_api.app.test_client().post(
+        '/api/warehouses/TW001/inventory', json={'product_id': 'P001', 'quantity': 10})
+    assert response.status_code == 200
+    a.sync_state()
+    assert a.warehouses["TW001"].products["P001"] == 115
+
+
+def test_execute_task_retries_after_conflict(systems):
+    a, b = systems
+    task = b.create_internal_transfer_task("TW001", "PW001", {"P001": 10})
+    assert b.assign_equipment_to_task(task.id, "F001")
+    with a.state_transaction():
+        a.sync_state()
+        a.warehouses["TW001"].add_product("P001", 5, 1.0)
+    skip_syncs(b)
+    
+    assert b.execute_task(task.id)
+    
+    assert b.state_sync.stats['conflicts'] == 1
+    assert b.tasks[task.id].status == TaskStatus.COMPLETED
+    a.sync_state()
+    assert a.warehouses["TW001"].products["P001"] == 95
+    assert a.warehouses["PW001"].products["P001"] == 10
+    assert a.equipment["F001"].status == EquipmentStatus.IDLE
+
+
+def test_change_outside_transaction_is_published_on_next_sync(systems):
+    a, b = systems
+    
+    a.equipment["F001"].move_to(Position(4, 4))
+    a.sync_state()
+    b.sync_state()
+    
+    assert b.equipment["F001"].position == Position(4, 4)
+    assert b.path_planner.grid[4, 4] == 1
+    assert b.path_planner.grid[3, 3] == 0
+
+
+def test_transactions_in_one_process_do_not_block_each_other(systems):
+    a, _ = systems
+    entered, release = threading.Event(), threading.Event()
+    
+    def long_transaction():
+        with a.state_transaction():
+            a.warehouses["TW001"].add_product("P001", 1, 1.0)
+            entered.set()
+            release.wait(5)
+    
+    thread = threading.Thread(target=long_transaction)
+    thread.start()
+    assert entered.wait(5)
+    finished = threading.Event()
+    
+    def short_transaction():
+        with a.state_transaction():
+            a.warehouses["PW001"].add_product("P001", 1, 1.0)
+        finished.set()
+    
+    threading.Thread(target=short_transaction).start()
+    assert finished.wait(5)
+    release.set()
+    thread.join()
+    assert a.state_sync.stats['conflicts'] == 0
@@ -0,0 +1,77 @@
+"""
+任务执行的并发测试
+"""
+
+import threading
+
+import pytest
+
+from tms_system import (
+    TMSSystem, Product, ProductWarehouse, TerminalWarehouse, FrameTruck, Position,
+    TaskStatus, EquipmentStatus
+)
+
+
+@pytest.fixture
+def tms():
+    system = TMSSystem(db_path=":memory:")
+    system.add_product(Product("P001", "钢板", 2.0, 1.0, "金属", 100.0))
+    system.add_warehouse(TerminalWarehouse("TW001", "末端库1", Position(1, 1), 1000.0))
+    system.add_warehouse(ProductWarehouse("PW001", "成品库1", Position(8, 8), 1000.0))
+    system.add_equipment(FrameTruck("F001", "车头1", Position(3, 3)))
+    system.warehouses["TW001"].add_product("P001", 100, 1.0)
+    yield system
+    system.shutdown()
+
+
+def test_concurrent_execution_runs_task_once(tms):
+    task = tms.create_internal_transfer_task("TW001", "PW001", {"P001": 10})
+    assert tms.assign_equipment_to_task(task.id, "F001")
+    
+    barrier = threading.Barrier(8)
+    results = []
+    
+    def execute():
+        barrier.wait()
+        results.append(tms.execute_task(task.id))
+    
+    threads = [threading.Thread(target=execute) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert results.count(True) == 1
+    assert tms.warehouses["TW001"].products["P001"] == 90
+    assert tms.warehouses["PW001"].products["P001"] == 10
+    assert task.status == TaskStatus.COMPLETED
+    assert tms.equipment["F001"].status == EquipmentStatus.IDLE
+
+
+def test_task_without_equipment_is_executed_once(tms):
+    task = tms.create_internal_transfer_task("TW001", "PW001", {"P001": 10})
+    
+    assert tms.execute_task(task.id)
+    assert not tms.execute_task(task.id)
+    assert task.status == TaskStatus.COMPLETED
+    assert tms.warehouses["TW001"].products["P001"] == 90
+
+
+def test_completed_task_is_not_executed_again(tms):
+    task = tms.create_internal_transfer_task("TW001", "PW001", {"P001": 10})
+    assert tms.assign_equipment_to_task(task.id, "F001")
+    assert tms.execute_task(task.id)
+    
+    assert not tms.execute_task(task.id)
+    assert tms.warehouses["TW001"].products["P001"] == 90
+
+
+def test_route_distance_is_logged_without_touching_metadata(tms):
+    tms.precompute_routes()
+    task = tms.create_internal_transfer_task("TW001", "PW001", {"P001": 10})
+    metadata = dict(task.metadata)
+    
+    assert tms.execute_task(task.id)
+    assert task.metadata == metadata
+    distance = tms.get_route_distance("warehouse:TW001", "warehouse:PW001")
+    assert f"末端库1 到 成品库1 的路线距离为 {distance}" in tms.execution_log
@@ -0,0 +1,78 @@
+"""
+任务仓库二级索引的测试：随机修改任务后，各索引的查询结果与全量扫描一致
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from tms_system import Task, TaskRepository, TaskStatus, TaskType
+
+
+EQUIPMENT_IDS = ["F1", "F2", "F3", None]
+
+
+def ids(tasks):
+    return sorted(task.id for task in tasks)
+
+
+def assert_indexes_match_scan(repository):
+    tasks = repository.values()
+    for status in TaskStatus:
+        assert ids(repository.with_status(status)) == ids(t for t in tasks if t.status == status)
+        assert repository.count(status) == sum(t.status == status for t in tasks)
+        for task_type in TaskType:
+            assert repository.count(status, task_type) == \
+                sum(t.status == status and t.task_type == task_type for t in tasks)
+    for task_type in TaskType:
+        assert ids(repository.with_type(task_type)) == ids(t for t in tasks if t.task_type == task_type)
+    for equipment_id in EQUIPMENT_IDS[:-1]:
+        assert ids(repository.assigned_to(equipment_id)) == \
+            ids(t for t in tasks if t.assigned_equipment == equipment_id)
+    
+    cutoff = datetime(2026, 1, 15)
+    due = repository.due_before(cutoff)
+    assert ids(due) == ids(t for t in tasks if t.deadline is not None and t.deadline <= cutoff)
+    assert [t.deadline for t in due] == sorted(t.deadline for t in due)
+    
+    page, _ = repository.query(status=TaskStatus.PENDING, equipment_id="F1", limit=len(tasks) + 1)
+    assert ids(page) == \
+        ids(t for t in tasks if t.status == TaskStatus.PENDING and t.assigned_equipment == "F1")
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_indexes_follow_task_changes(seed):
+    rng = random.Random(seed)
+    repository = TaskRepository()
+    base = datetime(2026, 1, 1)
+    for i in range(60):
+        task = Task(id=f"T{i:03d}", task_type=rng.choice(list(TaskType)),
+                    created_at=base + timedelta(minutes=rng.randint(0, 1000)))
+        repository[task.id] = task
+    
+    for _ in range(300):
+        task = repository[rng.choice(repository.keys())]
+        action = rng.randrange(6)
+        if action == 0:
+            task.start_execution()
+        elif action == 1:
+            task.complete_task()
+        elif action == 2:
+            task.fail_task("测试")
+        elif action == 3:
+            task.assigned_equipment = rng.choice(EQUIPMENT_IDS)
+        elif action == 4:
+            task.deadline = rng.choice([None, base + timedelta(days=rng.randint(0, 30))])
+        else:
+            task.status = TaskStatus.PENDING
+    assert_indexes_match_scan(repository)
+    
+    # 删除和替换任务后索引同样保持一致，被移除的任务不再通知仓库
+    removed = repository[repository.keys()[0]]
+    del repository[removed.id]
+    removed.status = TaskStatus.CANCELLED
+    replacement = Task(id=repository.keys()[0], task_type=TaskType.LOADING, status=TaskStatus.FAILED)
+    repository[replacement.id] = replacement
+    assert removed.id not in ids(repository.with_status(TaskStatus.CANCELLED))
+    assert_indexes_match_scan(repository)
@@ -5,19 +5,25 @@ Transportation Management System REST API
 该模块提供完整的RESTful API接口，用于TMS系统的Web服务
 """
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
 from datetime import datetime, timedelta
+import base64
+import csv
+import heapq
+import io
 import json
 import os
 import logging
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, List, Tuple, Optional, Callable, Iterable, Iterator
 
 from tms_system import (
     TMSSystem, Product, TerminalWarehouse, ProductWarehouse, 
-    Crane, FrameTruck, Frame, Position, ShipPlan,
-    TaskStatus, TaskType, EquipmentStatus, WarehouseType
+    Crane, FrameTruck, Frame, Position, ShipPlan, PathPlanner,
+    TaskStatus, TaskType, EquipmentStatus, WarehouseType, VersionConflict
 )
+from tms_state_store import open_state_store
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -26,9 +32,38 @@ logger = logging.getLogger(__name__)
 # 创建Flask应用
 app = Flask(__name__)
 CORS(app)  # 启用跨域支持
+# 保持返回数据中键的顺序（分页列表按排序键返回）
+app.json.sort_keys = False
 
-# 全局TMS系统实例
-tms_system = TMSSystem()
+# 全局TMS系统实例（设置 TMS_LOAD_STATE=true 时从数据库恢复上次的状态）。
+# 多个工作进程部署时设置 TMS_STATE_STORE=sqlite:///路径，各进程通过共享状态存储保持一致。
+# 实例在首次使用时由 get_tms_system() 创建而不是在导入时创建：批量路径规划的进程池以spawn
+# 启动工作进程，工作进程会以 __mp_main__ 重新执行启动脚本（python tms_api.py）的顶层代码
+tms_system: TMSSystem
+_tms_system_lock = threading.Lock()
+
+def get_tms_system() -> TMSSystem:
+    """获取全局TMS系统实例，首次调用时创建"""
+    global tms_system
+    if 'tms_system' not in globals():
+        with _tms_system_lock:
+            if 'tms_system' not in globals():
+                tms_system = TMSSystem(
+                    load_from_db=os.environ.get('TMS_LOAD_STATE', 'false').lower() == 'true',
+                    state_store=open_state_store(os.environ.get('TMS_STATE_STORE'))
+                )
+    return tms_system
+
+def __getattr__(name: str):
+    # 模块外访问 tms_api.tms_system 时按需创建实例
+    if name == 'tms_system':
+        return get_tms_system()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@app.before_request
+def sync_shared_state():
+    """处理请求前确保系统实例已创建，并拉取其他工作进程提交的修改（未配置共享状态存储时为空操作）"""
+    get_tms_system().sync_state()
 
 # 错误处理装饰器
 def handle_api_errors(f):
@@ -36,6 +71,13 @@ def handle_api_errors(f):
     def wrapper(*args, **kwargs):
         try:
             return f(*args, **kwargs)
+        except VersionConflict as e:
+            # 其他工作进程同时修改了同一对象，本地状态已更新为最新，客户端可以重试
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'message': '数据已被其他请求修改，请重试'
+            }), 409
         except Exception as e:
             logger.error(f"API错误: {str(e)}")
             return jsonify({
@@ -65,6 +107,305 @@ def validate_position(data: Dict) -> tuple:
     except (ValueError, TypeError):
         return False, "位置坐标必须为有效整数"
 
+# 实体构建函数（单条创建与批量导入共用）
+class PayloadError(ValueError):
+    """请求数据校验失败"""
+    pass
+
+# 单次批量导入允许的最大条数
+MAX_BULK_ITEMS = 50000
+# 单次批量路径规划允许的最大查询数
+MAX_BATCH_PATHS = 10000
+# 单次地形设置允许的最大格子数
+MAX_TERRAIN_CELLS = 10000
+
+def build_product(data: Dict) -> Product:
+    """根据请求数据构建产品"""
+    if not isinstance(data, dict):
+        raise PayloadError("每条记录必须为JSON对象")
+    is_valid, error_msg = validate_required_fields(data, ['name', 'weight', 'volume'])
+    if not is_valid:
+        raise PayloadError(error_msg)
+    
+    return Product(
+        id=data.get('id', ''),
+        name=data['name'],
+        weight=float(data['weight']),
+        volume=float(data['volume']),
+        category=data.get('category', 'default'),
+        unit_price=float(data.get('unit_price', 0.0))
+    )
+
+def build_warehouse(data: Dict):
+    """根据请求数据构建仓库"""
+    if not isinstance(data, dict):
+        raise PayloadError("每条记录必须为JSON对象")
+    is_valid, error_msg = validate_required_fields(data, ['name', 'type', 'position_x', 'position_y', 'capacity'])
+    if not is_valid:
+        raise PayloadError(error_msg)
+    is_valid, error_msg = validate_position(data)
+    if not is_valid:
+        raise PayloadError(error_msg)
+    
+    warehouse_type = data['type'].lower()
+    position = Position(int(data['position_x']), int(data['position_y']))
+    capacity = float(data['capacity'])
+    
+    if warehouse_type == 'terminal':
+        warehouse_class = TerminalWarehouse
+    elif warehouse_type == 'product':
+        warehouse_class = ProductWarehouse
+    else:
+        raise PayloadError('仓库类型必须为 terminal 或 product')
+    
+    return warehouse_class(
+        id=data.get('id', ''),
+        name=data['name'],
+        position=position,
+        capacity=capacity
+    )
+
+def build_equipment(data: Dict):
+    """根据请求数据构建设备"""
+    if not isinstance(data, dict):
+        raise PayloadError("每条记录必须为JSON对象")
+    is_valid, error_msg = validate_required_fields(data, ['name', 'type', 'position_x', 'position_y'])
+    if not is_valid:
+        raise PayloadError(error_msg)
+    is_valid, error_msg = validate_position(data)
+    if not is_valid:
+        raise PayloadError(error_msg)
+    
+    equipment_type = data['type'].lower()
+    position = Position(int(data['position_x']), int(data['position_y']))
+    
+    if equipment_type == 'crane':
+        if 'warehouse_id' not in data:
+            raise PayloadError('行车必须指定所属仓库')
+        
+        return Crane(
+            id=data.get('id', ''),
+            name=data['name'],
+            position=position,
+            warehouse_id=data['warehouse_id'],
+            capacity=float(data.get('capacity', 50.0))
+        )
+    elif equipment_type == 'frametruck':
+        return FrameTruck(
+            id=data.get('id', ''),
+            name=data['name'],
+            position=position,
+            capacity=float(data.get('capacity', 100.0))
+        )
+    elif equipment_type == 'frame':
+        return Frame(
+            id=data.get('id', ''),
+            name=data['name'],
+            position=position,
+            capacity=float(data.get('capacity', 80.0))
+        )
+    raise PayloadError('设备类型必须为 crane, frametruck 或 frame')
+
+def bulk_create(builder, importer, label: str):
+    """批量创建的通用处理：逐条构建对象，再交给核心批量导入方法
+
+    请求体可以是对象列表，也可以是 ``{"items": [...], "atomic": false, "upsert": false}``。
+    ID已存在的记录默认作为失败条目返回，``upsert`` 为 true 时替换已有对象。
+    返回的错误列表中的 ``index`` 均为请求中的原始下标。
+    """
+    data = request.get_json()
+    atomic = False
+    upsert = False
+    if isinstance(data, dict):
+        items = data.get('items')
+        atomic = bool(data.get('atomic', False))
+        upsert = bool(data.get('upsert', False))
+    else:
+        items = data
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': '请求体必须包含非空的 items 列表'}), 400
+    if len(items) > MAX_BULK_ITEMS:
+        return jsonify({'success': False, 'message': f'单次最多导入 {MAX_BULK_ITEMS} 条记录'}), 400
+    
+    objects = []
+    index_map = []
+    errors = []
+    for index, item in enumerate(items):
+        item_id = item.get('id') if isinstance(item, dict) else None
+        try:
+            obj = builder(item)
+        except PayloadError as e:
+            errors.append({'index': index, 'id': item_id, 'error': str(e)})
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append({'index': index, 'id': item_id, 'error': f'数据类型错误: {str(e)}'})
+        else:
+            objects.append(obj)
+            index_map.append(index)
+    
+    if objects and not (atomic and errors):
+        result = importer(objects, atomic=atomic, upsert=upsert)
+        for error in result['errors']:
+            if error['index'] is not None:
+                error['index'] = index_map[error['index']]
+        errors.extend(result['errors'])
+        imported = result['imported']
+    else:
+        imported = 0
+    
+    errors.sort(key=lambda e: (e['index'] is None, e['index'] or 0))
+    status_code = 200 if imported else 400
+    return jsonify({
+        'success': imported > 0,
+        'message': f'批量导入{label}: 成功 {imported} 条, 失败 {len(items) - imported} 条',
+        'data': {
+            'total': len(items),
+            'imported': imported,
+            'failed': len(items) - imported,
+            'errors': errors
+        }
+    }), status_code
+
+# 列表接口的分页、筛选和字段投影
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(key) -> str:
+    """把排序键编码为不透明的分页游标"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise PayloadError("无效的分页游标")
+
+def parse_page_args() -> Tuple[Optional[int], Any, Optional[List[str]]]:
+    """解析 limit、cursor 和 fields 参数，返回 (分页大小, 游标中的排序键, 字段列表)
+
+    limit 和 cursor 都未指定时不分页，分页大小为None，与分页前的接口一样返回全部记录；
+    只指定 cursor 时每页 DEFAULT_PAGE_SIZE 条。
+    """
+    cursor = request.args.get('cursor')
+    if 'limit' not in request.args and not cursor:
+        limit = None
+    else:
+        try:
+            limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise PayloadError("limit 必须是整数")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise PayloadError(f"limit 必须在 1 到 {MAX_PAGE_SIZE} 之间")
+    after = decode_cursor(cursor) if cursor else None
+    fields = request.args.get('fields')
+    if fields is not None:
+        fields = [name.strip() for name in fields.split(',') if name.strip()]
+    return limit, after, fields
+
+def parse_datetime_arg(name: str) -> Optional[datetime]:
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise PayloadError(f"{name} 必须是ISO格式的时间")
+
+def project(record: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """只保留请求的字段，未指定 fields 时返回全部字段"""
+    if fields is None:
+        return dict(record)
+    return {name: record[name] for name in fields if name in record}
+
+def paginate_by_id(records: Dict[str, Any], limit: Optional[int], after: Any,
+                   predicate: Optional[Callable[[Any], bool]] = None) -> Tuple[List[str], Optional[str]]:
+    """按ID升序分页：选出游标之后满足条件的最小的 limit 个ID，返回 (ID列表, 下一页游标)
+
+    limit 为None时返回全部满足条件的ID。
+    """
+    if after is not None and not isinstance(after, str):
+        raise PayloadError("无效的分页游标")
+    ids = [
+        record_id for record_id, record in list(records.items())
+        if (after is None or record_id > after) and (predicate is None or predicate(record))
+    ]
+    if limit is None:
+        return sorted(ids), None
+    page = heapq.nsmallest(limit + 1, ids)
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+def snapshot_filter(names: List[str]) -> Optional[Callable[[Any], bool]]:
+    """由查询参数构造按快照字段筛选的条件（如 type=Crane&status=idle），没有筛选参数时返回None"""
+    filters = {name: request.args[name] for name in names if request.args.get(name)}
+    if not filters:
+        return None
+    return lambda obj: all(str(obj.snapshot().get(name)) == value for name, value in filters.items())
+
+def page_response(data: Dict[str, Any], next_cursor: Optional[str]):
+    return jsonify({
+        'success': True,
+        'data': data,
+        'count': len(data),
+        'next_cursor': next_cursor
+    })
+
+def serialize_product(product: Product) -> Dict[str, Any]:
+    return {
+        'id': product.id,
+        'name': product.name,
+        'weight': product.weight,
+        'volume': product.volume,
+        'category': product.category,
+        'unit_price': product.unit_price
+    }
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+# 任务的可选字段，按 fields 参数只计算请求的字段
+TASK_FIELDS: Dict[str, Callable] = {
+    'id': lambda task: task.id,
+    'type': lambda task: task.task_type.value,
+    'status': lambda task: task.status.value,
+    'priority': lambda task: task.priority,
+    'created_at': lambda task: task.created_at.isoformat(),
+    'start_time': lambda task: _isoformat(task.start_time),
+    'end_time': lambda task: _isoformat(task.end_time),
+    'deadline': lambda task: _isoformat(task.deadline),
+    'assigned_equipment': lambda task: task.assigned_equipment,
+    'metadata': lambda task: task.metadata,
+    'sub_tasks': lambda task: [
+        {
+            'id': st.id,
+            'type': st.task_type.value,
+            'status': st.status.value
+        } for st in task.sub_tasks
+    ]
+}
+
+def serialize_task(task, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    names = TASK_FIELDS if fields is None else [name for name in fields if name in TASK_FIELDS]
+    return {name: TASK_FIELDS[name](task) for name in names}
+
+def parse_task_filters() -> Dict[str, Any]:
+    """解析任务筛选参数，返回 ``TaskRepository.query`` 的关键字参数"""
+    status = request.args.get('status')
+    task_type = request.args.get('type')
+    try:
+        status = TaskStatus(status) if status else None
+        task_type = TaskType(task_type) if task_type else None
+    except ValueError as e:
+        raise PayloadError(f"无效的筛选条件: {e}")
+    return {
+        'status': status,
+        'task_type': task_type,
+        'warehouse_id': request.args.get('warehouse_id') or None,
+        'equipment_id': request.args.get('equipment_id') or None,
+        'created_from': parse_datetime_arg('created_from'),
+        'created_to': parse_datetime_arg('created_to')
+    }
+
 # 首页和文档路由
 @app.route('/')
 def index():
@@ -102,12 +443,111 @@ def get_system_status():
         'data': tms_system.get_system_status()
     })
 
+@app.route('/api/system/path-cache')
+@handle_api_errors
+def get_path_cache_stats():
+    """获取路径缓存统计"""
+    return jsonify({
+        'success': True,
+        'data': tms_system.path_planner.path_cache_stats()
+    })
+
+@app.route('/api/system/state-store')
+@handle_api_errors
+def get_state_store_stats():
+    """获取共享状态存储的同步统计"""
+    return jsonify({
+        'success': True,
+        'data': tms_system.state_sync.summary() if tms_system.state_sync else {'enabled': False}
+    })
+
+@app.route('/api/system/routes')
+@handle_api_errors
+def get_route_table():
+    """分页获取仓库之间的路线距离表（按地标名称分页，每页只计算本页各行的距离场）"""
+    landmarks = tms_system.route_table.landmarks()
+    try:
+        limit, after, _ = parse_page_args()
+        names, next_cursor = paginate_by_id(landmarks, limit, after)
+    except PayloadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    refresh = tms_system.precompute_routes(names)
+    return jsonify({
+        'success': True,
+        'data': {
+            'landmarks': {name: {'x': pos.x, 'y': pos.y} for name, pos in landmarks.items()},
+            'distances': tms_system.get_route_distance_table(names),
+            'refresh': refresh
+        },
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/system/terrain', methods=['POST'])
+@handle_api_errors
+def set_terrain():
+    """设置区域通行代价（慢行区）或单行道"""
+    data = request.get_json()
+    
+    required_fields = ['x1', 'y1', 'x2', 'y2']
+    is_valid, error_msg = validate_required_fields(data, required_fields)
+    if not is_valid:
+        return jsonify({'success': False, 'message': error_msg}), 400
+    
+    try:
+        planner = tms_system.path_planner
+        top_left = Position(int(data['x1']), int(data['y1']))
+        bottom_right = Position(int(data['x2']), int(data['y2']))
+        # 先校验整个请求，避免中途出错时地形只被设置了一部分
+        if top_left.x > bottom_right.x or top_left.y > bottom_right.y:
+            raise ValueError("x1/y1 不能大于 x2/y2")
+        if not planner.in_bounds(top_left) or not planner.in_bounds(bottom_right):
+            raise ValueError("区域超出网格范围")
+        area = (bottom_right.x - top_left.x + 1) * (bottom_right.y - top_left.y + 1)
+        if area > MAX_TERRAIN_CELLS:
+            raise ValueError(f"单次最多设置 {MAX_TERRAIN_CELLS} 个格子")
+        cost = int(data['cost']) if 'cost' in data else None
+        if cost is not None and not 1 <= cost <= 255:
+            raise ValueError("通行代价必须在 1~255 之间")
+        # one_way 为 {'dx', 'dy'} 时设为单行道，为 null 时恢复双向通行
+        direction = data.get('one_way')
+        if direction is not None:
+            direction = (int(direction['dx']), int(direction['dy']))
+        
+        with planner.lock:
+            if cost is not None:
+                planner.set_area_cost(top_left, bottom_right, cost)
+            if 'one_way' in data:
+                for x in range(top_left.x, bottom_right.x + 1):
+                    for y in range(top_left.y, bottom_right.y + 1):
+                        if direction is None:
+                            planner.set_allowed_directions(Position(x, y), None)
+                        else:
+                            planner.set_one_way(Position(x, y), direction)
+        
+        return jsonify({
+            'success': True,
+            'message': '地形设置成功',
+            'data': {
+                'connectivity': planner.connectivity,
+                'min_cost': planner.min_cost,
+                'uniform': planner.is_uniform
+            }
+        })
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({'success': False, 'message': f'地形数据错误: {str(e)}'}), 400
+
 @app.route('/api/system/reset', methods=['POST'])
 @handle_api_errors
 def reset_system():
     """重置系统"""
     global tms_system
-    tms_system = TMSSystem()
+    old_system = tms_system
+    old_system.shutdown()
+    # 共享状态存储中的数据不会被清除，新实例会从存储重新同步
+    tms_system = TMSSystem(state_store=old_system.state_store)
+    # 状态版本号在实例之间连续递增，长轮询客户端持有的版本号在重置后仍然可比较
+    tms_system.change_version = old_system.change_version + 1
     logger.info("系统已重置")
     return jsonify({
         'success': True,
@@ -118,23 +558,20 @@ def reset_system():
 @app.route('/api/products', methods=['GET'])
 @handle_api_errors
 def get_products():
-    """获取所有产品"""
-    products_data = {}
-    for product_id, product in tms_system.products.items():
-        products_data[product_id] = {
-            'id': product.id,
-            'name': product.name,
-            'weight': product.weight,
-            'volume': product.volume,
-            'category': product.category,
-            'unit_price': product.unit_price
-        }
+    """分页获取产品（按ID升序），支持 category 筛选和 fields 投影"""
+    try:
+        limit, after, fields = parse_page_args()
+        category = request.args.get('category')
+        predicate = (lambda product: product.category == category) if category else None
+        page, next_cursor = paginate_by_id(tms_system.products, limit, after, predicate)
+    except PayloadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    return jsonify({
-        'success': True,
-        'data': products_data,
-        'count': len(products_data)
-    })
+    products_data = {
+        product_id: project(serialize_product(tms_system.products[product_id]), fields)
+        for product_id in page
+    }
+    return page_response(products_data, next_cursor)
 
 @app.route('/api/products', methods=['POST'])
 @handle_api_errors
@@ -142,21 +579,8 @@ def create_product():
     """创建产品"""
     data = request.get_json()
     
-    # 验证必需字段
-    required_fields = ['name', 'weight', 'volume']
-    is_valid, error_msg = validate_required_fields(data, required_fields)
-    if not is_valid:
-        return jsonify({'success': False, 'message': error_msg}), 400
-    
     try:
-        product = Product(
-            id=data.get('id', ''),
-            name=data['name'],
-            weight=float(data['weight']),
-            volume=float(data['volume']),
-            category=data.get('category', 'default'),
-            unit_price=float(data.get('unit_price', 0.0))
-        )
+        product = build_product(data)
         
         success = tms_system.add_product(product)
         if success:
@@ -168,9 +592,17 @@ def create_product():
         else:
             return jsonify({'success': False, 'message': '产品创建失败'}), 500
             
+    except PayloadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except (ValueError, TypeError) as e:
         return jsonify({'success': False, 'message': f'数据类型错误: {str(e)}'}), 400
 
+@app.route('/api/products/bulk', methods=['POST'])
+@handle_api_errors
+def create_products_bulk():
+    """批量创建产品"""
+    return bulk_create(build_product, tms_system.add_products_bulk, '产品')
+
 @app.route('/api/products/<product_id>', methods=['GET'])
 @handle_api_errors
 def get_product(product_id):
@@ -181,14 +613,7 @@ def get_product(product_id):
     product = tms_system.products[product_id]
     return jsonify({
         'success': True,
-        'data': {
-            'id': product.id,
-            'name': product.name,
-            'weight': product.weight,
-            'volume': product.volume,
-            'category': product.category,
-            'unit_price': product.unit_price
-        }
+        'data': serialize_product(product)
     })
 
 @app.route('/api/products/<product_id>', methods=['PUT'])
@@ -201,20 +626,22 @@ def update_product(product_id):
     data = request.get_json()
     product = tms_system.products[product_id]
     
-    # 更新字段
-    if 'name' in data:
-        product.name = data['name']
-    if 'weight' in data:
-        product.weight = float(data['weight'])
-    if 'volume' in data:
-        product.volume = float(data['volume'])
-    if 'category' in data:
-        product.category = data['category']
-    if 'unit_price' in data:
-        product.unit_price = float(data['unit_price'])
-    
-    # 保存到数据库
-    tms_system.db_manager.save_product(product)
+    with tms_system.state_transaction():
+        # 更新字段
+        if 'name' in data:
+            product.name = data['name']
+        if 'weight' in data:
+            product.weight = float(data['weight'])
+        if 'volume' in data:
+            product.volume = float(data['volume'])
+        if 'category' in data:
+            product.category = data['category']
+        if 'unit_price' in data:
+            product.unit_price = float(data['unit_price'])
+        tms_system.mark_state_changed('product', product_id)
+        
+        # 保存到数据库
+        tms_system.db_manager.save_product(product)
     
     return jsonify({
         'success': True,
@@ -226,26 +653,19 @@ def update_product(product_id):
 @app.route('/api/warehouses', methods=['GET'])
 @handle_api_errors
 def get_warehouses():
-    """获取所有仓库"""
-    warehouses_data = {}
-    for warehouse_id, warehouse in tms_system.warehouses.items():
-        warehouses_data[warehouse_id] = {
-            'id': warehouse.id,
-            'name': warehouse.name,
-            'type': warehouse.warehouse_type.value,
-            'position': {'x': warehouse.position.x, 'y': warehouse.position.y},
-            'capacity': warehouse.capacity,
-            'current_volume': warehouse.current_volume,
-            'utilization_rate': warehouse.get_utilization_rate(),
-            'available_capacity': warehouse.get_available_capacity(),
-            'products': warehouse.products
-        }
+    """分页获取仓库（按ID升序），支持 type 筛选和 fields 投影"""
+    try:
+        limit, after, fields = parse_page_args()
+        page, next_cursor = paginate_by_id(tms_system.warehouses, limit, after, snapshot_filter(['type']))
+    except PayloadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    return jsonify({
-        'success': True,
-        'data': warehouses_data,
-        'count': len(warehouses_data)
-    })
+    # 只读快照无需加锁，仓库未变化时直接复用
+    warehouses_data = {
+        warehouse_id: project(tms_system.warehouses[warehouse_id].snapshot(), fields)
+        for warehouse_id in page
+    }
+    return page_response(warehouses_data, next_cursor)
 
 @app.route('/api/warehouses', methods=['POST'])
 @handle_api_errors
@@ -253,38 +673,8 @@ def create_warehouse():
     """创建仓库"""
     data = request.get_json()
     
-    # 验证必需字段
-    required_fields = ['name', 'type', 'position_x', 'position_y', 'capacity']
-    is_valid, error_msg = validate_required_fields(data, required_fields)
-    if not is_valid:
-        return jsonify({'success': False, 'message': error_msg}), 400
-    
-    # 验证位置
-    is_valid, error_msg = validate_position(data)
-    if not is_valid:
-        return jsonify({'success': False, 'message': error_msg}), 400
-    
     try:
-        warehouse_type = data['type'].lower()
-        position = Position(int(data['position_x']), int(data['position_y']))
-        capacity = float(data['capacity'])
-        
-        if warehouse_type == 'terminal':
-            warehouse = TerminalWarehouse(
-                id=data.get('id', ''),
-                name=data['name'],
-                position=position,
-                capacity=capacity
-            )
-        elif warehouse_type == 'product':
-            warehouse = ProductWarehouse(
-                id=data.get('id', ''),
-                name=data['name'],
-                position=position,
-                capacity=capacity
-            )
-        else:
-            return jsonify({'success': False, 'message': '仓库类型必须为 terminal 或 product'}), 400
+        warehouse = build_warehouse(data)
         
         success = tms_system.add_warehouse(warehouse)
         if success:
@@ -296,14 +686,21 @@ def create_warehouse():
         else:
             return jsonify({'success': False, 'message': '仓库创建失败'}), 500
             
+    except PayloadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except (ValueError, TypeError) as e:
         return jsonify({'success': False, 'message': f'数据类型错误: {str(e)}'}), 400
 
+@app.route('/api/warehouses/bulk', methods=['POST'])
+@handle_api_errors
+def create_warehouses_bulk():
+    """批量创建仓库"""
+    return bulk_create(build_warehouse, tms_system.add_warehouses_bulk, '仓库')
+
 @app.route('/api/warehouses/<warehouse_id>/inventory', methods=['POST'])
 @handle_api_errors
-def update_warehouse_inventory():
+def update_warehouse_inventory(warehouse_id):
     """更新仓库库存"""
-    warehouse_id = request.view_args['warehouse_id']
     data = request.get_json()
     
     if warehouse_id not in tms_system.warehouses:
@@ -324,12 +721,13 @@ def update_warehouse_inventory():
     product = tms_system.products[product_id]
     
     try:
-        if quantity > 0:
-            success = warehouse.add_product(product_id, quantity, product.volume)
-            operation = '入库'
-        else:
-            success = warehouse.remove_product(product_id, abs(quantity), product.volume)
-            operation = '出库'
+        with tms_system.state_transaction():
+            if quantity > 0:
+                success = warehouse.add_product(product_id, quantity, product.volume)
+                operation = '入库'
+            else:
+                success = warehouse.remove_product(product_id, abs(quantity), product.volume)
+                operation = '出库'
         
         if success:
             return jsonify({
@@ -345,6 +743,8 @@ def update_warehouse_inventory():
         else:
             return jsonify({'success': False, 'message': f'库存{operation}失败'}), 400
             
+    except VersionConflict:
+        raise
     except Exception as e:
         return jsonify({'success': False, 'message': f'操作失败: {str(e)}'}), 500
 
@@ -352,45 +752,20 @@ def update_warehouse_inventory():
 @app.route('/api/equipment', methods=['GET'])
 @handle_api_errors
 def get_equipment():
-    """获取所有设备"""
-    equipment_data = {}
-    for equipment_id, equipment in tms_system.equipment.items():
-        equipment_info = {
-            'id': equipment.id,
-            'name': equipment.name,
-            'type': equipment.__class__.__name__,
-            'position': {'x': equipment.position.x, 'y': equipment.position.y},
-            'status': equipment.status.value,
-            'current_task_id': equipment.current_task_id
-        }
-        
-        # 添加特定设备类型的信息
-        if isinstance(equipment, Crane):
-            equipment_info.update({
-                'warehouse_id': equipment.warehouse_id,
-                'capacity': equipment.capacity,
-                'current_load': equipment.current_load
-            })
-        elif isinstance(equipment, FrameTruck):
-            equipment_info.update({
-                'capacity': equipment.capacity,
-                'attached_frame_id': equipment.attached_frame_id,
-                'current_load': equipment.current_load
-            })
-        elif isinstance(equipment, Frame):
-            equipment_info.update({
-                'capacity': equipment.capacity,
-                'current_load': equipment.current_load,
-                'products': equipment.products
-            })
-        
-        equipment_data[equipment_id] = equipment_info
+    """分页获取设备（按ID升序），支持 type、status、warehouse_id 筛选和 fields 投影"""
+    try:
+        limit, after, fields = parse_page_args()
+        predicate = snapshot_filter(['type', 'status', 'warehouse_id'])
+        page, next_cursor = paginate_by_id(tms_system.equipment, limit, after, predicate)
+    except PayloadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    return jsonify({
-        'success': True,
-        'data': equipment_data,
-        'count': len(equipment_data)
-    })
+    # 只读快照（含特定设备类型的字段）无需加锁，设备未变化时直接复用
+    equipment_data = {
+        equipment_id: project(tms_system.equipment[equipment_id].snapshot(), fields)
+        for equipment_id in page
+    }
+    return page_response(equipment_data, next_cursor)
 
 @app.route('/api/equipment', methods=['POST'])
 @handle_api_errors
@@ -398,48 +773,8 @@ def create_equipment():
     """创建设备"""
     data = request.get_json()
     
-    # 验证必需字段
-    required_fields = ['name', 'type', 'position_x', 'position_y']
-    is_valid, error_msg = validate_required_fields(data, required_fields)
-    if not is_valid:
-        return jsonify({'success': False, 'message': error_msg}), 400
-    
-    # 验证位置
-    is_valid, error_msg = validate_position(data)
-    if not is_valid:
-        return jsonify({'success': False, 'message': error_msg}), 400
-    
     try:
-        equipment_type = data['type'].lower()
-        position = Position(int(data['position_x']), int(data['position_y']))
-        
-        if equipment_type == 'crane':
-            if 'warehouse_id' not in data:
-                return jsonify({'success': False, 'message': '行车必须指定所属仓库'}), 400
-            
-            equipment = Crane(
-                id=data.get('id', ''),
-                name=data['name'],
-                position=position,
-                warehouse_id=data['warehouse_id'],
-                capacity=float(data.get('capacity', 50.0))
-            )
-        elif equipment_type == 'frametruck':
-            equipment = FrameTruck(
-                id=data.get('id', ''),
-                name=data['name'],
-                position=position,
-                capacity=float(data.get('capacity', 100.0))
-            )
-        elif equipment_type == 'frame':
-            equipment = Frame(
-                id=data.get('id', ''),
-                name=data['name'],
-                position=position,
-                capacity=float(data.get('capacity', 80.0))
-            )
-        else:
-            return jsonify({'success': False, 'message': '设备类型必须为 crane, frametruck 或 frame'}), 400
+        equipment = build_equipment(data)
         
         success = tms_system.add_equipment(equipment)
         if success:
@@ -451,9 +786,17 @@ def create_equipment():
         else:
             return jsonify({'success': False, 'message': '设备创建失败'}), 500
             
+    except PayloadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except (ValueError, TypeError) as e:
         return jsonify({'success': False, 'message': f'数据类型错误: {str(e)}'}), 400
 
+@app.route('/api/equipment/bulk', methods=['POST'])
+@handle_api_errors
+def create_equipment_bulk():
+    """批量创建设备"""
+    return bulk_create(build_equipment, tms_system.add_equipment_bulk, '设备')
+
 @app.route('/api/equipment/<equipment_id>/move', methods=['POST'])
 @handle_api_errors
 def move_equipment(equipment_id):
@@ -471,15 +814,25 @@ def move_equipment(equipment_id):
     try:
         target_position = Position(int(data['target_x']), int(data['target_y']))
         equipment = tms_system.equipment[equipment_id]
+        algorithm = data.get('algorithm', 'astar')
+        if algorithm not in PathPlanner.ALGORITHMS:
+            return jsonify({
+                'success': False,
+                'message': f"无效的路径规划算法，可选值: {', '.join(PathPlanner.ALGORITHMS)}"
+            }), 400
         
-        # 使用路径规划算法计算路径
-        path = tms_system.path_planner.a_star_path(equipment.position, target_position)
+        # 使用路径规划算法计算路径（设备自身所在的格子是障碍物，从这里出发是允许的）
+        path = tms_system.path_planner.a_star_path(equipment.position, target_position,
+                                                   algorithm=algorithm, allow_occupied_start=True)
         
         if not path:
             return jsonify({'success': False, 'message': '无法找到有效路径'}), 400
+        # 到达后终点会被设备占用，代价要在移动前计算
+        path_cost = tms_system.path_planner.path_cost(path)
         
         # 移动设备
-        success = equipment.move_to(target_position)
+        with tms_system.state_transaction():
+            success = equipment.move_to(target_position)
         
         if success:
             return jsonify({
@@ -489,7 +842,8 @@ def move_equipment(equipment_id):
                     'equipment_id': equipment_id,
                     'old_position': {'x': path[0].x, 'y': path[0].y},
                     'new_position': {'x': target_position.x, 'y': target_position.y},
-                    'path': [{'x': pos.x, 'y': pos.y} for pos in path]
+                    'path': [{'x': pos.x, 'y': pos.y} for pos in path],
+                    'path_cost': path_cost
                 }
             })
         else:
@@ -498,39 +852,144 @@ def move_equipment(equipment_id):
     except (ValueError, TypeError) as e:
         return jsonify({'success': False, 'message': f'坐标数据错误: {str(e)}'}), 400
 
-# 任务管理API
-@app.route('/api/tasks', methods=['GET'])
+@app.route('/api/equipment/<equipment_id>/route', methods=['POST', 'GET', 'DELETE'])
 @handle_api_errors
-def get_tasks():
-    """获取所有任务"""
-    tasks_data = {}
-    for task_id, task in tms_system.tasks.items():
-        tasks_data[task_id] = {
-            'id': task.id,
-            'type': task.task_type.value,
-            'status': task.status.value,
-            'priority': task.priority,
-            'created_at': task.created_at.isoformat(),
-            'start_time': task.start_time.isoformat() if task.start_time else None,
-            'end_time': task.end_time.isoformat() if task.end_time else None,
-            'deadline': task.deadline.isoformat() if task.deadline else None,
-            'assigned_equipment': task.assigned_equipment,
-            'metadata': task.metadata,
-            'sub_tasks': [
-                {
-                    'id': st.id,
-                    'type': st.task_type.value,
-                    'status': st.status.value
-                } for st in task.sub_tasks
-            ]
+def equipment_route(equipment_id):
+    """设备在途路线：POST开始（目标位置），GET获取修复后的剩余路径，DELETE结束"""
+    if equipment_id not in tms_system.equipment:
+        return jsonify({'success': False, 'message': '设备不存在'}), 404
+    
+    if request.method == 'DELETE':
+        if not tms_system.close_equipment_route(equipment_id):
+            return jsonify({'success': False, 'message': '设备没有在途路线'}), 404
+        return jsonify({'success': True, 'message': '路线已结束'})
+    
+    if request.method == 'POST':
+        data = request.get_json()
+        is_valid, error_msg = validate_required_fields(data, ['target_x', 'target_y'])
+        if not is_valid:
+            return jsonify({'success': False, 'message': error_msg}), 400
+        try:
+            goal = Position(int(data['target_x']), int(data['target_y']))
+            path = tms_system.open_equipment_route(equipment_id, goal)
+        except (ValueError, TypeError) as e:
+            return jsonify({'success': False, 'message': f'坐标数据错误: {str(e)}'}), 400
+    else:
+        path = tms_system.equipment_route(equipment_id)
+    
+    return jsonify({
+        'success': True,
+        'data': {
+            'equipment_id': equipment_id,
+            'reachable': bool(path),
+            'path': [{'x': pos.x, 'y': pos.y} for pos in path]
         }
+    })
+
+@app.route('/api/equipment/moves/plan', methods=['POST'])
+@handle_api_errors
+def plan_equipment_moves():
+    """为多台设备规划互不冲突的同步移动"""
+    data = request.get_json()
+    
+    is_valid, error_msg = validate_required_fields(data, ['moves'])
+    if not is_valid:
+        return jsonify({'success': False, 'message': error_msg}), 400
+    if not isinstance(data['moves'], list) or not data['moves']:
+        return jsonify({'success': False, 'message': 'moves 必须是非空数组'}), 400
+    
+    try:
+        # 数组顺序即优先级，靠前的设备先规划
+        moves = {}
+        for item in data['moves']:
+            moves[str(item['equipment_id'])] = Position(int(item['target_x']), int(item['target_y']))
+        with tms_system.state_transaction():
+            plan = tms_system.plan_equipment_moves(moves, execute=bool(data.get('execute', False)))
+    except KeyError as e:
+        return jsonify({'success': False, 'message': f'移动请求缺少字段: {str(e)}'}), 400
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'message': f'移动请求错误: {str(e)}'}), 400
+    
+    return jsonify({
+        'success': True,
+        'message': f'规划完成，{len(plan.paths)} 台设备获得路径，{len(plan.failed)} 台保持原地',
+        'data': plan.to_dict()
+    })
+
+# 路径规划API
+@app.route('/api/paths/batch', methods=['POST'])
+@handle_api_errors
+def plan_paths_batch():
+    """批量路径规划，结果与请求顺序一致"""
+    data = request.get_json()
     
+    is_valid, error_msg = validate_required_fields(data, ['requests'])
+    if not is_valid:
+        return jsonify({'success': False, 'message': error_msg}), 400
+    if not isinstance(data['requests'], list) or not data['requests']:
+        return jsonify({'success': False, 'message': 'requests 必须是非空数组'}), 400
+    if len(data['requests']) > MAX_BATCH_PATHS:
+        return jsonify({'success': False, 'message': f'单次最多规划 {MAX_BATCH_PATHS} 条路径'}), 400
+    algorithm = data.get('algorithm', 'astar')
+    if algorithm not in PathPlanner.ALGORITHMS:
+        return jsonify({
+            'success': False,
+            'message': f"无效的路径规划算法，可选值: {', '.join(PathPlanner.ALGORITHMS)}"
+        }), 400
+    
+    try:
+        queries = [
+            (Position(int(item['start_x']), int(item['start_y'])),
+             Position(int(item['target_x']), int(item['target_y'])))
+            for item in data['requests']
+        ]
+    except KeyError as e:
+        return jsonify({'success': False, 'message': f'路径请求缺少字段: {str(e)}'}), 400
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'message': f'坐标数据错误: {str(e)}'}), 400
+    
+    planner = tms_system.path_planner
+    paths = planner.plan_many(queries, algorithm=algorithm)
+    results = [
+        {
+            'found': bool(path),
+            'path': [{'x': pos.x, 'y': pos.y} for pos in path],
+            'path_cost': planner.path_cost(path) if path else None
+        }
+        for path in paths
+    ]
+    found = sum(1 for result in results if result['found'])
     return jsonify({
         'success': True,
-        'data': tasks_data,
-        'count': len(tasks_data)
+        'message': f'规划完成，{found}/{len(results)} 条路径可达',
+        'data': results
     })
 
+# 任务管理API
+@app.route('/api/tasks', methods=['GET'])
+@handle_api_errors
+def get_tasks():
+    """分页获取任务（按创建时间升序）
+    
+    筛选参数: status、type、warehouse_id（内转任务的源库或目标库）、equipment_id、
+    created_from、created_to（ISO时间），由任务仓库的索引提供；fields 指定返回的字段。
+    """
+    try:
+        limit, after, fields = parse_page_args()
+        if after is not None:
+            if not (isinstance(after, list) and len(after) == 2
+                    and isinstance(after[0], (int, float)) and isinstance(after[1], str)):
+                raise PayloadError("无效的分页游标")
+            after = (float(after[0]), after[1])
+        if limit is None:
+            limit = max(len(tms_system.tasks), 1)
+        tasks, next_key = tms_system.tasks.query(after=after, limit=limit, **parse_task_filters())
+    except PayloadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    tasks_data = {task.id: serialize_task(task, fields) for task in tasks}
+    return page_response(tasks_data, encode_cursor(next_key) if next_key else None)
+
 @app.route('/api/tasks/ship-transport', methods=['POST'])
 @handle_api_errors
 def create_ship_transport_task():
@@ -649,10 +1108,26 @@ def assign_task_equipment(task_id):
 @app.route('/api/tasks/<task_id>/execute', methods=['POST'])
 @handle_api_errors
 def execute_task(task_id):
-    """执行任务"""
+    """执行任务
+    
+    请求体为 ``{"async": true}``（或查询参数 ``async=true``）时提交到执行线程池，
+    立即返回202和执行句柄，之后通过 ``/api/executions/<execution_id>`` 查询状态。
+    """
     if task_id not in tms_system.tasks:
         return jsonify({'success': False, 'message': '任务不存在'}), 404
     
+    data = request.get_json(silent=True) or {}
+    if data.get('async') or request.args.get('async', 'false').lower() == 'true':
+        try:
+            handle = tms_system.submit_task_execution(task_id)
+        except (ValueError, RuntimeError) as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        return jsonify({
+            'success': True,
+            'message': '任务已提交执行',
+            'data': handle.to_dict()
+        }), 202
+    
     success = tms_system.execute_task(task_id)
     
     if success:
@@ -667,18 +1142,59 @@ def execute_task(task_id):
     else:
         return jsonify({'success': False, 'message': '任务执行失败'}), 400
 
+# 异步执行API
+# 查询执行状态时最长的等待秒数
+MAX_EXECUTION_WAIT = 30.0
+
+@app.route('/api/executions', methods=['GET'])
+@handle_api_errors
+def get_executions_summary():
+    """获取执行线程池的统计"""
+    return jsonify({
+        'success': True,
+        'data': tms_system.task_executor.summary()
+    })
+
+@app.route('/api/executions/<execution_id>', methods=['GET', 'DELETE'])
+@handle_api_errors
+def execution_status(execution_id):
+    """查询执行状态（GET，可用 wait=秒数 等待结束）或取消排队中的执行（DELETE）"""
+    executor = tms_system.task_executor
+    handle = executor.get(execution_id)
+    if handle is None:
+        return jsonify({'success': False, 'message': '执行记录不存在'}), 404
+    
+    if request.method == 'DELETE':
+        if not executor.cancel(execution_id):
+            return jsonify({'success': False, 'message': '执行已开始或已结束，无法取消'}), 400
+        return jsonify({'success': True, 'message': '执行已取消', 'data': handle.to_dict()})
+    
+    try:
+        wait = min(float(request.args.get('wait', 0)), MAX_EXECUTION_WAIT)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'wait 必须是数字'}), 400
+    if wait > 0:
+        handle.wait(wait)
+    return jsonify({'success': True, 'data': handle.to_dict()})
+
 @app.route('/api/tasks/schedule/optimize', methods=['POST'])
 @handle_api_errors
 def optimize_task_schedule():
-    """优化任务调度"""
-    schedule = tms_system.optimize_task_schedule()
+    """优化任务调度（可选参数 mode: greedy 或 optimal）"""
+    data = request.get_json(silent=True) or {}
+    mode = data.get('mode', request.args.get('mode', 'greedy'))
+    if mode not in tms_system.SCHEDULE_MODES:
+        return jsonify({'success': False, 'message': f"调度模式必须为 {' 或 '.join(tms_system.SCHEDULE_MODES)}"}), 400
+    
+    schedule = tms_system.optimize_task_schedule(mode=mode)
     
     return jsonify({
         'success': True,
         'message': '任务调度优化完成',
         'data': {
             'optimized_schedule': schedule,
-            'total_tasks': len(schedule)
+            'total_tasks': len(schedule),
+            'mode': mode
         }
     })
 
@@ -699,8 +1215,8 @@ def get_system_report():
 @handle_api_errors
 def get_performance_report():
     """获取性能报告"""
-    completed_tasks = [t for t in tms_system.tasks.values() if t.status == TaskStatus.COMPLETED]
-    failed_tasks = [t for t in tms_system.tasks.values() if t.status == TaskStatus.FAILED]
+    completed_tasks = tms_system.tasks.with_status(TaskStatus.COMPLETED)
+    failed_count = tms_system.tasks.count(TaskStatus.FAILED)
     
     # 计算平均执行时间
     total_execution_time = 0
@@ -710,18 +1226,15 @@ def get_performance_report():
     
     avg_execution_time = total_execution_time / len(completed_tasks) if completed_tasks else 0
     
-    # 按任务类型统计
+    # 按任务类型统计（来自任务仓库维护的计数）
     task_type_stats = {}
-    for task in tms_system.tasks.values():
-        task_type = task.task_type.value
-        if task_type not in task_type_stats:
-            task_type_stats[task_type] = {'total': 0, 'completed': 0, 'failed': 0}
-        
-        task_type_stats[task_type]['total'] += 1
-        if task.status == TaskStatus.COMPLETED:
-            task_type_stats[task_type]['completed'] += 1
-        elif task.status == TaskStatus.FAILED:
-            task_type_stats[task_type]['failed'] += 1
+    for (task_type, status), count in tms_system.tasks.type_status_counts().items():
+        stats = task_type_stats.setdefault(task_type.value, {'total': 0, 'completed': 0, 'failed': 0})
+        stats['total'] += count
+        if status == TaskStatus.COMPLETED:
+            stats['completed'] += count
+        elif status == TaskStatus.FAILED:
+            stats['failed'] += count
     
     return jsonify({
         'success': True,
@@ -729,7 +1242,7 @@ def get_performance_report():
             'summary': {
                 'total_tasks': len(tms_system.tasks),
                 'completed_tasks': len(completed_tasks),
-                'failed_tasks': len(failed_tasks),
+                'failed_tasks': failed_count,
                 'success_rate': len(completed_tasks) / len(tms_system.tasks) * 100 if tms_system.tasks else 0,
                 'average_execution_time': avg_execution_time
             },
@@ -767,6 +1280,148 @@ def get_execution_logs():
         }
     })
 
+# 流式导出：记录由生成器逐批产生并分块发送（chunked），内存占用与记录总数无关
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+# 每块包含的记录数，也是从内存索引中每次取出的任务数
+EXPORT_BATCH_SIZE = 500
+
+def encode_ndjson(records: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """把记录编码为NDJSON（每行一个JSON对象），每 EXPORT_BATCH_SIZE 条输出一块"""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, ensure_ascii=False, default=str))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def _csv_cell(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return '' if value is None else value
+
+def encode_csv(records: Iterable[Dict[str, Any]], columns: List[str]) -> Iterator[str]:
+    """把记录编码为CSV（首行为列名，嵌套的值编码为JSON字符串），每 EXPORT_BATCH_SIZE 条输出一块"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for count, record in enumerate(records, 1):
+        writer.writerow([_csv_cell(record.get(column)) for column in columns])
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def parse_export_args() -> Tuple[str, str]:
+    """解析 format（ndjson/csv）和 source（memory/db）参数"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        raise PayloadError("format 必须是 ndjson 或 csv")
+    source = request.args.get('source', 'memory')
+    if source not in ('memory', 'db'):
+        raise PayloadError("source 必须是 memory 或 db")
+    return export_format, source
+
+def export_response(name: str, export_format: str, records: Iterable[Dict[str, Any]], columns: List[str]):
+    """以流式响应返回记录，不设置Content-Length，由服务器分块传输"""
+    if export_format == 'csv':
+        body = encode_csv(records, columns)
+    else:
+        body = encode_ndjson(records)
+    response = Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{export_format}'
+    return response
+
+def iter_task_pages(filters: Dict[str, Any]) -> Iterator:
+    """按分页游标逐批读取任务，每批只在查询期间持有任务仓库的锁"""
+    after = None
+    while True:
+        tasks, after = tms_system.tasks.query(after=after, limit=EXPORT_BATCH_SIZE, **filters)
+        yield from tasks
+        if after is None:
+            return
+
+@app.route('/api/export/tasks', methods=['GET'])
+@handle_api_errors
+def export_tasks():
+    """流式导出任务
+    
+    source=memory（默认）按创建时间顺序从任务仓库的索引中逐批取出，支持与 /api/tasks 相同的筛选和 fields；
+    source=db 用数据库游标逐行读取已持久化的任务，只支持 status 和 type 筛选。
+    """
+    try:
+        export_format, source = parse_export_args()
+        filters = parse_task_filters()
+        fields = request.args.get('fields')
+        fields = [name.strip() for name in fields.split(',') if name.strip()] if fields else None
+        if source == 'db' and any(value is not None for key, value in filters.items()
+                                  if key not in ('status', 'task_type')):
+            raise PayloadError("从数据库导出只支持 status 和 type 筛选")
+    except PayloadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    if source == 'db':
+        tasks = tms_system.iter_persisted_tasks(filters['status'], filters['task_type'])
+    else:
+        tasks = iter_task_pages(filters)
+    records = (serialize_task(task, fields) for task in tasks)
+    columns = [name for name in (fields or TASK_FIELDS) if name in TASK_FIELDS]
+    return export_response('tasks', export_format, records, columns)
+
+def iter_inventory_records(warehouse_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """逐个仓库读取只读快照中的库存"""
+    warehouse_ids = [warehouse_id] if warehouse_id else list(tms_system.warehouses)
+    for wid in warehouse_ids:
+        warehouse = tms_system.warehouses.get(wid)
+        if warehouse is None:
+            continue
+        for product_id, quantity in warehouse.snapshot()['products'].items():
+            yield {'warehouse_id': wid, 'product_id': product_id, 'quantity': quantity}
+
+@app.route('/api/export/inventory', methods=['GET'])
+@handle_api_errors
+def export_inventory():
+    """流式导出库存（每行一个仓库中的一种产品），可按 warehouse_id 筛选；source=db 时读取数据库并包含最后更新时间"""
+    try:
+        export_format, source = parse_export_args()
+    except PayloadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    warehouse_id = request.args.get('warehouse_id')
+    
+    if source == 'db':
+        records = (
+            {'warehouse_id': wid, 'product_id': pid, 'quantity': quantity,
+             'last_updated': last_updated.isoformat() if last_updated else None}
+            for wid, pid, quantity, last_updated in tms_system.iter_persisted_inventory(warehouse_id)
+        )
+        columns = ['warehouse_id', 'product_id', 'quantity', 'last_updated']
+    else:
+        records = iter_inventory_records(warehouse_id)
+        columns = ['warehouse_id', 'product_id', 'quantity']
+    return export_response('inventory', export_format, records, columns)
+
+@app.route('/api/export/logs', methods=['GET'])
+@handle_api_errors
+def export_logs():
+    """流式导出执行日志，导出开始时的日志条数为上限，可用 offset 跳过已导出的部分"""
+    try:
+        export_format, _ = parse_export_args()
+        offset = int(request.args.get('offset', 0))
+    except PayloadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except ValueError:
+        return jsonify({'success': False, 'message': 'offset 必须是整数'}), 400
+    
+    log = tms_system.execution_log
+    records = (
+        {'index': index, 'message': log[index]}
+        for index in range(max(offset, 0), len(log))
+    )
+    return export_response('logs', export_format, records, ['index', 'message'])
+
 # 错误处理
 @app.errorhandler(404)
 def not_found(error):
@@ -850,8 +1505,9 @@ def initialize_demo_data():
 
 # 应用启动
 if __name__ == '__main__':
-    # 初始化演示数据
-    initialize_demo_data()
+    # 数据库中没有恢复出数据时初始化演示数据
+    if not get_tms_system().products:
+        initialize_demo_data()
     
     # 启动应用
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,374 @@
+"""
+TMS运输管理系统ASGI接口
+ASGI Interface for TMS
+
+在事件循环中接收和发送HTTP请求，路由和返回内容与 ``tms_api`` 完全相同：
+请求体读完后，Flask视图（数据库写入、路径规划等阻塞操作）在专用线程池中执行，
+响应再由事件循环发回客户端。慢客户端和长轮询连接只占用事件循环中的一个协程，不占用线程，
+因此单个进程可以同时保持数千个连接。
+
+除 ``tms_api`` 的全部接口外，另提供原生异步的长轮询接口：
+    GET /api/system/status/watch?since=<版本号>&timeout=<秒>
+系统状态版本号大于 since 时立即返回，否则等待状态变化或超时，返回内容与 /api/system/status 相同，
+当前版本号在响应头 X-TMS-State-Version 中。
+
+运行（需要安装 uvicorn 等ASGI服务器）:
+    uvicorn tms_asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import asyncio
+import contextvars
+import io
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional, Any, Callable
+from urllib.parse import parse_qs
+
+from tms_system import TMSSystem
+
+logger = logging.getLogger(__name__)
+
+JSON_HEADERS = [(b'content-type', b'application/json')]
+
+class TMSAsgiApp:
+    """把 ``tms_api`` 的Flask应用以ASGI方式提供服务"""
+    
+    WATCH_PATH = '/api/system/status/watch'
+    STATUS_PATH = '/api/system/status'
+    VERSION_HEADER = 'X-TMS-State-Version'
+    
+    def __init__(self, wsgi_app: Callable, get_tms: Callable[[], TMSSystem], max_workers: int = 32,
+                 max_body_size: int = 16 * 1024 * 1024, max_wait: float = 60.0,
+                 sync_interval: float = 1.0):
+        """
+        Args:
+            wsgi_app: 提供全部接口的WSGI应用（``tms_api.app``）
+            get_tms: 返回接口当前使用的系统实例（``tms_api.get_tms_system``）；每次使用时调用，
+                实例被重置接口替换后长轮询改为监听新实例的状态变更
+            max_workers: 执行视图的线程数，即同时执行的阻塞操作数上限
+            max_body_size: 请求体大小上限（字节），超过时返回413
+            max_wait: 长轮询的最长等待时间（秒）
+            sync_interval: 配置了共享状态存储时，有长轮询等待期间拉取其他进程修改的间隔（秒）
+        """
+        self.wsgi_app = wsgi_app
+        self.get_tms = get_tms
+        # 当前挂着状态变更监听者的系统实例
+        self._listening: Optional[TMSSystem] = None
+        self.max_workers = max_workers
+        self.max_body_size = max_body_size
+        self.max_wait = max_wait
+        self.sync_interval = sync_interval
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 状态变化时被置位并替换为新事件，所有长轮询等待同一个事件
+        self._changed: Optional[asyncio.Event] = None
+        self._wake_scheduled = False
+        self._waiters = 0
+        self._sync_task: Optional[asyncio.Task] = None
+    
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            self._start()
+            await self._handle_http(scope, receive, send)
+        else:
+            raise ValueError(f"不支持的连接类型: {scope['type']}")
+    
+    def _start(self):
+        """绑定事件循环并创建线程池（首次请求或服务启动时）"""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tms-asgi')
+        self._changed = asyncio.Event()
+    
+    def _stop(self):
+        if self._loop is None:
+            return
+        self._detach()
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._loop = None
+    
+    async def _lifespan(self, receive: Callable, send: Callable):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self._stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    
+    @property
+    def tms(self) -> TMSSystem:
+        """接口当前使用的系统实例"""
+        return self._current_tms()
+    
+    def _current_tms(self) -> TMSSystem:
+        """获取当前系统实例；实例被替换时把监听者移到新实例并唤醒长轮询重新比较版本号"""
+        tms = self.get_tms()
+        if tms is not self._listening and self._loop is not None:
+            self._detach()
+            tms.change_listeners.append(self._on_state_changed)
+            self._listening = tms
+            self._wake_waiters()
+        return tms
+    
+    def _detach(self):
+        if self._listening is not None:
+            if self._on_state_changed in self._listening.change_listeners:
+                self._listening.change_listeners.remove(self._on_state_changed)
+            self._listening = None
+    
+    def _on_state_changed(self, version: int):
+        """状态变更回调（在修改状态的线程中调用），把唤醒合并后转交事件循环"""
+        loop = self._loop
+        if loop is None or self._wake_scheduled:
+            return
+        self._wake_scheduled = True
+        try:
+            loop.call_soon_threadsafe(self._wake_waiters)
+        except RuntimeError:
+            # 事件循环已关闭
+            self._wake_scheduled = False
+    
+    def _wake_waiters(self):
+        self._wake_scheduled = False
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+    
+    async def _run_blocking(self, func: Callable, *args):
+        return await self._loop.run_in_executor(self._executor, func, *args)
+    
+    async def _handle_http(self, scope: Dict[str, Any], receive: Callable, send: Callable):
+        body = await self._read_body(receive, send)
+        if body is None:
+            return
+        
+        if scope['path'] == self.WATCH_PATH and scope['method'] in ('GET', 'HEAD'):
+            await self._watch_status(scope, receive, send)
+            return
+        await self._dispatch(scope, body, send)
+        # 请求可能替换了系统实例（重置接口），及时让等待中的长轮询改为监听新实例
+        if self._waiters:
+            self._current_tms()
+    
+    async def _read_body(self, receive: Callable, send: Callable) -> Optional[bytes]:
+        """读取完整的请求体
+        
+        超过大小上限时回复413并返回None；读完之前客户端断开时返回None，
+        不完整的请求体不交给应用处理（否则可能执行一个被截断的写操作）。
+        """
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_size:
+                await self._send_json(send, 413, {'success': False, 'message': '请求体过大'})
+                return None
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+    
+    async def _send_json(self, send: Callable, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': JSON_HEADERS + [(b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+    
+    async def _dispatch(self, scope: Dict[str, Any], body: bytes, send: Callable,
+                        extra_headers: Optional[List[Tuple[str, str]]] = None):
+        """在线程池中执行WSGI应用并发送响应；流式响应的每一块也在线程池中生成
+        
+        同一响应的各步可能由不同线程执行，因此都在同一个上下文中运行，
+        使Flask的请求上下文（``stream_with_context``）在生成各块时保持有效。
+        """
+        context = contextvars.copy_context()
+        status, headers, chunks, stream = await self._run_blocking(context.run, self._call_wsgi, scope, body)
+        headers = headers + (extra_headers or [])
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        })
+        if stream is None:
+            await send({'type': 'http.response.body', 'body': b''.join(chunks)})
+            return
+        try:
+            for chunk in chunks:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            while True:
+                chunk = await self._run_blocking(context.run, next, stream, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await self._run_blocking(context.run, stream.close)
+    
+    def _call_wsgi(self, scope: Dict[str, Any], body: bytes):
+        """调用WSGI应用，返回 (状态码, 响应头, 已生成的块, 尚未生成完的迭代器或None)
+        
+        带 Content-Length 的响应在这里一次生成完；没有长度的流式响应只生成第一块，
+        其余由调用方逐块取用，避免一次性占满内存。
+        """
+        response: Dict[str, Any] = {}
+        
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+        
+        result = self.wsgi_app(build_environ(scope, body), start_response)
+        iterator = iter(result)
+        chunks = []
+        try:
+            first = next(iterator, None)
+            if first is not None:
+                chunks.append(first)
+            if first is not None and not any(name.lower() == 'content-length' for name, _ in response['headers']):
+                return response['status'], response['headers'], chunks, _remaining(iterator, result)
+            chunks.extend(iterator)
+        except BaseException:
+            if hasattr(result, 'close'):
+                result.close()
+            raise
+        if hasattr(result, 'close'):
+            result.close()
+        return response['status'], response['headers'], chunks, None
+    
+    async def _watch_status(self, scope: Dict[str, Any], receive: Callable, send: Callable):
+        """长轮询：等待状态版本号超过 since 或超时，然后返回系统状态"""
+        params = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        try:
+            since = int(params.get('since', ['-1'])[0])
+            timeout = min(float(params.get('timeout', [str(self.max_wait)])[0]), self.max_wait)
+        except ValueError:
+            await self._send_json(send, 400, {'success': False, 'message': 'since 和 timeout 必须是数字'})
+            return
+        
+        if self.tms.change_version <= since and timeout > 0:
+            self._waiters += 1
+            self._ensure_sync_task()
+            try:
+                await self._wait_for_change(since, timeout, receive)
+            finally:
+                self._waiters -= 1
+        
+        version = self.tms.change_version
+        status_scope = dict(scope, path=self.STATUS_PATH, raw_path=self.STATUS_PATH.encode(), query_string=b'')
+        await self._dispatch(status_scope, b'', send, [(self.VERSION_HEADER, str(version))])
+    
+    async def _wait_for_change(self, since: int, timeout: float, receive: Callable):
+        """等待版本号超过 since、超时或客户端断开"""
+        deadline = self._loop.time() + timeout
+        disconnect = asyncio.ensure_future(receive())
+        try:
+            while self.tms.change_version <= since:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    return
+                changed = asyncio.ensure_future(self._changed.wait())
+                done, _ = await asyncio.wait({changed, disconnect}, timeout=remaining,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                changed.cancel()
+                if disconnect in done:
+                    return
+        finally:
+            disconnect.cancel()
+    
+    def _ensure_sync_task(self):
+        """配置了共享状态存储时，有长轮询等待期间定期拉取其他进程的修改"""
+        if self.tms.state_sync is None or (self._sync_task is not None and not self._sync_task.done()):
+            return
+        self._sync_task = self._loop.create_task(self._sync_while_waiting())
+    
+    async def _sync_while_waiting(self):
+        while self._waiters > 0:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self._run_blocking(self.tms.sync_state)
+            except Exception as e:
+                logger.error(f"同步共享状态失败: {e}")
+
+def _remaining(iterator, result):
+    """尚未生成完的响应块，关闭时同时关闭WSGI应用返回的对象"""
+    try:
+        yield from iterator
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+def build_environ(scope: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+    """按PEP 3333由ASGI的HTTP连接信息构造WSGI环境"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'] = client[0]
+        environ['REMOTE_PORT'] = str(client[1])
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+def create_app(max_workers: Optional[int] = None) -> TMSAsgiApp:
+    """用 ``tms_api`` 中的Flask应用创建ASGI应用，线程数可由 TMS_ASGI_WORKERS 设置
+    
+    系统实例不在这里创建，而是在首次请求时由 ``tms_api.get_tms_system`` 创建，
+    导入本模块（包括进程池的工作进程重新执行启动脚本时）不会构造 TMSSystem。
+    """
+    import tms_api
+    workers = max_workers or int(os.environ.get('TMS_ASGI_WORKERS', 32))
+    return TMSAsgiApp(tms_api.app, tms_api.get_tms_system, max_workers=workers)
+
+app = create_app()
+
+if __name__ == '__main__':
+    import tms_api
+    
+    if not tms_api.tms_system.products:
+        tms_api.initialize_demo_data()
+    try:
+        import uvicorn
+    except ImportError:
+        logger.error("运行ASGI接口需要安装 uvicorn: pip install uvicorn")
+        sys.exit(1)
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
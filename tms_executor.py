@@ -0,0 +1,241 @@
+"""
+TMS异步任务执行模块
+Asynchronous Task Execution Module
+
+任务提交到线程池后立即返回执行句柄，调用方可以轮询状态、等待完成或注册完成回调。
+同一设备上的任务按提交顺序依次执行（设备独占），不同设备的任务并发执行。
+"""
+
+import logging
+import threading
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+from typing import List, Dict, Optional, Any, Callable
+
+from tms_system import TMSSystem
+
+logger = logging.getLogger(__name__)
+
+class ExecutionHandle:
+    """一次任务执行的句柄"""
+    
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    
+    def __init__(self, task_id: str, equipment_id: Optional[str]):
+        self.id = f"X{uuid.uuid4().hex[:12].upper()}"
+        self.task_id = task_id
+        self.equipment_id = equipment_id
+        self.status = self.QUEUED
+        self.error: Optional[str] = None
+        self.submitted_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[['ExecutionHandle'], None]] = []
+    
+    def done(self) -> bool:
+        return self._done.is_set()
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待执行结束，超时返回False"""
+        return self._done.wait(timeout)
+    
+    def add_done_callback(self, callback: Callable[['ExecutionHandle'], None]):
+        """注册完成回调；已经结束时立即在当前线程调用"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        _run_callback(callback, self)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'execution_id': self.id,
+            'task_id': self.task_id,
+            'equipment_id': self.equipment_id,
+            'status': self.status,
+            'error': self.error,
+            'submitted_at': self.submitted_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def _finish(self, status: str, error: Optional[str] = None):
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.finished_at = datetime.now()
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            _run_callback(callback, self)
+
+def _run_callback(callback: Callable[[ExecutionHandle], None], handle: ExecutionHandle):
+    try:
+        callback(handle)
+    except Exception as e:
+        logger.error(f"执行 {handle.id} 的完成回调出错: {e}")
+
+class TaskExecutor:
+    """任务执行线程池
+    
+    每台设备维护一个先进先出的等待队列，同一时刻只有一个该设备的任务在线程池中执行，
+    它结束后再提交队列中的下一个；未分配设备的任务直接提交。
+    TMSSystem 本身是线程安全的（按任务、设备和仓库分别加锁），不同设备的任务真正并发执行；
+    传入 ``system_lock`` 时每次执行都持有它，可用于让执行与调用方的其他操作互斥。
+    已结束的句柄最多保留 ``history_size`` 个，超出时淘汰最早的。
+    """
+    
+    def __init__(self, tms: TMSSystem, max_workers: int = 8, history_size: int = 10000,
+                 system_lock: Optional[threading.RLock] = None):
+        self.tms = tms
+        self.max_workers = max_workers
+        self.history_size = history_size
+        self.system_lock = system_lock
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tms-exec")
+        self._lock = threading.Lock()
+        self._handles: "OrderedDict[str, ExecutionHandle]" = OrderedDict()
+        self._active_by_task: Dict[str, ExecutionHandle] = {}
+        self._equipment_queues: Dict[str, deque] = {}  # 设备ID -> 等待中的句柄（不含正在执行的）
+        self._busy_equipment: set = set()
+        self._closed = False
+        self.stats = {'submitted': 0, 'succeeded': 0, 'failed': 0, 'cancelled': 0}
+    
+    def submit(self, task_id: str,
+               callback: Optional[Callable[[ExecutionHandle], None]] = None) -> ExecutionHandle:
+        """提交任务执行，立即返回句柄"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("执行器已关闭")
+            task = self.tms.tasks.get(task_id)
+            if task is None:
+                raise ValueError(f"任务不存在: {task_id}")
+            if task_id in self._active_by_task:
+                raise ValueError(f"任务 {task_id} 已在执行队列中")
+            
+            handle = ExecutionHandle(task_id, task.assigned_equipment)
+            if callback is not None:
+                handle.add_done_callback(callback)
+            self._handles[handle.id] = handle
+            self._active_by_task[task_id] = handle
+            self.stats['submitted'] += 1
+            
+            equipment_id = handle.equipment_id
+            if equipment_id is None:
+                self._pool.submit(self._run, handle)
+            elif equipment_id in self._busy_equipment:
+                self._equipment_queues.setdefault(equipment_id, deque()).append(handle)
+            else:
+                self._busy_equipment.add(equipment_id)
+                self._pool.submit(self._run, handle)
+            self._trim_history()
+        return handle
+    
+    def get(self, execution_id: str) -> Optional[ExecutionHandle]:
+        """按执行ID查找句柄"""
+        return self._handles.get(execution_id)
+    
+    def handle_for_task(self, task_id: str) -> Optional[ExecutionHandle]:
+        """任务当前（未结束）的执行句柄"""
+        return self._active_by_task.get(task_id)
+    
+    def cancel(self, execution_id: str) -> bool:
+        """取消仍在设备队列中等待的执行，已开始的执行不能取消"""
+        with self._lock:
+            handle = self._handles.get(execution_id)
+            if handle is None or handle.status != ExecutionHandle.QUEUED:
+                return False
+            queue = self._equipment_queues.get(handle.equipment_id)
+            if queue is None or handle not in queue:
+                return False
+            queue.remove(handle)
+            self._active_by_task.pop(handle.task_id, None)
+            self.stats['cancelled'] += 1
+        handle._finish(ExecutionHandle.CANCELLED)
+        return True
+    
+    def summary(self) -> Dict[str, Any]:
+        """执行器统计：累计计数、当前排队和执行中的数量"""
+        with self._lock:
+            running = sum(1 for handle in self._active_by_task.values()
+                          if handle.status == ExecutionHandle.RUNNING)
+            return dict(
+                self.stats,
+                active=len(self._active_by_task),
+                running=running,
+                queued=len(self._active_by_task) - running,
+                busy_equipment=len(self._busy_equipment),
+                max_workers=self.max_workers
+            )
+    
+    def shutdown(self, wait: bool = True):
+        """停止接受新任务；wait=True 时等待已提交的执行全部结束，否则取消设备队列中尚未开始的执行"""
+        with self._lock:
+            self._closed = True
+            cancelled = []
+            if not wait:
+                for queue in self._equipment_queues.values():
+                    cancelled.extend(queue)
+                    queue.clear()
+                for handle in cancelled:
+                    self._active_by_task.pop(handle.task_id, None)
+                self.stats['cancelled'] += len(cancelled)
+        for handle in cancelled:
+            handle._finish(ExecutionHandle.CANCELLED)
+        if wait:
+            for handle in list(self._active_by_task.values()):
+                handle.wait()
+        self._pool.shutdown(wait=wait)
+    
+    def _run(self, handle: ExecutionHandle):
+        handle.status = ExecutionHandle.RUNNING
+        handle.started_at = datetime.now()
+        status, error = ExecutionHandle.FAILED, None
+        try:
+            with self.system_lock or nullcontext():
+                success = self.tms.execute_task(handle.task_id)
+            if success:
+                status = ExecutionHandle.SUCCEEDED
+            else:
+                error = self.tms.tasks[handle.task_id].metadata.get('failure_reason', '任务执行失败')
+        except Exception as e:
+            error = str(e)
+            logger.error(f"执行 {handle.id}（任务 {handle.task_id}）出错: {e}")
+        
+        with self._lock:
+            self._active_by_task.pop(handle.task_id, None)
+            self.stats['succeeded' if status == ExecutionHandle.SUCCEEDED else 'failed'] += 1
+            next_handle = self._next_for_equipment(handle.equipment_id)
+            if next_handle is not None:
+                self._pool.submit(self._run, next_handle)
+        handle._finish(status, error)
+    
+    def _next_for_equipment(self, equipment_id: Optional[str]) -> Optional[ExecutionHandle]:
+        """设备的上一个任务结束后取出队列中的下一个，队列为空时释放设备"""
+        if equipment_id is None:
+            return None
+        queue = self._equipment_queues.get(equipment_id)
+        if queue:
+            return queue.popleft()
+        self._equipment_queues.pop(equipment_id, None)
+        self._busy_equipment.discard(equipment_id)
+        return None
+    
+    def _trim_history(self):
+        excess = len(self._handles) - self.history_size
+        if excess <= 0:
+            return
+        for execution_id in list(self._handles):
+            if excess <= 0:
+                break
+            if self._handles[execution_id].done():
+                del self._handles[execution_id]
+                excess -= 1
@@ -0,0 +1,290 @@
+"""
+TMS多车协同路径规划模块
+Multi-Agent Path Planning Module
+
+基于时空预约表的优先级规划（Cooperative A* / WHCA*）：按优先级依次为每台设备在
+(格子, 时刻) 空间上搜索路径并写入预约表，后规划的设备避开已预约的格子（顶点冲突）
+和对向交换的边（边冲突），到达终点后停靠在终点，之后的时刻也不允许其他设备经过。
+"""
+
+import heapq
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Dict, Tuple, Optional, Any
+
+import numpy as np
+
+from tms_system import PathPlanner, Position, grid_distance_field
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class MoveRequest:
+    """单台设备的移动请求"""
+    agent_id: str
+    start: Position
+    goal: Position
+
+@dataclass
+class MultiAgentPlan:
+    """一次（一个tick内）多车规划的结果"""
+    paths: Dict[str, List[Position]] = field(default_factory=dict)  # 每个时刻一个位置，等待时位置重复
+    failed: List[str] = field(default_factory=list)  # 本次未能规划、原地不动的设备
+    expanded: int = 0
+    restarts: int = 0
+    planning_seconds: float = 0.0
+    
+    @property
+    def makespan(self) -> int:
+        """最后一台设备到达终点的时刻"""
+        return max((len(path) - 1 for path in self.paths.values()), default=0)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'paths': {
+                agent_id: [{'x': pos.x, 'y': pos.y} for pos in path]
+                for agent_id, path in self.paths.items()
+            },
+            'failed': list(self.failed),
+            'makespan': self.makespan,
+            'expanded': self.expanded,
+            'restarts': self.restarts,
+            'planning_seconds': self.planning_seconds
+        }
+
+class ReservationTable:
+    """时空预约表
+    
+    顶点预约 (格子, 时刻)，边预约 (起点格子, 终点格子, 出发时刻)，
+    停靠预约表示设备从某时刻起一直占用终点格子。
+    window 不为None时只检查前 window 个时刻的冲突（WHCA*），窗口之外视为无冲突。
+    """
+    
+    def __init__(self, window: Optional[int] = None):
+        self.window = window
+        self._vertices: Dict[Tuple[int, int], str] = {}
+        self._edges: Dict[Tuple[int, int, int], str] = {}
+        self._parked: Dict[int, Tuple[int, str]] = {}  # 格子 -> (开始停靠时刻, 设备)
+        self._last_time: Dict[int, int] = {}  # 格子最后一次被预约的时刻
+    
+    def vertex_free(self, cell: int, t: int, agent_id: str) -> bool:
+        """时刻t能否占用格子"""
+        if self.window is not None and t > self.window:
+            return True
+        owner = self._vertices.get((cell, t))
+        if owner is not None and owner != agent_id:
+            return False
+        parked = self._parked.get(cell)
+        return parked is None or parked[0] > t or parked[1] == agent_id
+    
+    def edge_free(self, from_cell: int, to_cell: int, t: int, agent_id: str) -> bool:
+        """时刻t从from_cell移动到to_cell是否与对向移动的设备交换位置"""
+        if self.window is not None and t >= self.window:
+            return True
+        owner = self._edges.get((to_cell, from_cell, t))
+        return owner is None or owner == agent_id
+    
+    def can_park(self, cell: int, t: int) -> bool:
+        """从时刻t起停靠在格子上，不会挡住之后经过该格子的设备"""
+        return t >= self.earliest_park(cell)
+    
+    def earliest_park(self, cell: int) -> int:
+        """最早可以开始停靠在格子上的时刻：该格子最后一次被其他设备占用之后"""
+        earliest = self._last_time[cell] + 1 if cell in self._last_time else 0
+        if self.window is not None:
+            return min(earliest, self.window)
+        return earliest
+    
+    def reserve(self, agent_id: str, cells: List[int], park: bool = True):
+        """预约一条按时刻排列的路径，park=True 时设备之后一直停在终点"""
+        for t, cell in enumerate(cells):
+            self._vertices[(cell, t)] = agent_id
+            if t > self._last_time.get(cell, -1):
+                self._last_time[cell] = t
+        for t in range(len(cells) - 1):
+            if cells[t] != cells[t + 1]:
+                self._edges[(cells[t], cells[t + 1], t)] = agent_id
+        if park:
+            self._parked[cells[-1]] = (len(cells) - 1, agent_id)
+    
+    def clear(self):
+        self._vertices.clear()
+        self._edges.clear()
+        self._parked.clear()
+        self._last_time.clear()
+
+class MultiAgentPlanner:
+    """优先级多车规划器
+    
+    按请求顺序（优先级从高到低）逐台规划。某台设备找不到路径时它只能原地不动，
+    于是把它作为静止设备加入预约表并重新规划其余设备，保证返回的全部路径两两无冲突。
+    启发函数是以终点为源、在静态网格上（遵守单行道方向）的BFS精确距离。
+    设备每个时刻沿4连通方向移动一格，通行代价不影响时刻，单行道限制照常生效。
+    """
+    
+    def __init__(self, path_planner: PathPlanner, max_delay: Optional[int] = None,
+                 window: Optional[int] = None, history_size: int = 1000):
+        self.path_planner = path_planner
+        # 相对最短路径允许的最大等待步数，默认取网格宽高之和
+        self.max_delay = max_delay if max_delay is not None else (
+            path_planner.grid_width + path_planner.grid_height)
+        # WHCA*窗口大小；为None时在完整时间范围内避免冲突
+        self.window = window
+        self.tick_history: deque = deque(maxlen=history_size)
+    
+    def plan(self, requests: List[MoveRequest]) -> MultiAgentPlan:
+        """为一批设备规划同一tick内互不冲突的路径"""
+        start_time = time.perf_counter()
+        planner = self.path_planner
+        
+        agent_ids = [request.agent_id for request in requests]
+        if len(set(agent_ids)) != len(agent_ids):
+            raise ValueError("同一设备在一次规划中只能出现一次")
+        for request in requests:
+            if not planner.in_bounds(request.start) or not planner.in_bounds(request.goal):
+                raise ValueError(f"设备 {request.agent_id} 的起点或终点超出网格范围")
+        starts = {request.agent_id: planner.encode(request.start) for request in requests}
+        goals = {request.agent_id: planner.encode(request.goal) for request in requests}
+        if len(set(starts.values())) != len(starts):
+            raise ValueError("多台设备的起点相同")
+        
+        # 参与规划的设备由预约表约束，它们的起点不再作为静态障碍
+        grid = planner.grid.copy()
+        grid.reshape(-1)[list(starts.values())] = 0
+        occupied = memoryview(grid.reshape(-1))
+        allowed = memoryview(planner.direction_mask.reshape(-1).copy())
+        fields: Dict[int, np.ndarray] = {}
+        
+        plan = MultiAgentPlan()
+        stationary = set()
+        for agent_id, goal in goals.items():
+            if occupied[goal]:
+                stationary.add(agent_id)
+                continue
+            if goal not in fields:
+                fields[goal] = grid_distance_field(grid, goal, planner.direction_mask)
+            if fields[goal][starts[agent_id]] < 0:
+                stationary.add(agent_id)
+        
+        while True:
+            table = ReservationTable(self.window)
+            for agent_id in stationary:
+                table.reserve(agent_id, [starts[agent_id]])
+            
+            cell_paths: Dict[str, List[int]] = {}
+            blocked_agent = None
+            for agent_id in agent_ids:
+                if agent_id in stationary:
+                    continue
+                cells, expanded = self._search(table, agent_id, starts[agent_id], goals[agent_id],
+                                               memoryview(fields[goals[agent_id]]), occupied, allowed)
+                plan.expanded += expanded
+                if cells is None:
+                    blocked_agent = agent_id
+                    break
+                table.reserve(agent_id, cells)
+                cell_paths[agent_id] = cells
+            
+            if blocked_agent is None:
+                break
+            stationary.add(blocked_agent)
+            plan.restarts += 1
+        
+        plan.paths = {
+            agent_id: [planner.decode(cell) for cell in cells]
+            for agent_id, cells in cell_paths.items()
+        }
+        plan.failed = [agent_id for agent_id in agent_ids if agent_id in stationary]
+        plan.planning_seconds = time.perf_counter() - start_time
+        self.tick_history.append({
+            'agents': len(requests),
+            'planned': len(plan.paths),
+            'failed': len(plan.failed),
+            'restarts': plan.restarts,
+            'expanded': plan.expanded,
+            'makespan': plan.makespan,
+            'planning_seconds': plan.planning_seconds
+        })
+        if plan.failed:
+            logger.warning(f"多车规划: {len(plan.failed)} 台设备本次无法规划，保持原地")
+        return plan
+    
+    def tick_stats(self) -> Dict[str, Any]:
+        """最近若干tick的规划耗时统计"""
+        durations = sorted(entry['planning_seconds'] for entry in self.tick_history)
+        if not durations:
+            return {'ticks': 0}
+        return {
+            'ticks': len(durations),
+            'mean_seconds': sum(durations) / len(durations),
+            'p50_seconds': durations[len(durations) // 2],
+            'max_seconds': durations[-1],
+            'last': self.tick_history[-1]
+        }
+    
+    def _search(self, table: ReservationTable, agent_id: str, start: int, goal: int,
+                distance: memoryview, occupied: memoryview,
+                allowed: memoryview) -> Tuple[Optional[List[int]], int]:
+        """时空A*：状态为 (格子, 时刻)，动作为四个方向移动（须为格子允许离开的方向）或原地等待，每步代价为1
+        
+        启发值为到终点的静态最短距离，并不小于终点最早可停靠时刻减去当前时刻。
+        """
+        width = self.path_planner.grid_width
+        height = self.path_planner.grid_height
+        limit = distance[start] + self.max_delay
+        # 终点在该时刻之前被其他设备占用，f值不小于该时刻
+        earliest = table.earliest_park(goal)
+        
+        start_f = max(distance[start], earliest)
+        # f相同时优先展开时刻更晚的状态：等待终点空出时沿时间方向推进，而不是在终点周围横向铺开
+        open_set = [(start_f, 0, distance[start], start)]
+        came_from: Dict[Tuple[int, int], Optional[Tuple[int, int]]] = {(start, 0): None}
+        closed = set()
+        heappush, heappop = heapq.heappush, heapq.heappop
+        expanded = 0
+        # (方向位, dx, dy)，原地等待总是允许
+        moves = ((PathPlanner.ALL_DIRECTIONS, 0, 0),) + tuple(
+            (1 << i, dx, dy) for i, (dx, dy) in enumerate(PathPlanner.DIRECTIONS))
+        
+        while open_set:
+            _, negative_t, _, cell = heappop(open_set)
+            t = -negative_t
+            if (cell, t) in closed:
+                continue
+            closed.add((cell, t))
+            expanded += 1
+            
+            if cell == goal and table.can_park(cell, t):
+                cells = []
+                state = (cell, t)
+                while state is not None:
+                    cells.append(state[0])
+                    state = came_from[state]
+                cells.reverse()
+                return cells, expanded
+            if t >= limit:
+                continue
+            
+            x, y = cell % width, cell // width
+            next_t = t + 1
+            for bit, dx, dy in moves:
+                nx, ny = x + dx, y + dy
+                if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                    continue
+                if not allowed[cell] & bit:
+                    continue
+                neighbor = ny * width + nx
+                h = distance[neighbor]
+                if h < 0 or occupied[neighbor] or (neighbor, next_t) in came_from:
+                    continue
+                if not table.vertex_free(neighbor, next_t, agent_id):
+                    continue
+                if neighbor != cell and not table.edge_free(cell, neighbor, t, agent_id):
+                    continue
+                came_from[(neighbor, next_t)] = (cell, t)
+                f = next_t + h
+                heappush(open_set, (f if f > earliest else earliest, -next_t, h, neighbor))
+        
+        return None, expanded
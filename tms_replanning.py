@@ -0,0 +1,264 @@
+"""
+TMS增量路径重规划模块
+Incremental Replanning Module
+
+基于D* Lite的增量路径规划：每条进行中的路线保留自己的搜索状态（g/rhs值和优先队列），
+障碍物变化时只修复受影响的格子，车辆前进后沿用已有的搜索结果，
+重规划的开销取决于变化的规模而不是网格的大小。
+"""
+
+import heapq
+import logging
+import math
+from typing import List, Dict, Tuple, Optional, Any
+
+from tms_system import PathPlanner, Position
+
+logger = logging.getLogger(__name__)
+
+INFINITY = float('inf')
+# 键值保留的小数位数：对角代价为无理数，累加误差会让本应相等的键相差一个ulp，
+# 导致终止条件提前成立、与起点键相同的格子没有展开
+KEY_DIGITS = 9
+
+class DStarLite:
+    """单条路线的D* Lite搜索状态
+    
+    从终点向起点反向搜索，g(s) 为格子s到终点的距离估计，rhs(s) 为基于邻居g值的一步前瞻。
+    移动代价与 ``PathPlanner.step_cost`` 一致（通行代价、方向限制、8连通切角），
+    进入障碍格子为无穷大；车辆当前所在格子本身可以是障碍（设备位置在路径规划网格中登记为障碍）。
+    启发函数为路线创建时的最小通行代价乘以曼哈顿/八方向距离；之后最小通行代价变小时
+    启发函数可能不再可采纳，此时丢弃搜索状态重新开始。
+    """
+    
+    def __init__(self, planner: PathPlanner, start: Position, goal: Position):
+        if not planner.in_bounds(start) or not planner.in_bounds(goal):
+            raise ValueError("起点或终点超出网格范围")
+        self.planner = planner
+        self.width = planner.grid_width
+        self.height = planner.grid_height
+        self._occupied = memoryview(planner.grid.reshape(-1))
+        self._costs = memoryview(planner.cost_grid.reshape(-1))
+        self._masks = memoryview(planner.direction_mask.reshape(-1))
+        self._moves = planner.moves()
+        self._octile = planner.connectivity == 8
+        self.start = planner.encode(start)
+        self.goal = planner.encode(goal)
+        self._changed: set = set()
+        self.stats = {'replans': 0, 'expanded': 0, 'last_expanded': 0, 'changed_cells': 0, 'resets': 0}
+        self._reset()
+    
+    def _reset(self):
+        """清空搜索状态，从终点重新开始"""
+        self._h_scale = self.planner.min_cost
+        self._last = self.start
+        self._km = 0
+        self._g: Dict[int, float] = {}
+        self._rhs: Dict[int, float] = {self.goal: 0}
+        self._queue: List[Tuple[float, float, int]] = []
+        self._queued: Dict[int, Tuple[float, float]] = {}  # 格子 -> 当前有效的键
+        self._changed.clear()
+        self._push(self.goal)
+    
+    def cell_changed(self, cell: int):
+        """记录一个通行状态发生变化的格子，下次获取路径时修复"""
+        self._changed.add(cell)
+    
+    def move_start(self, position: Position):
+        """车辆前进到新位置，后续路径从该位置开始"""
+        if not self.planner.in_bounds(position):
+            raise ValueError(f"位置 {position} 超出网格范围")
+        self.start = self.planner.encode(position)
+    
+    def path(self) -> List[Position]:
+        """修复搜索状态并返回从当前起点到终点的路径，不可达时返回空列表"""
+        if self.planner.min_cost < self._h_scale:
+            self._reset()
+            self.stats['resets'] += 1
+        if self.start != self._last:
+            # 车辆移动过后，已入队的键整体偏移 km，无需重建优先队列；每次搜索前都要偏移，
+            # 即使没有格子变化：否则起点离开原路径时队列中的键是过期的高估，搜索会过早终止
+            self._km += self._heuristic(self._last, self.start)
+            self._last = self.start
+        self._apply_changes()
+        if self._occupied[self.goal]:
+            return []
+        self._compute_shortest_path()
+        if self._g.get(self.start, INFINITY) == INFINITY:
+            return []
+        
+        cells = [self.start]
+        current = self.start
+        for _ in range(self.width * self.height):
+            if current == self.goal:
+                return [self.planner.decode(cell) for cell in cells]
+            best, best_cost = None, INFINITY
+            for neighbor, step in self._successors(current):
+                cost = step + self._g.get(neighbor, INFINITY)
+                if cost < best_cost:
+                    best, best_cost = neighbor, cost
+            if best is None:
+                return []
+            current = best
+            cells.append(current)
+        return []
+    
+    def distance(self) -> Optional[float]:
+        """当前起点到终点的最短路径代价（均匀网格上为步数），不可达时返回None"""
+        path = self.path()
+        return self._g[self.start] if path else None
+    
+    def _apply_changes(self):
+        if not self._changed:
+            return
+        for cell in self._changed:
+            # 格子的障碍/代价影响进入它的边（邻居的rhs，8连通时还有经过它旁边的对角边），
+            # 方向限制影响离开它的边（自身的rhs）
+            self._update_vertex(cell)
+            for neighbor in self._neighbors(cell):
+                self._update_vertex(neighbor)
+        self.stats['changed_cells'] += len(self._changed)
+        self._changed.clear()
+    
+    def _compute_shortest_path(self):
+        queue = self._queue
+        g, rhs = self._g, self._rhs
+        start = self.start
+        expanded = 0
+        
+        while True:
+            top = self._top()
+            if top is None:
+                break
+            start_key = self._key(start)
+            if top >= start_key and rhs.get(start, INFINITY) == g.get(start, INFINITY):
+                break
+            
+            k1, k2, cell = heapq.heappop(queue)
+            del self._queued[cell]
+            new_key = self._key(cell)
+            if (k1, k2) < new_key:
+                self._push(cell, new_key)
+                continue
+            
+            expanded += 1
+            if g.get(cell, INFINITY) > rhs.get(cell, INFINITY):
+                g[cell] = rhs[cell]
+                for neighbor in self._neighbors(cell):
+                    self._update_vertex(neighbor)
+            else:
+                g[cell] = INFINITY
+                self._update_vertex(cell)
+                for neighbor in self._neighbors(cell):
+                    self._update_vertex(neighbor)
+        
+        self.stats['replans'] += 1
+        self.stats['expanded'] += expanded
+        self.stats['last_expanded'] = expanded
+    
+    def _update_vertex(self, cell: int):
+        if cell != self.goal:
+            g = self._g
+            best = INFINITY
+            for neighbor, step in self._successors(cell):
+                cost = g.get(neighbor, INFINITY) + step
+                if cost < best:
+                    best = cost
+            self._rhs[cell] = best
+        self._queued.pop(cell, None)
+        if self._g.get(cell, INFINITY) != self._rhs.get(cell, INFINITY):
+            self._push(cell)
+    
+    def _push(self, cell: int, key: Optional[Tuple[float, float]] = None):
+        key = key or self._key(cell)
+        self._queued[cell] = key
+        heapq.heappush(self._queue, (key[0], key[1], cell))
+    
+    def _top(self) -> Optional[Tuple[float, float]]:
+        """队首的有效键；过期的队列项（已更新或已移除）在这里丢弃"""
+        queue = self._queue
+        while queue:
+            k1, k2, cell = queue[0]
+            if self._queued.get(cell) == (k1, k2):
+                return (k1, k2)
+            heapq.heappop(queue)
+        return None
+    
+    def _key(self, cell: int) -> Tuple[float, float]:
+        value = min(self._g.get(cell, INFINITY), self._rhs.get(cell, INFINITY))
+        return (round(value + self._heuristic(self.start, cell) + self._km, KEY_DIGITS),
+                round(value, KEY_DIGITS))
+    
+    def _heuristic(self, a: int, b: int) -> float:
+        width = self.width
+        dx, dy = abs(a % width - b % width), abs(a // width - b // width)
+        if self._octile:
+            return self._h_scale * (max(dx, dy) + (math.sqrt(2) - 1) * min(dx, dy))
+        return self._h_scale * (dx + dy)
+    
+    def _successors(self, cell: int) -> List[Tuple[int, float]]:
+        """可以一步到达的邻居及移动代价"""
+        width, height = self.width, self.height
+        occupied = self._occupied
+        x, y = cell % width, cell // width
+        mask = self._masks[cell]
+        successors = []
+        for dx, dy, bit, length in self._moves:
+            nx, ny = x + dx, y + dy
+            if not mask & bit or nx < 0 or ny < 0 or nx >= width or ny >= height:
+                continue
+            neighbor = ny * width + nx
+            if occupied[neighbor]:
+                continue
+            if dx and dy and (occupied[y * width + nx] or occupied[ny * width + x]):
+                continue
+            successors.append((neighbor, length * self._costs[neighbor]))
+        return successors
+    
+    def _neighbors(self, cell: int) -> List[int]:
+        """全部相邻格子（rhs可能依赖该格子g值的前驱的超集）"""
+        width, height = self.width, self.height
+        x, y = cell % width, cell // width
+        return [(y + dy) * width + (x + dx) for dx, dy, _, _ in self._moves
+                if 0 <= x + dx < width and 0 <= y + dy < height]
+
+class IncrementalReplanner:
+    """管理多条进行中的路线，把路径规划网格的障碍物变化转发给每条路线"""
+    
+    def __init__(self, planner: PathPlanner):
+        self.planner = planner
+        self.routes: Dict[str, DStarLite] = {}
+        planner.obstacle_listeners.append(self._on_obstacle_changed)
+    
+    def open_route(self, route_id: str, start: Position, goal: Position) -> List[Position]:
+        """开始跟踪一条路线（同ID的旧路线被替换），返回初始路径"""
+        route = DStarLite(self.planner, start, goal)
+        self.routes[route_id] = route
+        return route.path()
+    
+    def advance(self, route_id: str, position: Position) -> List[Position]:
+        """车辆前进到新位置后，返回修复后的剩余路径"""
+        route = self._route(route_id)
+        route.move_start(position)
+        return route.path()
+    
+    def path(self, route_id: str) -> List[Position]:
+        """获取路线当前的（修复后的）路径"""
+        return self._route(route_id).path()
+    
+    def close_route(self, route_id: str) -> bool:
+        """停止跟踪路线"""
+        return self.routes.pop(route_id, None) is not None
+    
+    def route_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各路线的重规划统计"""
+        return {route_id: dict(route.stats) for route_id, route in self.routes.items()}
+    
+    def _route(self, route_id: str) -> DStarLite:
+        if route_id not in self.routes:
+            raise KeyError(f"路线不存在: {route_id}")
+        return self.routes[route_id]
+    
+    def _on_obstacle_changed(self, cell: int, blocked: bool):
+        for route in self.routes.values():
+            route.cell_changed(cell)
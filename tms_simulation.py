@@ -0,0 +1,336 @@
+"""
+TMS离散事件仿真模块
+Discrete-Event Simulation Module
+
+以虚拟时钟驱动任务执行：车头按路径通行代价行驶，行车按起吊次数和吨位装卸。
+每台设备的工作过程是一个生成器，每次 yield 需要等待的秒数；事件按时刻保存在堆中，
+时钟直接跳到下一个事件，因此整班的船运计划可以在远少于实际时间的墙钟时间内跑完，
+并给出吞吐量和设备利用率。
+"""
+
+import heapq
+import itertools
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Dict, Tuple, Optional, Any, Generator
+
+from tms_system import (
+    TMSSystem, Position, Task, ShipPlan, Equipment, Crane,
+    Warehouse, ProductWarehouse, TerminalWarehouse, TaskType
+)
+
+logger = logging.getLogger(__name__)
+
+# 仿真进程：每次 yield 一个等待的秒数
+Process = Generator[float, None, None]
+
+@dataclass
+class SimulationConfig:
+    """仿真时间参数（秒）"""
+    travel_seconds_per_cell: float = 2.0  # 行驶一格（单位通行代价）的时间
+    lift_seconds: float = 90.0  # 行车每次起吊的固定时间
+    seconds_per_ton: float = 3.0  # 每吨货物的装卸时间
+    dock_position: Optional[Position] = None  # 码头位置，None时船运货物送到离货源最近的末端库
+    start_time: Optional[datetime] = None  # 虚拟时钟的起点，默认为仿真创建时的时间
+
+@dataclass
+class SimulationResult:
+    """一次仿真的统计结果"""
+    simulated_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    events: int = 0
+    completed_tasks: int = 0
+    failed_tasks: int = 0
+    late_tasks: int = 0  # 完成时间晚于截止时间
+    unfinished_tasks: int = 0  # 仿真结束时仍在等待或执行
+    tons_moved: float = 0.0
+    task_durations: List[float] = field(default_factory=list)
+    task_waits: List[float] = field(default_factory=list)  # 到达到开始执行的等待时间
+    equipment_busy_seconds: Dict[str, float] = field(default_factory=dict)
+    
+    @property
+    def throughput_per_hour(self) -> float:
+        """每小时完成的任务数"""
+        hours = self.simulated_seconds / 3600
+        return self.completed_tasks / hours if hours > 0 else 0.0
+    
+    @property
+    def tons_per_hour(self) -> float:
+        hours = self.simulated_seconds / 3600
+        return self.tons_moved / hours if hours > 0 else 0.0
+    
+    def utilization(self) -> Dict[str, float]:
+        """各设备的利用率（忙碌时间 / 仿真时长）"""
+        if self.simulated_seconds <= 0:
+            return {equipment_id: 0.0 for equipment_id in self.equipment_busy_seconds}
+        return {
+            equipment_id: min(busy / self.simulated_seconds, 1.0)
+            for equipment_id, busy in self.equipment_busy_seconds.items()
+        }
+    
+    def to_dict(self) -> Dict[str, Any]:
+        utilization = self.utilization()
+        return {
+            'simulated_seconds': self.simulated_seconds,
+            'wall_seconds': self.wall_seconds,
+            'speedup': self.simulated_seconds / self.wall_seconds if self.wall_seconds > 0 else None,
+            'events': self.events,
+            'completed_tasks': self.completed_tasks,
+            'failed_tasks': self.failed_tasks,
+            'late_tasks': self.late_tasks,
+            'unfinished_tasks': self.unfinished_tasks,
+            'throughput_per_hour': self.throughput_per_hour,
+            'tons_moved': self.tons_moved,
+            'tons_per_hour': self.tons_per_hour,
+            'task_duration': _summary(self.task_durations),
+            'task_wait': _summary(self.task_waits),
+            'equipment_utilization': utilization,
+            'average_utilization': sum(utilization.values()) / len(utilization) if utilization else 0.0
+        }
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    """均值、中位数、p95和最大值"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1]
+    }
+
+class Simulator:
+    """离散事件仿真器
+    
+    任务通过 ``submit`` 在指定的仿真时刻到达，到达和设备空闲时按优先级、截止时间为等待中的任务
+    分配最近的空闲设备（与 ``optimize_task_schedule`` 的贪心策略一致）。任务的开始/结束时间、
+    设备位置和库存变化都写回 TMSSystem，因此仿真后 ``generate_report`` 中的执行时间是虚拟时钟下的时间。
+    行车是共享资源：同一仓库的起吊按到达顺序排队，使用最早空闲的行车。
+    行驶时间在静态场地上计算（设备不互相阻挡），路径规划网格中登记的设备位置不视为障碍。
+    """
+    
+    def __init__(self, tms: TMSSystem, config: Optional[SimulationConfig] = None):
+        self.tms = tms
+        self.config = config or SimulationConfig()
+        self.epoch = self.config.start_time or datetime.now()
+        self.clock = 0.0
+        self.result = SimulationResult(
+            equipment_busy_seconds={equipment_id: 0.0 for equipment_id in tms.equipment}
+        )
+        
+        self._events: List[Tuple[float, int, Process]] = []
+        self._sequence = itertools.count()
+        self._waiting: List[Task] = []
+        self._running: set = set()
+        self._arrivals: Dict[str, float] = {}
+        self._crane_free_at: Dict[str, float] = {}
+        self._cranes: Dict[str, List[Crane]] = {}
+        for equipment in tms.equipment.values():
+            if isinstance(equipment, Crane):
+                self._cranes.setdefault(equipment.warehouse_id, []).append(equipment)
+        
+        self.planner = tms.path_planner.copy(cache_size=4096)
+        for equipment in tms.equipment.values():
+            self.planner.remove_obstacle(equipment.position)
+    
+    @property
+    def now(self) -> datetime:
+        """当前仿真时刻对应的时间"""
+        return self.epoch + timedelta(seconds=self.clock)
+    
+    def schedule(self, process: Process, delay: float = 0.0):
+        """delay 秒后继续执行进程"""
+        heapq.heappush(self._events, (self.clock + delay, next(self._sequence), process))
+    
+    def submit(self, task: Task, at: float = 0.0):
+        """提交系统中已有的任务，在仿真时刻 at（秒）到达"""
+        if task.id not in self.tms.tasks:
+            raise ValueError(f"任务不存在: {task.id}")
+        if at < self.clock:
+            raise ValueError("任务到达时刻早于当前仿真时刻")
+        self.schedule(self._arrival(task), at - self.clock)
+    
+    def submit_ship_plan(self, ship_plan: ShipPlan, at: float = 0.0) -> Optional[Task]:
+        """为船运计划创建船运任务并在仿真时刻 at 到达"""
+        task = self.tms.create_ship_transport_task(ship_plan)
+        if task is not None:
+            self.submit(task, at)
+        return task
+    
+    def run(self, until: Optional[float] = None) -> SimulationResult:
+        """处理事件直到没有事件或时钟超过 until（秒），返回累计的统计结果"""
+        wall_start = time.perf_counter()
+        result = self.result
+        events = self._events
+        while events:
+            at, _, process = events[0]
+            if until is not None and at > until:
+                break
+            heapq.heappop(events)
+            self.clock = at
+            result.events += 1
+            try:
+                delay = next(process)
+            except StopIteration:
+                continue
+            self.schedule(process, delay)
+        if until is not None and events:
+            self.clock = until
+        
+        result.simulated_seconds = self.clock
+        result.wall_seconds += time.perf_counter() - wall_start
+        result.unfinished_tasks = len(self._waiting) + len(self._running)
+        logger.info(f"仿真推进到 {self.clock:.0f} 秒: 完成 {result.completed_tasks} 个任务，"
+                    f"失败 {result.failed_tasks} 个，未完成 {result.unfinished_tasks} 个")
+        return result
+    
+    # 任务调度
+    def _arrival(self, task: Task) -> Process:
+        self._arrivals[task.id] = self.clock
+        self._waiting.append(task)
+        self._dispatch()
+        yield from ()
+    
+    def _dispatch(self):
+        """为等待中的任务分配设备，分配成功的任务立即开始执行"""
+        tms = self.tms
+        self._waiting.sort(key=lambda task: (-task.priority, task.deadline or datetime.max,
+                                             self._arrivals[task.id]))
+        still_waiting = []
+        for task in self._waiting:
+            equipment = tms.equipment.get(task.assigned_equipment) if task.assigned_equipment else None
+            if equipment is None or equipment.current_task_id != task.id:
+                equipment = tms.equipment_index.nearest(task.task_type, tms._get_task_position(task))
+                if equipment is None or not tms.assign_equipment_to_task(task.id, equipment.id):
+                    still_waiting.append(task)
+                    continue
+            self.schedule(self._execute(task, equipment))
+        self._waiting = still_waiting
+    
+    def _execute(self, task: Task, equipment: Equipment) -> Process:
+        start = self.clock
+        self._running.add(task.id)
+        self.result.task_waits.append(start - self._arrivals[task.id])
+        task.start_execution(at=self.now)
+        
+        failure = None
+        try:
+            if task.task_type in (TaskType.SHIP_TRANSPORT, TaskType.INTERNAL_TRANSFER):
+                yield from self._haul(task, equipment)
+            elif isinstance(equipment, Crane):
+                yield self._crane_work(equipment, self._task_tons(task.metadata))
+        except Exception as e:
+            failure = str(e)
+        
+        # 释放设备后再执行任务逻辑，与 execute_task 的结果保持一致
+        equipment.release(task.id)
+        if not isinstance(equipment, Crane):
+            self.result.equipment_busy_seconds[equipment.id] = (
+                self.result.equipment_busy_seconds.get(equipment.id, 0.0) + self.clock - start)
+        if failure is None:
+            try:
+                tons = self.tms._apply_task(task)
+            except Exception as e:
+                failure = str(e)
+            else:
+                # 按实际出库/转移的吨数统计，库存不足时运输没有搬动任何货物
+                self.result.tons_moved += tons
+        if failure is None:
+            task.complete_task(at=self.now)
+            self.result.completed_tasks += 1
+            self.result.task_durations.append(self.clock - start)
+            if task.deadline is not None and task.end_time > task.deadline:
+                self.result.late_tasks += 1
+        else:
+            logger.error(f"仿真任务 {task.id} 执行失败: {failure}")
+            task.fail_task(failure, at=self.now)
+            self.result.failed_tasks += 1
+        self.tms.db_manager.save_task(task)
+        self._running.discard(task.id)
+        self._dispatch()
+    
+    # 运输与装卸
+    def _haul(self, task: Task, truck: Equipment) -> Process:
+        """车头运输：按载重分趟，每趟 行驶到货源 -> 起吊装车 -> 行驶到目的地 -> 卸车"""
+        capacity = getattr(truck, 'capacity', 0.0)
+        for source, target_position, target, tons in self._haul_legs(task):
+            trips = max(1, math.ceil(tons / capacity)) if capacity > 0 else 1
+            for _ in range(trips):
+                yield self._travel(truck, source.position)
+                yield self._lift(source, tons / trips)
+                yield self._travel(truck, target_position)
+                yield self._lift(target, tons / trips)
+    
+    def _haul_legs(self, task: Task) -> List[Tuple[Warehouse, Position, Optional[Warehouse], float]]:
+        """任务的运输段：(货源仓库, 目的地位置, 目的地仓库, 吨数)"""
+        tms = self.tms
+        if task.task_type == TaskType.INTERNAL_TRANSFER:
+            source = tms.warehouses.get(task.metadata.get('source_warehouse_id'))
+            target = tms.warehouses.get(task.metadata.get('target_warehouse_id'))
+            if source is None or target is None:
+                raise ValueError("内转任务的仓库不存在")
+            return [(source, target.position, target, self._task_tons(task.metadata))]
+        
+        legs = []
+        for product_id, quantity in task.metadata.get('products', {}).items():
+            # 与 _execute_ship_transport_task 相同：从第一个库存足够的成品库取货
+            source = next((warehouse for warehouse in tms.warehouses.values()
+                           if isinstance(warehouse, ProductWarehouse)
+                           and warehouse.products.get(product_id, 0) >= quantity), None)
+            if source is None or product_id not in tms.products:
+                continue
+            dock_position, dock = self._dock_for(source)
+            legs.append((source, dock_position, dock, tms.products[product_id].weight * quantity))
+        return legs
+    
+    def _dock_for(self, source: Warehouse) -> Tuple[Position, Optional[Warehouse]]:
+        if self.config.dock_position is not None:
+            return self.config.dock_position, None
+        terminals = [warehouse for warehouse in self.tms.warehouses.values()
+                     if isinstance(warehouse, TerminalWarehouse)]
+        if not terminals:
+            return source.position, None
+        dock = min(terminals, key=lambda warehouse: source.position.distance_to(warehouse.position))
+        return dock.position, dock
+    
+    def _task_tons(self, metadata: Dict[str, Any]) -> float:
+        products = metadata.get('products') or {metadata.get('product_id'): metadata.get('quantity', 0)}
+        return sum(self.tms.products[product_id].weight * quantity
+                   for product_id, quantity in products.items() if product_id in self.tms.products)
+    
+    def _travel(self, equipment: Equipment, target: Position) -> float:
+        """设备行驶到目标位置需要的秒数；到达后更新设备位置"""
+        seconds = self._travel_seconds(equipment.position, target)
+        equipment.position = target
+        return seconds
+    
+    def _travel_seconds(self, start: Position, goal: Position) -> float:
+        if start == goal:
+            return 0.0
+        path = self.planner.a_star_path(start, goal)
+        if not path:
+            raise ValueError(f"{start} 到 {goal} 不可达")
+        return self.planner.path_cost(path) * self.config.travel_seconds_per_cell
+    
+    def _lift(self, warehouse: Optional[Warehouse], tons: float) -> float:
+        """在仓库装卸货物需要的秒数（含排队）；仓库没有行车时按一次起吊计算，不占用资源"""
+        cranes = self._cranes.get(warehouse.id) if warehouse is not None else None
+        if not cranes:
+            return self.config.lift_seconds + tons * self.config.seconds_per_ton
+        crane = min(cranes, key=lambda crane: self._crane_free_at.get(crane.id, 0.0))
+        return self._crane_work(crane, tons)
+    
+    def _crane_work(self, crane: Crane, tons: float) -> float:
+        """预约行车完成一次装卸，返回从现在到装卸结束的秒数"""
+        lifts = max(1, math.ceil(tons / crane.capacity)) if crane.capacity > 0 else 1
+        duration = lifts * self.config.lift_seconds + tons * self.config.seconds_per_ton
+        begin = max(self.clock, self._crane_free_at.get(crane.id, 0.0))
+        self._crane_free_at[crane.id] = begin + duration
+        self.result.equipment_busy_seconds[crane.id] = (
+            self.result.equipment_busy_seconds.get(crane.id, 0.0) + duration)
+        return begin + duration - self.clock
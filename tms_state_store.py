@@ -0,0 +1,627 @@
+"""
+TMS共享状态存储模块
+Shared State Store
+
+多个API工作进程（预派生模式，如 ``gunicorn -w 4``）各自在内存中持有一个 TMSSystem，
+通过共享的状态存储保持一致。产品、仓库、设备、任务和船运计划在存储中各是一行
+带版本号的JSON数据：
+
+- 修改状态的操作在 ``TMSSystem.state_transaction()`` 中执行，开始时拉取其他进程的修改，
+  结束时把本次修改过的行连同读取时的版本号一起提交（乐观并发控制）；
+  任一行的版本与存储中的不一致说明其他进程已修改该行，整批提交放弃，
+  本地对象从存储重新加载，调用方得到 ``VersionConflict``；
+- 每次提交为写入的行分配全局递增的序号，进程通过 ``changes_since`` 只拉取
+  上次同步之后变化的行，没有变化时同步的代价是一次索引查询。
+
+实现：
+
+- ``SQLiteStateStore``：SQLite（WAL模式），多个进程打开同一个数据库文件，
+  提交在 ``BEGIN IMMEDIATE`` 事务中完成；
+- ``InMemoryStateStore``：进程内的替身实现，多个 TMSSystem 实例共享同一个对象时
+  行为与多进程共享SQLite相同，用于测试和单机调试。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import List, Dict, Tuple, Optional, Any
+
+from tms_system import (
+    TMSSystem, Product, Warehouse, TerminalWarehouse, ProductWarehouse,
+    Equipment, Crane, FrameTruck, Frame, Task, ShipPlan, Position,
+    TaskType, TaskStatus, EquipmentStatus, WarehouseType, VersionConflict
+)
+
+logger = logging.getLogger(__name__)
+
+# 一次写入：(类别, 行ID, 期望版本, 数据)；期望版本为None时不检查，为0时要求该行尚不存在
+RowWrite = Tuple[str, str, Optional[int], Dict[str, Any]]
+
+@dataclass
+class StateRow:
+    """存储中的一行"""
+    kind: str
+    id: str
+    version: int
+    seq: int
+    data: Dict[str, Any]
+
+class StateStore(ABC):
+    """带版本号的共享状态存储"""
+    
+    KINDS = ('product', 'warehouse', 'equipment', 'task', 'ship_plan')
+    
+    @abstractmethod
+    def get(self, kind: str, row_id: str) -> Optional[StateRow]:
+        """读取一行，不存在时返回None"""
+    
+    @abstractmethod
+    def commit(self, writes: List[RowWrite]) -> List[StateRow]:
+        """原子地写入一组行，任一行版本不符时全部不写入并抛出 VersionConflict"""
+    
+    @abstractmethod
+    def changes_since(self, seq: int) -> List[StateRow]:
+        """序号大于seq的全部行（每行只返回最新版本），按序号升序"""
+    
+    @abstractmethod
+    def last_seq(self) -> int:
+        """最近一次提交的序号"""
+    
+    def close(self):
+        """释放存储占用的资源"""
+
+def _dumps(data: Dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+class InMemoryStateStore(StateStore):
+    """进程内的状态存储替身
+    
+    行以JSON文本保存，读取时重新解析，因此共享同一个存储的各 TMSSystem 之间
+    不会共享可变对象，与SQLite实现的隔离程度相同。
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (类别, 行ID) -> (版本, 序号, JSON)，按序号升序排列（更新时移到末尾）
+        self._rows: "OrderedDict[Tuple[str, str], Tuple[int, int, str]]" = OrderedDict()
+        self._seq = 0
+    
+    def get(self, kind: str, row_id: str) -> Optional[StateRow]:
+        with self._lock:
+            entry = self._rows.get((kind, row_id))
+        if entry is None:
+            return None
+        version, seq, text = entry
+        return StateRow(kind, row_id, version, seq, json.loads(text))
+    
+    def commit(self, writes: List[RowWrite]) -> List[StateRow]:
+        with self._lock:
+            conflicts = []
+            for kind, row_id, expected, _ in writes:
+                entry = self._rows.get((kind, row_id))
+                if expected is not None and expected != (entry[0] if entry else 0):
+                    conflicts.append((kind, row_id))
+            if conflicts:
+                raise VersionConflict(conflicts)
+            
+            rows = []
+            for kind, row_id, _, data in writes:
+                key = (kind, row_id)
+                entry = self._rows.get(key)
+                self._seq += 1
+                row = StateRow(kind, row_id, (entry[0] if entry else 0) + 1, self._seq, data)
+                self._rows[key] = (row.version, row.seq, _dumps(data))
+                self._rows.move_to_end(key)
+                rows.append(row)
+            return rows
+    
+    def changes_since(self, seq: int) -> List[StateRow]:
+        with self._lock:
+            if seq >= self._seq:
+                return []
+            entries = []
+            for key in reversed(self._rows):
+                version, row_seq, text = self._rows[key]
+                if row_seq <= seq:
+                    break
+                entries.append((key, version, row_seq, text))
+        return [StateRow(kind, row_id, version, row_seq, json.loads(text))
+                for (kind, row_id), version, row_seq, text in reversed(entries)]
+    
+    def last_seq(self) -> int:
+        return self._seq
+
+class SQLiteStateStore(StateStore):
+    """SQLite（WAL模式）状态存储，供同一台机器上的多个进程共享
+    
+    每个线程使用自己的连接，连接在 fork 之后的子进程中首次使用时重新打开。
+    提交使用 ``BEGIN IMMEDIATE`` 取得写锁，序号在写锁内分配，因此读取方
+    不会先看到较大的序号再看到较小的序号。可以与 DatabaseManager 使用同一个数据库文件。
+    """
+    
+    UPSERT_SQL = '''
+        INSERT INTO state_rows (kind, id, version, seq, data) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(kind, id) DO UPDATE SET
+            version = excluded.version,
+            seq = excluded.seq,
+            data = excluded.data
+    '''
+    
+    def __init__(self, db_path: str, busy_timeout: float = 5.0, synchronous: str = "NORMAL"):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous.upper()
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS state_rows (
+                kind TEXT NOT NULL,
+                id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (kind, id)
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_state_rows_seq ON state_rows (seq)")
+    
+    def _connection(self) -> sqlite3.Connection:
+        """当前线程（当前进程）的连接，自动提交模式，事务由 commit 显式控制"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout,
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    def get(self, kind: str, row_id: str) -> Optional[StateRow]:
+        row = self._connection().execute(
+            "SELECT version, seq, data FROM state_rows WHERE kind = ? AND id = ?", (kind, row_id)
+        ).fetchone()
+        if row is None:
+            return None
+        return StateRow(kind, row_id, row[0], row[1], json.loads(row[2]))
+    
+    def commit(self, writes: List[RowWrite]) -> List[StateRow]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM state_rows").fetchone()[0]
+            conflicts = []
+            rows = []
+            for kind, row_id, expected, data in writes:
+                current = conn.execute(
+                    "SELECT version FROM state_rows WHERE kind = ? AND id = ?", (kind, row_id)
+                ).fetchone()
+                version = current[0] if current else 0
+                if expected is not None and expected != version:
+                    conflicts.append((kind, row_id))
+                    continue
+                seq += 1
+                rows.append(StateRow(kind, row_id, version + 1, seq, data))
+            if conflicts:
+                raise VersionConflict(conflicts)
+            conn.executemany(self.UPSERT_SQL, [
+                (row.kind, row.id, row.version, row.seq, _dumps(row.data)) for row in rows
+            ])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+    
+    def changes_since(self, seq: int) -> List[StateRow]:
+        cursor = self._connection().execute(
+            "SELECT kind, id, version, seq, data FROM state_rows WHERE seq > ? ORDER BY seq", (seq,)
+        )
+        return [StateRow(kind, row_id, version, row_seq, json.loads(data))
+                for kind, row_id, version, row_seq, data in cursor]
+    
+    def last_seq(self) -> int:
+        return self._connection().execute("SELECT COALESCE(MAX(seq), 0) FROM state_rows").fetchone()[0]
+    
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # 其他线程创建的连接在部分Python版本中不能跨线程关闭
+                pass
+        self._local = threading.local()
+
+def open_state_store(url: Optional[str]) -> Optional[StateStore]:
+    """按配置字符串创建状态存储
+    
+    ``None``/空字符串表示不使用共享存储，``memory`` 为进程内替身，
+    ``sqlite:///路径`` 或直接给出路径为SQLite存储。
+    """
+    if not url:
+        return None
+    if url == 'memory':
+        return InMemoryStateStore()
+    if url.startswith('sqlite:///'):
+        url = url[len('sqlite:///'):]
+    return SQLiteStateStore(url)
+
+# 实体与行数据之间的编解码
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+def _datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+def encode_product(product: Product) -> Dict[str, Any]:
+    return asdict(product)
+
+def encode_warehouse(warehouse: Warehouse) -> Dict[str, Any]:
+    return {
+        'name': warehouse.name,
+        'type': warehouse.warehouse_type.value,
+        'x': warehouse.position.x,
+        'y': warehouse.position.y,
+        'capacity': warehouse.capacity,
+        'current_volume': warehouse.current_volume,
+        'products': dict(warehouse.products)
+    }
+
+def encode_equipment(equipment: Equipment) -> Dict[str, Any]:
+    return {
+        'name': equipment.name,
+        'type': equipment.__class__.__name__,
+        'x': equipment.position.x,
+        'y': equipment.position.y,
+        'status': equipment.status.value,
+        'current_task_id': equipment.current_task_id,
+        'capacity': getattr(equipment, 'capacity', None),
+        'warehouse_id': getattr(equipment, 'warehouse_id', None),
+        'current_load': getattr(equipment, 'current_load', 0.0),
+        'attached_frame_id': getattr(equipment, 'attached_frame_id', None),
+        'products': dict(getattr(equipment, 'products', {}))
+    }
+
+def encode_task(task: Task) -> Dict[str, Any]:
+    return {
+        'type': task.task_type.value,
+        'status': task.status.value,
+        'priority': task.priority,
+        'created_at': _iso(task.created_at),
+        'start_time': _iso(task.start_time),
+        'end_time': _iso(task.end_time),
+        'deadline': _iso(task.deadline),
+        'assigned_equipment': task.assigned_equipment,
+        'metadata': task.metadata,
+        'sub_tasks': [
+            {
+                'id': sub.id,
+                'type': sub.task_type.value,
+                'status': sub.status.value,
+                'priority': sub.priority,
+                'metadata': sub.metadata
+            } for sub in task.sub_tasks
+        ]
+    }
+
+def encode_ship_plan(ship_plan: ShipPlan) -> Dict[str, Any]:
+    return {
+        'products': ship_plan.products,
+        'deadline': _iso(ship_plan.deadline),
+        'priority': ship_plan.priority,
+        'ship_name': ship_plan.ship_name,
+        'destination': ship_plan.destination,
+        'created_at': _iso(ship_plan.created_at)
+    }
+
+ENCODERS = {
+    'product': encode_product,
+    'warehouse': encode_warehouse,
+    'equipment': encode_equipment,
+    'task': encode_task,
+    'ship_plan': encode_ship_plan
+}
+
+class StateSynchronizer:
+    """让一个 TMSSystem 与共享状态存储保持同步
+    
+    记录本进程已知的每行版本和已同步到的序号。``_lock`` 只在同步和提交期间持有，
+    事务体在锁外执行，同一进程内的多个事务可以并发：进程内的并发由 TMSSystem
+    自己的锁处理，跨进程的并发由版本检查处理。同步时跳过正在进行的事务修改过的行，
+    这些行的版本因此保持不变，其他进程的修改由该事务提交时的版本冲突发现。
+    
+    事务之外的修改（应用其他进程的修改除外）记录警告并在下一次同步或事务开始时提交。
+    """
+    
+    def __init__(self, tms: TMSSystem, store: StateStore):
+        self.tms = tms
+        self.store = store
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._versions: Dict[Tuple[str, str], int] = {}
+        self._seq = 0
+        # 进行中的事务各自修改过的行
+        self._active: List[set] = []
+        # 事务之外修改、尚未提交的行
+        self._pending: set = set()
+        self._pending_lock = threading.Lock()
+        self.stats = {'synced_rows': 0, 'commits': 0, 'committed_rows': 0, 'conflicts': 0}
+    
+    def _registry(self, kind: str):
+        tms = self.tms
+        return {
+            'product': tms.products,
+            'warehouse': tms.warehouses,
+            'equipment': tms.equipment,
+            'task': tms.tasks,
+            'ship_plan': tms.ship_plans
+        }[kind]
+    
+    def mark_changed(self, kind: str, row_id: str):
+        """在当前线程的事务中记录一行被修改
+        
+        应用其他进程的修改时忽略；不在事务中时记录警告，该行在下一次同步时提交。
+        这里不能直接提交：调用方可能正持有被修改对象的锁，而提交需要 ``_lock``。
+        """
+        if getattr(self._local, 'applying', False):
+            return
+        dirty = getattr(self._local, 'dirty', None)
+        if dirty is not None:
+            dirty.add((kind, row_id))
+            return
+        logger.warning(f"在状态事务之外修改了 {kind} {row_id}，将在下一次同步时提交")
+        with self._pending_lock:
+            self._pending.add((kind, row_id))
+    
+    def in_transaction(self) -> bool:
+        return getattr(self._local, 'dirty', None) is not None
+    
+    @contextmanager
+    def transaction(self):
+        """同步 -> 执行 -> 提交修改过的行；嵌套调用并入外层事务，事务体执行期间不持有 ``_lock``"""
+        if self.in_transaction():
+            yield
+            return
+        dirty = set()
+        with self._lock:
+            self.sync()
+            self._active.append(dirty)
+        self._local.dirty = dirty
+        try:
+            yield
+        except BaseException:
+            self._local.dirty = None
+            with self._lock:
+                self._active.remove(dirty)
+                self._reload(dirty)
+            raise
+        self._local.dirty = None
+        with self._lock:
+            self._active.remove(dirty)
+            if dirty:
+                self._commit(dirty)
+    
+    def sync(self) -> int:
+        """提交事务之外的修改，再应用其他进程提交的修改，返回应用的行数"""
+        with self._lock:
+            self._commit_pending()
+            rows = self.store.changes_since(self._seq)
+            applied = 0
+            for row in rows:
+                self._seq = max(self._seq, row.seq)
+                key = (row.kind, row.id)
+                if row.version <= self._versions.get(key, 0):
+                    continue  # 本进程自己提交的行
+                if self._in_active_transaction(key):
+                    continue  # 保留本地未提交的修改，由该事务提交时的版本冲突处理
+                self._apply(row)
+                applied += 1
+            self.stats['synced_rows'] += applied
+            return applied
+    
+    def publish_all(self) -> int:
+        """不检查版本地发布本地的全部对象（启动时把从数据库恢复的状态写入空存储），返回行数"""
+        with self._lock:
+            writes = [(kind, row_id, None, ENCODERS[kind](obj))
+                      for kind in StateStore.KINDS
+                      for row_id, obj in list(self._registry(kind).items())]
+            if not writes:
+                return 0
+            for row in self.store.commit(writes):
+                self._versions[(row.kind, row.id)] = row.version
+            return len(writes)
+    
+    def summary(self) -> Dict[str, Any]:
+        return dict(self.stats, seq=self._seq, rows=len(self._versions),
+                    store=self.store.__class__.__name__)
+    
+    def _in_active_transaction(self, key: Tuple[str, str]) -> bool:
+        return any(key in dirty for dirty in self._active)
+    
+    def _commit_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, set()
+        # 进行中的事务修改过的行由该事务提交
+        pending = {key for key in pending if not self._in_active_transaction(key)}
+        if not pending:
+            return
+        try:
+            self._commit(pending)
+        except VersionConflict:
+            logger.warning(f"事务之外的修改与其他进程冲突，已放弃 {len(pending)} 行")
+    
+    def _commit(self, dirty: set):
+        writes = []
+        for kind, row_id in dirty:
+            obj = self._registry(kind).get(row_id)
+            if obj is not None:
+                writes.append((kind, row_id, self._versions.get((kind, row_id), 0), ENCODERS[kind](obj)))
+        try:
+            rows = self.store.commit(writes)
+        except VersionConflict as e:
+            self.stats['conflicts'] += 1
+            logger.warning(f"状态提交冲突，重新加载 {len(dirty)} 行: {e}")
+            self._reload(dirty)
+            raise
+        for row in rows:
+            self._versions[(row.kind, row.id)] = row.version
+        self.stats['commits'] += 1
+        self.stats['committed_rows'] += len(rows)
+    
+    def _reload(self, keys: set):
+        """放弃本地未提交的修改：从存储重新加载这些行，存储中不存在的新对象从本地移除
+        
+        其他进行中的事务也修改过的行保留在本地，由那个事务提交时处理。
+        """
+        for kind, row_id in keys:
+            if self._in_active_transaction((kind, row_id)):
+                continue
+            row = self.store.get(kind, row_id)
+            if row is None:
+                self._discard(kind, row_id)
+                continue
+            self._apply(row)
+            if kind == 'task':
+                self.tms.db_manager.save_task(self.tms.tasks[row_id])
+    
+    def _discard(self, kind: str, row_id: str):
+        tms = self.tms
+        if kind == 'warehouse':
+            tms._unregister_warehouse(row_id)
+        elif kind == 'equipment':
+            tms._unregister_equipment(row_id)
+        else:
+            self._registry(kind).pop(row_id, None)
+        self._versions.pop((kind, row_id), None)
+    
+    # 应用行数据到本地对象
+    def _apply(self, row: StateRow):
+        self._local.applying = True
+        try:
+            getattr(self, f"_apply_{row.kind}")(row.id, row.data)
+        finally:
+            self._local.applying = False
+        self._versions[(row.kind, row.id)] = row.version
+    
+    def _apply_product(self, row_id: str, data: Dict[str, Any]):
+        product = self.tms.products.get(row_id)
+        if product is None:
+            self.tms._register_product(Product(**data))
+            return
+        for name, value in data.items():
+            setattr(product, name, value)
+    
+    def _apply_warehouse(self, row_id: str, data: Dict[str, Any]):
+        tms = self.tms
+        warehouse = tms.warehouses.get(row_id)
+        if warehouse is None:
+            warehouse_class = (ProductWarehouse if data['type'] == WarehouseType.PRODUCT.value
+                               else TerminalWarehouse)
+            warehouse = warehouse_class(row_id, data['name'], Position(data['x'], data['y']),
+                                        data['capacity'])
+            warehouse.products = dict(data['products'])
+            warehouse.current_volume = data['current_volume']
+            tms._register_warehouse(warehouse)
+            return
+        with warehouse.lock:
+            warehouse.name = data['name']
+            warehouse.capacity = data['capacity']
+            warehouse.products = dict(data['products'])
+            warehouse.current_volume = data['current_volume']
+            warehouse._snapshot = None
+        tms._warehouse_utilization[row_id] = warehouse.get_utilization_rate()
+    
+    def _apply_equipment(self, row_id: str, data: Dict[str, Any]):
+        tms = self.tms
+        position = Position(data['x'], data['y'])
+        equipment = tms.equipment.get(row_id)
+        if equipment is None:
+            equipment_type = data['type']
+            if equipment_type == Crane.__name__:
+                equipment = Crane(row_id, data['name'], position, data['warehouse_id'] or "", data['capacity'])
+            elif equipment_type == FrameTruck.__name__:
+                equipment = FrameTruck(row_id, data['name'], position, data['capacity'])
+            elif equipment_type == Frame.__name__:
+                equipment = Frame(row_id, data['name'], position, data['capacity'])
+            else:
+                logger.warning(f"跳过未知类型的设备 {row_id}: {equipment_type}")
+                return
+            self._set_equipment_fields(equipment, data)
+            tms._register_equipment(equipment)
+            return
+        
+        # 在设备锁之外修改位置：位置变化回调会获取路径规划器的锁（障碍物随设备移动）
+        equipment.position = position
+        with equipment._lock:
+            equipment.name = data['name']
+            self._set_equipment_fields(equipment, data)
+    
+    @staticmethod
+    def _set_equipment_fields(equipment: Equipment, data: Dict[str, Any]):
+        equipment.current_task_id = data['current_task_id']
+        equipment.status = EquipmentStatus(data['status'])
+        if hasattr(equipment, 'current_load'):
+            equipment.current_load = data['current_load']
+        if isinstance(equipment, FrameTruck):
+            equipment.attached_frame_id = data['attached_frame_id']
+        if isinstance(equipment, Frame):
+            equipment.products = dict(data['products'])
+    
+    def _apply_task(self, row_id: str, data: Dict[str, Any]):
+        tms = self.tms
+        sub_tasks = [
+            Task(id=sub['id'], task_type=TaskType(sub['type']), priority=sub['priority'],
+                 status=TaskStatus(sub['status']), metadata=sub['metadata'])
+            for sub in data['sub_tasks']
+        ]
+        task = tms.tasks.get(row_id)
+        if task is None:
+            task = Task(
+                id=row_id,
+                task_type=TaskType(data['type']),
+                priority=data['priority'],
+                status=TaskStatus(data['status']),
+                created_at=_datetime(data['created_at']),
+                start_time=_datetime(data['start_time']),
+                end_time=_datetime(data['end_time']),
+                deadline=_datetime(data['deadline']),
+                assigned_equipment=data['assigned_equipment'],
+                sub_tasks=sub_tasks,
+                metadata=data['metadata']
+            )
+            tms.tasks[row_id] = task
+            return
+        # 逐字段赋值，任务仓库的二级索引随之更新
+        task.status = TaskStatus(data['status'])
+        task.priority = data['priority']
+        task.start_time = _datetime(data['start_time'])
+        task.end_time = _datetime(data['end_time'])
+        task.deadline = _datetime(data['deadline'])
+        task.assigned_equipment = data['assigned_equipment']
+        task.metadata = data['metadata']
+        task.sub_tasks = sub_tasks
+    
+    def _apply_ship_plan(self, row_id: str, data: Dict[str, Any]):
+        self.tms.ship_plans[row_id] = ShipPlan(
+            id=row_id,
+            products=data['products'],
+            deadline=_datetime(data['deadline']),
+            priority=data['priority'],
+            ship_name=data['ship_name'],
+            destination=data['destination'],
+            created_at=_datetime(data['created_at'])
+        )
@@ -6,20 +6,66 @@ Transportation Management System Core Module
 """
 
 import uuid
+import functools
 import heapq
+import math
+import bisect
+import itertools
 import sqlite3
 import json
+import atexit
 import logging
+import queue
+import threading
+import time
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
+from multiprocessing import shared_memory
 from datetime import datetime, timedelta
 from enum import Enum
-from typing import List, Dict, Tuple, Optional, Any
+from typing import List, Dict, Tuple, Optional, Any, Callable, Iterator
 from dataclasses import dataclass, field
+from collections import OrderedDict
+from collections.abc import MutableMapping
 from abc import ABC, abstractmethod
+from types import MappingProxyType
+
+import numpy as np
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def synchronized_on(lock_name: str):
+    """方法装饰器：方法执行期间持有实例上名为 ``lock_name`` 的锁"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with getattr(self, lock_name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+# 持有实例自己的可重入锁 ``_lock``
+synchronized = synchronized_on('_lock')
+
+def in_state_transaction(method):
+    """TMSSystem 方法装饰器：方法在共享状态存储的事务中执行（未配置存储时直接执行）"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.state_transaction():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class VersionConflict(Exception):
+    """乐观并发检查失败：共享状态存储中的行已被其他进程修改"""
+    
+    def __init__(self, conflicts: List[Tuple[str, str]]):
+        self.conflicts = conflicts
+        super().__init__("版本冲突: " + ", ".join(f"{kind}:{row_id}" for kind, row_id in conflicts))
+
 # 枚举类定义
 class TaskStatus(Enum):
     """任务状态枚举"""
@@ -80,16 +126,100 @@ class Product:
 
 # 基础设备类
 class Equipment(ABC):
-    """设备基类"""
+    """设备基类
+    
+    并发：每台设备有一把可重入锁，占用/释放（``try_reserve``/``release``）和移动在锁内完成；
+    ``snapshot()`` 返回缓存的只读快照，任何属性被修改时缓存失效，未修改时读取无需加锁。
+    """
     
     def __init__(self, id: str, name: str, position: Position):
+        self._lock = threading.RLock()
+        # 状态变化观察者，调用方式为 observer(equipment, field_name, old_value)
+        self.observers: List[Callable[['Equipment', str, Any], None]] = []
         self.id = id or f"E{uuid.uuid4().hex[:8].upper()}"
         self.name = name
         self.position = position
         self.status = EquipmentStatus.IDLE
         self.current_task_id: Optional[str] = None
         self.last_maintenance = datetime.now()
-        
+    
+    @property
+    def position(self) -> Position:
+        return self._position
+    
+    @position.setter
+    def position(self, value: Position):
+        old_value = self.__dict__.get('_position')
+        self._position = value
+        if old_value is not None and old_value != value:
+            self.notify_observers('position', old_value)
+    
+    @property
+    def status(self) -> EquipmentStatus:
+        return self._status
+    
+    @status.setter
+    def status(self, value: EquipmentStatus):
+        old_value = self.__dict__.get('_status')
+        self._status = value
+        if old_value is not None and old_value != value:
+            self.notify_observers('status', old_value)
+    
+    def __setattr__(self, name: str, value: Any):
+        object.__setattr__(self, name, value)
+        if name != '_snapshot':
+            self._invalidate_snapshot()
+    
+    def _invalidate_snapshot(self):
+        """丢弃缓存的快照；原地修改容器属性（如 Frame.products）后需要显式调用"""
+        object.__setattr__(self, '_snapshot', None)
+        object.__setattr__(self, '_generation', self.__dict__.get('_generation', 0) + 1)
+    
+    def notify_observers(self, field_name: str, old_value: Any):
+        """通知观察者设备字段发生了变化"""
+        for observer in self.observers:
+            observer(self, field_name, old_value)
+    
+    def snapshot(self) -> MappingProxyType:
+        """设备的只读快照（可直接序列化为JSON）"""
+        snapshot = self.__dict__.get('_snapshot')
+        if snapshot is None:
+            with self._lock:
+                generation = self._generation
+                snapshot = MappingProxyType(self._snapshot_fields())
+                # 构建期间被（未持锁的）写入修改过时不缓存，下次读取重新构建
+                if self._generation == generation:
+                    object.__setattr__(self, '_snapshot', snapshot)
+        return snapshot
+    
+    def _snapshot_fields(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'type': self.__class__.__name__,
+            'position': {'x': self.position.x, 'y': self.position.y},
+            'status': self.status.value,
+            'current_task_id': self.current_task_id
+        }
+    
+    def try_reserve(self, task_id: str) -> bool:
+        """空闲时原子地占用设备执行任务，设备不空闲时返回False"""
+        with self._lock:
+            if self.status != EquipmentStatus.IDLE:
+                return False
+            self.current_task_id = task_id
+            self.status = EquipmentStatus.BUSY
+            return True
+    
+    def release(self, task_id: Optional[str] = None) -> bool:
+        """释放设备；指定 task_id 时只在设备正被该任务占用时释放"""
+        with self._lock:
+            if task_id is not None and self.current_task_id != task_id:
+                return False
+            self.status = EquipmentStatus.IDLE
+            self.current_task_id = None
+            return True
+    
     @abstractmethod
     def can_perform_task(self, task_type: TaskType) -> bool:
         """检查是否能执行指定类型的任务"""
@@ -97,10 +227,11 @@ class Equipment(ABC):
     
     def move_to(self, target_position: Position) -> bool:
         """移动到目标位置"""
-        if self.status != EquipmentStatus.IDLE:
-            return False
+        with self._lock:
+            if self.status != EquipmentStatus.IDLE:
+                return False
+            self.status = EquipmentStatus.BUSY
         
-        self.status = EquipmentStatus.BUSY
         # 这里应该实现实际的移动逻辑
         self.position = target_position
         self.status = EquipmentStatus.IDLE
@@ -120,6 +251,11 @@ class Crane(Equipment):
         """检查是否能执行指定类型的任务"""
         return task_type in [TaskType.LOADING, TaskType.UNLOADING, TaskType.MOVE_EQUIPMENT]
     
+    def _snapshot_fields(self) -> Dict[str, Any]:
+        return dict(super()._snapshot_fields(), warehouse_id=self.warehouse_id,
+                    capacity=self.capacity, current_load=self.current_load)
+    
+    @synchronized
     def load_product(self, product: Product, quantity: int) -> bool:
         """装载产品"""
         total_weight = product.weight * quantity
@@ -130,6 +266,7 @@ class Crane(Equipment):
         logger.info(f"{self.name} 装载 {quantity} 个 {product.name}")
         return True
     
+    @synchronized
     def unload_product(self, product: Product, quantity: int) -> bool:
         """卸载产品"""
         total_weight = product.weight * quantity
@@ -153,6 +290,11 @@ class FrameTruck(Equipment):
         """检查是否能执行指定类型的任务"""
         return task_type in [TaskType.SHIP_TRANSPORT, TaskType.INTERNAL_TRANSFER]
     
+    def _snapshot_fields(self) -> Dict[str, Any]:
+        return dict(super()._snapshot_fields(), capacity=self.capacity,
+                    attached_frame_id=self.attached_frame_id, current_load=self.current_load)
+    
+    @synchronized
     def attach_frame(self, frame_id: str) -> bool:
         """连接框架"""
         if self.attached_frame_id is not None:
@@ -162,6 +304,7 @@ class FrameTruck(Equipment):
         logger.info(f"{self.name} 连接框架 {frame_id}")
         return True
     
+    @synchronized
     def detach_frame(self) -> bool:
         """分离框架"""
         if self.attached_frame_id is None:
@@ -185,6 +328,11 @@ class Frame(Equipment):
         """检查是否能执行指定类型的任务"""
         return False  # 框架本身不能执行任务，需要车头牵引
     
+    def _snapshot_fields(self) -> Dict[str, Any]:
+        return dict(super()._snapshot_fields(), capacity=self.capacity,
+                    current_load=self.current_load, products=dict(self.products))
+    
+    @synchronized
     def load_product(self, product_id: str, quantity: int, product_weight: float) -> bool:
         """装载产品到框架"""
         total_weight = product_weight * quantity
@@ -196,6 +344,7 @@ class Frame(Equipment):
         logger.info(f"框架 {self.name} 装载 {quantity} 个产品 {product_id}")
         return True
     
+    @synchronized
     def unload_product(self, product_id: str, quantity: int, product_weight: float) -> bool:
         """从框架卸载产品"""
         if product_id not in self.products or self.products[product_id] < quantity:
@@ -211,9 +360,14 @@ class Frame(Equipment):
 
 # 仓库类
 class Warehouse(ABC):
-    """仓库基类"""
+    """仓库基类
+    
+    并发：出入库在仓库自己的可重入锁内完成，``snapshot()`` 返回缓存的只读快照，库存变化时失效。
+    """
     
     def __init__(self, id: str, name: str, position: Position, capacity: float, warehouse_type: WarehouseType):
+        self._lock = threading.RLock()
+        self._snapshot: Optional[MappingProxyType] = None
         self.id = id or f"W{uuid.uuid4().hex[:8].upper()}"
         self.name = name
         self.position = position
@@ -221,7 +375,38 @@ class Warehouse(ABC):
         self.warehouse_type = warehouse_type
         self.products: Dict[str, int] = {}  # 产品ID -> 数量
         self.current_volume = 0.0
-        
+        # 库存变化观察者，调用方式为 observer(warehouse, product_id)
+        self.observers: List[Callable[['Warehouse', str], None]] = []
+    
+    def notify_observers(self, product_id: str):
+        """通知观察者某个产品的库存发生了变化"""
+        for observer in self.observers:
+            observer(self, product_id)
+    
+    @property
+    def lock(self) -> threading.RLock:
+        """仓库的可重入锁，需要跨多次出入库保持一致时由调用方持有"""
+        return self._lock
+    
+    def snapshot(self) -> MappingProxyType:
+        """仓库的只读快照（可直接序列化为JSON），库存未变化时无需加锁"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot = MappingProxyType({
+                    'id': self.id,
+                    'name': self.name,
+                    'type': self.warehouse_type.value,
+                    'position': {'x': self.position.x, 'y': self.position.y},
+                    'capacity': self.capacity,
+                    'current_volume': self.current_volume,
+                    'utilization_rate': self.get_utilization_rate(),
+                    'available_capacity': self.get_available_capacity(),
+                    'products': dict(self.products)
+                })
+        return snapshot
+    
+    @synchronized
     def add_product(self, product_id: str, quantity: int, product_volume: float = 1.0) -> bool:
         """添加产品到仓库"""
         total_volume = product_volume * quantity
@@ -230,9 +415,12 @@ class Warehouse(ABC):
         
         self.products[product_id] = self.products.get(product_id, 0) + quantity
         self.current_volume += total_volume
+        self._snapshot = None
         logger.info(f"仓库 {self.name} 入库 {quantity} 个产品 {product_id}")
+        self.notify_observers(product_id)
         return True
     
+    @synchronized
     def remove_product(self, product_id: str, quantity: int, product_volume: float = 1.0) -> bool:
         """从仓库移除产品"""
         if product_id not in self.products or self.products[product_id] < quantity:
@@ -243,7 +431,9 @@ class Warehouse(ABC):
             del self.products[product_id]
         
         self.current_volume -= product_volume * quantity
+        self._snapshot = None
         logger.info(f"仓库 {self.name} 出库 {quantity} 个产品 {product_id}")
+        self.notify_observers(product_id)
         return True
     
     def get_available_capacity(self) -> float:
@@ -282,30 +472,43 @@ class Task:
     sub_tasks: List['Task'] = field(default_factory=list)
     metadata: Dict[str, Any] = field(default_factory=dict)
     
+    # 变更时需要通知观察者（任务仓库的二级索引）的字段
+    _OBSERVED_FIELDS = frozenset(('status', 'task_type', 'assigned_equipment', 'deadline'))
+    
     def __post_init__(self):
         if not self.id:
             self.id = f"T{uuid.uuid4().hex[:8].upper()}"
     
+    def __setattr__(self, name: str, value: Any):
+        observer = self.__dict__.get('_observer')
+        if observer is None or name not in Task._OBSERVED_FIELDS:
+            object.__setattr__(self, name, value)
+            return
+        old_value = self.__dict__.get(name)
+        object.__setattr__(self, name, value)
+        if old_value != value:
+            observer(self, name, old_value)
+    
     def add_sub_task(self, sub_task: 'Task'):
         """添加子任务"""
         self.sub_tasks.append(sub_task)
     
-    def start_execution(self):
-        """开始执行任务"""
+    def start_execution(self, at: Optional[datetime] = None):
+        """开始执行任务（at 为仿真时钟给出的时间，默认为当前时间）"""
         self.status = TaskStatus.IN_PROGRESS
-        self.start_time = datetime.now()
+        self.start_time = at or datetime.now()
         logger.info(f"任务 {self.id} 开始执行")
     
-    def complete_task(self):
+    def complete_task(self, at: Optional[datetime] = None):
         """完成任务"""
         self.status = TaskStatus.COMPLETED
-        self.end_time = datetime.now()
+        self.end_time = at or datetime.now()
         logger.info(f"任务 {self.id} 执行完成")
     
-    def fail_task(self, reason: str = ""):
+    def fail_task(self, reason: str = "", at: Optional[datetime] = None):
         """任务失败"""
         self.status = TaskStatus.FAILED
-        self.end_time = datetime.now()
+        self.end_time = at or datetime.now()
         self.metadata['failure_reason'] = reason
         logger.error(f"任务 {self.id} 执行失败: {reason}")
 
@@ -324,87 +527,1845 @@ class ShipPlan:
         if not self.id:
             self.id = f"SP{uuid.uuid4().hex[:8].upper()}"
 
+# 任务仓库
+class TaskRepository(MutableMapping):
+    """带二级索引的任务仓库
+
+    行为与 ``Dict[str, Task]`` 相同，同时维护按状态、类型、分配设备、相关仓库、截止时间和创建时间的索引。
+    任务加入仓库后，其状态等字段的修改（包括 ``start_execution``、``complete_task``、
+    ``fail_task``）会通过 ``Task.__setattr__`` 自动同步到索引，
+    因此按状态筛选的代价与结果数量成正比，而不是与任务总数成正比。
+    
+    并发：增删任务、索引维护和索引查询都持有仓库的可重入锁；``keys()``、``values()``、
+    ``items()`` 和迭代返回加锁时刻的副本，遍历期间其他线程增删任务不会引发异常。
+    """
+    
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._tasks: Dict[str, Task] = {}
+        self._by_status: Dict[TaskStatus, Dict[str, Task]] = {status: {} for status in TaskStatus}
+        self._by_type: Dict[TaskType, Dict[str, Task]] = {task_type: {} for task_type in TaskType}
+        self._by_equipment: Dict[str, Dict[str, Task]] = {}
+        self._type_status_counts: Dict[Tuple[TaskType, TaskStatus], int] = {}
+        # (截止时间戳, 任务ID) 的有序列表
+        self._deadlines: List[Tuple[float, str]] = []
+        # 按元数据中的仓库（内转任务的源库和目标库）索引，元数据在任务加入仓库时读取
+        self._by_warehouse: Dict[str, Dict[str, Task]] = {}
+        # (创建时间戳, 任务ID) 的有序列表，即分页查询的排序键
+        self._created: List[Tuple[float, str]] = []
+    
+    # 映射接口
+    def __getitem__(self, task_id: str) -> Task:
+        return self._tasks[task_id]
+    
+    @synchronized
+    def __setitem__(self, task_id: str, task: Task):
+        if task_id in self._tasks:
+            self._unindex(self._tasks.pop(task_id))
+        self._tasks[task_id] = task
+        self._index(task)
+        object.__setattr__(task, '_observer', self._on_task_changed)
+    
+    @synchronized
+    def __delitem__(self, task_id: str):
+        task = self._tasks.pop(task_id)
+        self._unindex(task)
+        object.__setattr__(task, '_observer', None)
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __len__(self) -> int:
+        return len(self._tasks)
+    
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self._tasks
+    
+    def get(self, task_id: str, default: Optional[Task] = None) -> Optional[Task]:
+        return self._tasks.get(task_id, default)
+    
+    @synchronized
+    def keys(self) -> List[str]:
+        return list(self._tasks)
+    
+    @synchronized
+    def values(self) -> List[Task]:
+        return list(self._tasks.values())
+    
+    @synchronized
+    def items(self) -> List[Tuple[str, Task]]:
+        return list(self._tasks.items())
+    
+    # 索引查询
+    @synchronized
+    def with_status(self, status: TaskStatus) -> List[Task]:
+        """获取指定状态的任务（按加入顺序）"""
+        return list(self._by_status[status].values())
+    
+    @synchronized
+    def with_type(self, task_type: TaskType) -> List[Task]:
+        """获取指定类型的任务"""
+        return list(self._by_type[task_type].values())
+    
+    @synchronized
+    def assigned_to(self, equipment_id: str) -> List[Task]:
+        """获取分配给指定设备的任务"""
+        return list(self._by_equipment.get(equipment_id, {}).values())
+    
+    @synchronized
+    def count(self, status: Optional[TaskStatus] = None,
+              task_type: Optional[TaskType] = None) -> int:
+        """按状态和/或类型计数，O(1)"""
+        if status is None and task_type is None:
+            return len(self._tasks)
+        if task_type is None:
+            return len(self._by_status[status])
+        if status is None:
+            return len(self._by_type[task_type])
+        return self._type_status_counts.get((task_type, status), 0)
+    
+    @synchronized
+    def type_status_counts(self) -> Dict[Tuple[TaskType, TaskStatus], int]:
+        """获取 (类型, 状态) -> 数量 的统计"""
+        return dict(self._type_status_counts)
+    
+    @synchronized
+    def due_before(self, deadline: datetime, status: Optional[TaskStatus] = None) -> List[Task]:
+        """获取截止时间不晚于指定时间的任务，按截止时间升序"""
+        end = bisect.bisect_right(self._deadlines, (deadline.timestamp(), '\uffff'))
+        tasks = [self._tasks[task_id] for _, task_id in self._deadlines[:end]]
+        if status is not None:
+            tasks = [task for task in tasks if task.status == status]
+        return tasks
+    
+    @synchronized
+    def query(self, status: Optional[TaskStatus] = None, task_type: Optional[TaskType] = None,
+              warehouse_id: Optional[str] = None, equipment_id: Optional[str] = None,
+              created_from: Optional[datetime] = None, created_to: Optional[datetime] = None,
+              after: Optional[Tuple[float, str]] = None,
+              limit: int = 100) -> Tuple[List[Task], Optional[Tuple[float, str]]]:
+        """按条件分页查询任务，结果按 (创建时间, 任务ID) 升序
+        
+        after 为上一页返回的游标（不含），返回 (本页任务, 下一页游标)，没有更多任务时游标为None。
+        排序键在各进程间一致，因此游标可以跨工作进程使用。
+        有状态、类型、仓库或设备条件时，从结果最少的索引中取候选任务；
+        候选很多时改为沿创建时间索引从游标处向后扫描，扫描到一页即停止。
+        """
+        if limit < 1:
+            raise ValueError("分页大小必须大于0")
+        lower = (created_from.timestamp(), '') if created_from else None
+        if after is not None and (lower is None or after >= lower):
+            lower = after
+        upper = (created_to.timestamp(), '\uffff') if created_to else None
+        
+        indexes = []
+        if status is not None:
+            indexes.append(self._by_status[status])
+        if task_type is not None:
+            indexes.append(self._by_type[task_type])
+        if warehouse_id is not None:
+            indexes.append(self._by_warehouse.get(warehouse_id, {}))
+        if equipment_id is not None:
+            indexes.append(self._by_equipment.get(equipment_id, {}))
+        indexes.sort(key=len)
+        
+        def matches(task_id: str) -> bool:
+            return all(task_id in index for index in indexes)
+        
+        if indexes and limit * len(self._tasks) >= len(indexes[0]) ** 2:
+            # 候选较少：逐个取排序键，选出游标之后最小的 limit+1 个
+            keys = (
+                (task.created_at.timestamp(), task.id) for task in indexes[0].values()
+            )
+            keys = [key for key in keys
+                    if (lower is None or key > lower) and (upper is None or key <= upper)
+                    and matches(key[1])]
+            page = heapq.nsmallest(limit + 1, keys)
+        else:
+            start = 0 if lower is None else bisect.bisect_right(self._created, lower)
+            page = []
+            for key in itertools.islice(self._created, start, None):
+                if upper is not None and key > upper:
+                    break
+                if matches(key[1]):
+                    page.append(key)
+                    if len(page) > limit:
+                        break
+        
+        next_cursor = page[limit - 1] if len(page) > limit else None
+        return [self._tasks[task_id] for _, task_id in page[:limit]], next_cursor
+    
+    # 索引维护
+    @staticmethod
+    def _warehouse_ids(task: Task) -> List[str]:
+        return [task.metadata[key] for key in ('source_warehouse_id', 'target_warehouse_id')
+                if task.metadata.get(key)]
+    
+    def _index(self, task: Task, field_name: Optional[str] = None):
+        """把任务加入索引；指定字段时只更新受字段影响的索引"""
+        self._by_status[task.status][task.id] = task
+        self._by_type[task.task_type][task.id] = task
+        key = (task.task_type, task.status)
+        self._type_status_counts[key] = self._type_status_counts.get(key, 0) + 1
+        if task.assigned_equipment:
+            self._by_equipment.setdefault(task.assigned_equipment, {})[task.id] = task
+        if task.deadline:
+            bisect.insort(self._deadlines, (task.deadline.timestamp(), task.id))
+        if field_name is None:
+            for warehouse_id in self._warehouse_ids(task):
+                self._by_warehouse.setdefault(warehouse_id, {})[task.id] = task
+            bisect.insort(self._created, (task.created_at.timestamp(), task.id))
+    
+    def _unindex(self, task: Task, field_name: Optional[str] = None, old_value: Any = None):
+        """从索引中移除任务；指定字段时使用该字段的旧值定位索引项"""
+        def value_of(name: str) -> Any:
+            return old_value if name == field_name else getattr(task, name)
+        
+        status = value_of('status')
+        task_type = value_of('task_type')
+        equipment_id = value_of('assigned_equipment')
+        deadline = value_of('deadline')
+        
+        self._by_status[status].pop(task.id, None)
+        self._by_type[task_type].pop(task.id, None)
+        key = (task_type, status)
+        remaining = self._type_status_counts.get(key, 0) - 1
+        if remaining > 0:
+            self._type_status_counts[key] = remaining
+        else:
+            self._type_status_counts.pop(key, None)
+        if equipment_id:
+            assigned = self._by_equipment.get(equipment_id)
+            if assigned is not None:
+                assigned.pop(task.id, None)
+                if not assigned:
+                    del self._by_equipment[equipment_id]
+        if deadline:
+            entry = (deadline.timestamp(), task.id)
+            position = bisect.bisect_left(self._deadlines, entry)
+            if position < len(self._deadlines) and self._deadlines[position] == entry:
+                del self._deadlines[position]
+        if field_name is None:
+            for warehouse_id in self._warehouse_ids(task):
+                related = self._by_warehouse.get(warehouse_id)
+                if related is not None:
+                    related.pop(task.id, None)
+                    if not related:
+                        del self._by_warehouse[warehouse_id]
+            entry = (task.created_at.timestamp(), task.id)
+            position = bisect.bisect_left(self._created, entry)
+            if position < len(self._created) and self._created[position] == entry:
+                del self._created[position]
+    
+    @synchronized
+    def _on_task_changed(self, task: Task, field_name: str, old_value: Any):
+        """任务字段变化回调"""
+        self._unindex(task, field_name, old_value)
+        self._index(task, field_name)
+
+# 设备空间索引
+class EquipmentSpatialIndex:
+    """空闲设备的网格分桶空间索引
+
+    按设备能力（可执行的任务类型）分区，只收录空闲设备。最近设备查询从目标所在的桶
+    向外逐圈搜索，一旦当前最优距离小于下一圈的距离下界即停止，
+    因此查询代价与附近的设备数量相关，而不是与设备总数相关。
+    距离相同时按设备注册顺序选择，与线性扫描 ``min()`` 的结果一致。
+    索引的读写持有自己的锁；查询返回的设备在调用方占用它之前可能已被其他线程占用，
+    调用方应通过 ``Equipment.try_reserve`` 确认。
+    """
+    
+    def __init__(self, grid_size: Tuple[int, int], cell_size: int = 8):
+        if cell_size < 1:
+            raise ValueError("分桶大小必须大于0")
+        self._lock = threading.RLock()
+        self.cell_size = cell_size
+        self.max_bucket_x = max(0, (grid_size[0] - 1) // cell_size)
+        self.max_bucket_y = max(0, (grid_size[1] - 1) // cell_size)
+        
+        # 能力 -> 桶坐标 -> {设备ID: 设备}
+        self._buckets: Dict[TaskType, Dict[Tuple[int, int], Dict[str, Equipment]]] = {
+            task_type: {} for task_type in TaskType
+        }
+        # 能力 -> 空闲设备数量
+        self._idle_counts: Dict[TaskType, int] = {task_type: 0 for task_type in TaskType}
+        # 能力 -> (注册序号, 设备ID) 的惰性删除堆，用于无位置任务按注册顺序选择
+        self._order_heaps: Dict[TaskType, List[Tuple[int, str]]] = {task_type: [] for task_type in TaskType}
+        # 设备ID -> 能力列表 / 注册序号 / 当前所在的桶（仅空闲设备）
+        self._capabilities: Dict[str, List[TaskType]] = {}
+        self._sequence: Dict[str, int] = {}
+        self._idle_bucket: Dict[str, Tuple[int, int]] = {}
+        self._next_sequence = 0
+    
+    def __len__(self) -> int:
+        return len(self._idle_bucket)
+    
+    def _bucket_of(self, position: Position) -> Tuple[int, int]:
+        return (position.x // self.cell_size, position.y // self.cell_size)
+    
+    @synchronized
+    def add(self, equipment: Equipment):
+        """加入设备（同一ID重复加入时保留原注册顺序）"""
+        if equipment.id not in self._sequence:
+            self._sequence[equipment.id] = self._next_sequence
+            self._next_sequence += 1
+        self._capabilities[equipment.id] = [
+            task_type for task_type in TaskType if equipment.can_perform_task(task_type)
+        ]
+        self.update(equipment)
+    
+    @synchronized
+    def remove(self, equipment_id: str):
+        """移除设备"""
+        self._remove_idle(equipment_id)
+        self._capabilities.pop(equipment_id, None)
+        self._sequence.pop(equipment_id, None)
+    
+    @synchronized
+    def update(self, equipment: Equipment):
+        """设备位置或状态变化后同步索引"""
+        self._remove_idle(equipment.id)
+        if equipment.status != EquipmentStatus.IDLE:
+            return
+        
+        bucket = self._bucket_of(equipment.position)
+        self._idle_bucket[equipment.id] = bucket
+        entry = (self._sequence[equipment.id], equipment.id)
+        for task_type in self._capabilities[equipment.id]:
+            self._buckets[task_type].setdefault(bucket, {})[equipment.id] = equipment
+            self._idle_counts[task_type] += 1
+            heap = self._order_heaps[task_type]
+            heapq.heappush(heap, entry)
+            # 惰性删除会积累失效项，过多时重建
+            if len(heap) > 2 * self._idle_counts[task_type] + 64:
+                self._rebuild_order_heap(task_type)
+    
+    def _remove_idle(self, equipment_id: str):
+        bucket = self._idle_bucket.pop(equipment_id, None)
+        if bucket is None:
+            return
+        for task_type in self._capabilities[equipment_id]:
+            buckets = self._buckets[task_type]
+            members = buckets[bucket]
+            del members[equipment_id]
+            if not members:
+                del buckets[bucket]
+            self._idle_counts[task_type] -= 1
+    
+    def _rebuild_order_heap(self, task_type: TaskType):
+        heap = [
+            (self._sequence[equipment_id], equipment_id)
+            for members in self._buckets[task_type].values()
+            for equipment_id in members
+        ]
+        heapq.heapify(heap)
+        self._order_heaps[task_type] = heap
+    
+    @synchronized
+    def nearest(self, task_type: TaskType, position: Optional[Position]) -> Optional[Equipment]:
+        """查找能执行该类型任务、距离最近的空闲设备
+
+        ``position`` 为None时（任务没有位置信息）返回最早注册的空闲设备。
+        """
+        if self._idle_counts[task_type] == 0:
+            return None
+        
+        buckets = self._buckets[task_type]
+        if position is None:
+            heap = self._order_heaps[task_type]
+            while heap:
+                _, equipment_id = heap[0]
+                bucket = self._idle_bucket.get(equipment_id)
+                if bucket is not None and equipment_id in buckets.get(bucket, ()):
+                    return buckets[bucket][equipment_id]
+                heapq.heappop(heap)
+            return None
+        
+        center_x, center_y = self._bucket_of(position)
+        max_ring = max(center_x, self.max_bucket_x - center_x,
+                       center_y, self.max_bucket_y - center_y, 0)
+        best: Optional[Equipment] = None
+        best_key: Tuple[float, int] = (float('inf'), 0)
+        
+        for ring in range(max_ring + 1):
+            # 第ring圈中的任何位置与目标的曼哈顿距离至少为 (ring-1)*cell_size+1
+            if ring > 0 and best_key[0] < (ring - 1) * self.cell_size + 1:
+                break
+            for bucket in self._ring_buckets(center_x, center_y, ring):
+                members = buckets.get(bucket)
+                if not members:
+                    continue
+                for equipment in members.values():
+                    key = (position.distance_to(equipment.position), self._sequence[equipment.id])
+                    if key < best_key:
+                        best_key = key
+                        best = equipment
+        
+        # 坐标超出网格范围的设备不在上面的圈内，兜底线性查找
+        if best is None:
+            for members in buckets.values():
+                for equipment in members.values():
+                    key = (position.distance_to(equipment.position), self._sequence[equipment.id])
+                    if key < best_key:
+                        best_key = key
+                        best = equipment
+        return best
+    
+    @staticmethod
+    def _ring_buckets(center_x: int, center_y: int, ring: int):
+        """生成与中心桶切比雪夫距离恰好为ring的桶坐标"""
+        if ring == 0:
+            yield (center_x, center_y)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (center_x + dx, center_y - ring)
+            yield (center_x + dx, center_y + ring)
+        for dy in range(-ring + 1, ring):
+            yield (center_x - ring, center_y + dy)
+            yield (center_x + ring, center_y + dy)
+
+# 最小代价匹配
+def solve_assignment(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """求解矩形代价矩阵的最小代价匹配（匈牙利算法的最短增广路形式）
+
+    每行匹配恰好一列（行数不多于列数时）。对列的内层循环用NumPy向量化，
+    复杂度为 O(行数² × 列数)。返回 (行下标数组, 列下标数组)。
+    行数多于列数时先转置求解。代价必须为有限值，不可行的配对应由调用方赋予大代价。
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.ndim != 2:
+        raise ValueError("代价矩阵必须是二维的")
+    if cost.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if not np.all(np.isfinite(cost)):
+        raise ValueError("代价矩阵中不能有非有限值")
+    
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n_rows, n_cols = cost.shape
+    
+    # 势函数u(行)/v(列)，col_match[j]为匹配到第j列的行（1起始，0表示列0为虚拟列）
+    u = np.zeros(n_rows + 1)
+    v = np.zeros(n_cols + 1)
+    col_match = np.zeros(n_cols + 1, dtype=np.int64)
+    way = np.zeros(n_cols + 1, dtype=np.int64)
+    
+    for row in range(1, n_rows + 1):
+        col_match[0] = row
+        current_col = 0
+        min_reduced = np.full(n_cols + 1, np.inf)
+        used = np.zeros(n_cols + 1, dtype=bool)
+        
+        while True:
+            used[current_col] = True
+            current_row = col_match[current_col]
+            free = ~used
+            free[0] = False
+            free_cols = np.flatnonzero(free)
+            
+            reduced = cost[current_row - 1, free_cols - 1] - u[current_row] - v[free_cols]
+            improved = reduced < min_reduced[free_cols]
+            improved_cols = free_cols[improved]
+            min_reduced[improved_cols] = reduced[improved]
+            way[improved_cols] = current_col
+            
+            best = np.argmin(min_reduced[free_cols])
+            next_col = free_cols[best]
+            delta = min_reduced[next_col]
+            
+            used_cols = np.flatnonzero(used)
+            u[col_match[used_cols]] += delta
+            v[used_cols] -= delta
+            min_reduced[free_cols] -= delta
+            
+            current_col = next_col
+            if col_match[current_col] == 0:
+                break
+        
+        # 沿增广路翻转匹配
+        while current_col:
+            previous_col = way[current_col]
+            col_match[current_col] = col_match[previous_col]
+            current_col = previous_col
+    
+    matched_cols = np.flatnonzero(col_match[1:])
+    rows = col_match[matched_cols + 1] - 1
+    cols = matched_cols
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
 # 路径规划算法
 class PathPlanner:
-    """路径规划器"""
-    
-    def __init__(self, grid_size: Tuple[int, int]):
+    """路径规划器
+
+    障碍物保存在NumPy占用栅格 ``grid`` 中（形状为 (高, 宽)，非0表示障碍），
+    搜索在整数编码的格子 ``y * 宽 + x`` 上进行，只在输入输出处与 ``Position`` 互相转换。
+    
+    规划结果缓存在有界LRU缓存中，键为 (起点, 终点)。障碍物变化时只失效受影响的条目：
+    新增障碍物使经过该格子的路径失效；移除障碍物使"可能经过该格子变得更短"的路径
+    （起点经该格子到终点的曼哈顿距离小于当前路径长度）以及不可达结果失效。
+    
+    地形：``cost_grid`` 为进入每个格子的通行代价（1~255，1为正常路面），
+    ``direction_mask`` 为每个格子允许离开的方向位掩码（单行道），connectivity=8 时允许
+    对角移动（代价乘以√2，不允许贴着障碍物切角）。全部为默认值时网格是"均匀"的，
+    使用原有的单位代价搜索（含ALT和跳点搜索）；否则使用加权A*，启发函数为
+    最小通行代价乘以曼哈顿距离（4连通）或八方向距离（8连通），保证可采纳。
+    
+    并发：网格、地形、缓存的修改和查询都持有规划器的可重入锁 ``lock``（路线表共用同一把锁），
+    多个线程可以共享一个规划器；需要连续多次操作保持一致时，调用方可以自行持有 ``lock``。
+    """
+    
+    # 邻居方向：上右下左
+    DIRECTIONS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+    # 8连通时追加的对角方向
+    DIAGONALS = ((1, 1), (1, -1), (-1, -1), (-1, 1))
+    ALGORITHMS = ('astar', 'jps')
+    # 方向位掩码：第i位对应 DIRECTIONS + DIAGONALS 中的第i个方向
+    ALL_DIRECTIONS = 0xFF
+    # 批量规划时未命中缓存的查询达到该数量才使用进程池，较小的批次串行计算
+    PARALLEL_MIN_BATCH = 64
+    
+    def __init__(self, grid_size: Tuple[int, int], cache_size: int = 1024, connectivity: int = 4):
+        if connectivity not in (4, 8):
+            raise ValueError("connectivity 只能是 4 或 8")
+        self._lock = threading.RLock()
         self.grid_width, self.grid_height = grid_size
+        self.connectivity = connectivity
         self.obstacles: set = set()
+        self.grid = np.zeros((self.grid_height, self.grid_width), dtype=np.uint8)
+        self.cost_grid = np.ones((self.grid_height, self.grid_width), dtype=np.uint8)
+        self.direction_mask = np.full((self.grid_height, self.grid_width), self.ALL_DIRECTIONS, dtype=np.uint8)
+        # 最小通行代价（启发函数的系数），以及非默认代价/方向的格子数
+        self.min_cost = 1
+        self._weighted_cells = 0
+        self._restricted_cells = 0
+        # 上一次搜索的统计信息（展开节点数等）
+        self.last_search_stats: Dict[str, Any] = {}
+        
+        # 路径LRU缓存：(起点格子, 终点格子) -> 路径格子元组（空元组表示不可达）
+        self.cache_size = cache_size
+        self._path_cache: "OrderedDict[Tuple[int, int], Tuple[int, ...]]" = OrderedDict()
+        # 格子 -> 经过该格子的缓存键，用于新增障碍物时精确失效
+        self._cache_keys_by_cell: Dict[int, set] = {}
+        self._unreachable_keys: set = set()
+        self.cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
         
+        # 障碍物变化监听者，调用方式为 listener(格子, 是否变为障碍)
+        self.obstacle_listeners: List[Callable[[int, bool], None]] = []
+        # 可选的地标路线表，提供ALT下界以加速搜索
+        self.route_table: Optional['RouteTable'] = None
+        # 跳点搜索的查表数据，网格变化时置空
+        self._jump_table_cache: Optional[Dict[str, memoryview]] = None
+        # 网格版本号，障碍物或地形变化时递增，进程池使用的共享内存副本据此同步
+        self.grid_version = 0
+        # 批量规划的进程池和共享内存网格副本（占用/代价/方向三层），首次并行规划时创建
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_workers = 0
+        self._pool_lock = threading.Lock()
+        self._shared_grid: Optional[shared_memory.SharedMemory] = None
+        self._shared_version = -1
+    
+    @property
+    def lock(self) -> threading.RLock:
+        """规划器的可重入锁"""
+        return self._lock
+    
+    @synchronized
+    def copy(self, cache_size: Optional[int] = None) -> 'PathPlanner':
+        """复制障碍物网格和地形（不含路径缓存、监听者和路线表）"""
+        planner = PathPlanner((self.grid_width, self.grid_height),
+                              cache_size=self.cache_size if cache_size is None else cache_size,
+                              connectivity=self.connectivity)
+        planner.obstacles = set(self.obstacles)
+        planner.grid[:] = self.grid
+        planner.cost_grid[:] = self.cost_grid
+        planner.direction_mask[:] = self.direction_mask
+        planner.min_cost = self.min_cost
+        planner._weighted_cells = self._weighted_cells
+        planner._restricted_cells = self._restricted_cells
+        return planner
+    
+    def in_bounds(self, position: Position) -> bool:
+        """检查位置是否在网格范围内"""
+        return 0 <= position.x < self.grid_width and 0 <= position.y < self.grid_height
+    
+    def encode(self, position: Position) -> int:
+        """位置 -> 格子编号"""
+        return position.y * self.grid_width + position.x
+    
+    def decode(self, cell: int) -> Position:
+        """格子编号 -> 位置"""
+        y, x = divmod(cell, self.grid_width)
+        return Position(x, y)
+    
+    def is_blocked(self, position: Position) -> bool:
+        """检查位置是否为障碍物（网格外视为障碍）"""
+        return not self.in_bounds(position) or bool(self.grid[position.y, position.x])
+    
+    @property
+    def is_uniform(self) -> bool:
+        """是否为4连通、单位代价、无方向限制的网格"""
+        return self.connectivity == 4 and not self._weighted_cells and not self._restricted_cells
+    
+    def moves(self) -> List[Tuple[int, int, int, float]]:
+        """当前连通性下的移动列表：(dx, dy, 方向位, 步长)"""
+        directions = self.DIRECTIONS + (self.DIAGONALS if self.connectivity == 8 else ())
+        return [(dx, dy, 1 << i, math.sqrt(2) if dx and dy else 1.0)
+                for i, (dx, dy) in enumerate(directions)]
+    
+    # 地形
+    @synchronized
+    def set_cell_cost(self, position: Position, cost: int):
+        """设置进入格子的通行代价（1~255）"""
+        self._set_cell_cost(position, cost)
+        self.min_cost = int(self.cost_grid.min())
+    
+    @synchronized
+    def set_area_cost(self, top_left: Position, bottom_right: Position, cost: int):
+        """设置矩形区域（含边界）内所有格子的通行代价，如慢行区"""
+        if not self.in_bounds(top_left) or not self.in_bounds(bottom_right):
+            raise ValueError(f"区域 {top_left}-{bottom_right} 超出网格范围")
+        if not 1 <= int(cost) <= 255:
+            raise ValueError("通行代价必须在 1~255 之间")
+        for y in range(top_left.y, bottom_right.y + 1):
+            for x in range(top_left.x, bottom_right.x + 1):
+                self._set_cell_cost(Position(x, y), cost)
+        self.min_cost = int(self.cost_grid.min())
+    
+    @synchronized
+    def set_allowed_directions(self, position: Position, directions: Optional[List[Tuple[int, int]]]):
+        """设置允许离开格子的方向，None 表示不限制"""
+        if not self.in_bounds(position):
+            raise ValueError(f"位置 {position} 超出网格范围")
+        all_directions = self.DIRECTIONS + self.DIAGONALS
+        if directions is None:
+            mask = self.ALL_DIRECTIONS
+        else:
+            mask = 0
+            for direction in directions:
+                if tuple(direction) not in all_directions:
+                    raise ValueError(f"无效的方向: {direction}")
+                mask |= 1 << all_directions.index(tuple(direction))
+        old_mask = int(self.direction_mask[position.y, position.x])
+        if mask == old_mask:
+            return
+        self.direction_mask[position.y, position.x] = mask
+        self._restricted_cells += (mask != self.ALL_DIRECTIONS) - (old_mask != self.ALL_DIRECTIONS)
+        # 只收回方向（没有新开放的方向）时路径只会变长
+        self._terrain_changed(self.encode(position), tighter=not (mask & ~old_mask))
+    
+    @synchronized
+    def set_one_way(self, position: Position, direction: Tuple[int, int]):
+        """单行道：禁止离开格子时带有与 direction 相反的分量"""
+        dx, dy = direction
+        self.set_allowed_directions(position, [
+            (mx, my) for mx, my in self.DIRECTIONS + self.DIAGONALS if mx * dx + my * dy >= 0
+        ])
+    
+    def step_cost(self, from_cell: int, to_cell: int) -> float:
+        """相邻格子间一步移动的代价，不可移动时为无穷大"""
+        width = self.grid_width
+        dx, dy = to_cell % width - from_cell % width, to_cell // width - from_cell // width
+        for mx, my, bit, length in self.moves():
+            if (mx, my) != (dx, dy):
+                continue
+            if self.grid.flat[to_cell] or not self.direction_mask.flat[from_cell] & bit:
+                return math.inf
+            if dx and dy and (self.grid.flat[from_cell + dx] or self.grid.flat[from_cell + dy * width]):
+                return math.inf
+            return length * int(self.cost_grid.flat[to_cell])
+        return math.inf
+    
+    def path_cost(self, path: List[Position]) -> float:
+        """路径的通行代价（均匀网格上等于步数）"""
+        return sum(self.step_cost(self.encode(a), self.encode(b)) for a, b in zip(path, path[1:]))
+    
+    @synchronized
+    def travel_cost(self, start: Position, goal: Position) -> Optional[float]:
+        """两点间最短路径的通行代价，不可达时返回None"""
+        path = self.a_star_path(start, goal)
+        return self.path_cost(path) if path else None
+    
+    def _set_cell_cost(self, position: Position, cost: int):
+        if not self.in_bounds(position):
+            raise ValueError(f"位置 {position} 超出网格范围")
+        cost = int(cost)
+        if not 1 <= cost <= 255:
+            raise ValueError("通行代价必须在 1~255 之间")
+        old_cost = int(self.cost_grid[position.y, position.x])
+        if cost == old_cost:
+            return
+        self.cost_grid[position.y, position.x] = cost
+        self._weighted_cells += (cost != 1) - (old_cost != 1)
+        self._terrain_changed(self.encode(position), tighter=cost > old_cost)
+    
+    def _terrain_changed(self, cell: int, tighter: bool):
+        """代价或方向变化：变贵/收紧只影响经过该格子的路径，否则任何路径都可能变短"""
+        self.grid_version += 1
+        if tighter:
+            for key in list(self._cache_keys_by_cell.get(cell, ())):
+                self._invalidate(key)
+        else:
+            self.clear_path_cache()
+        for listener in self.obstacle_listeners:
+            listener(cell, bool(self.grid.flat[cell]))
+    
+    @synchronized
     def add_obstacle(self, position: Position):
         """添加障碍物"""
         self.obstacles.add((position.x, position.y))
-    
+        if self.in_bounds(position) and not self.grid[position.y, position.x]:
+            self.grid[position.y, position.x] = 1
+            self.grid_version += 1
+            self._jump_table_cache = None
+            cell = self.encode(position)
+            affected = [cell]
+            if self.connectivity == 8:
+                # 对角移动不能贴着障碍物切角，经过相邻格子的路径也可能失效
+                affected.extend(self._orthogonal_neighbors(position))
+            for affected_cell in affected:
+                for key in list(self._cache_keys_by_cell.get(affected_cell, ())):
+                    # 起点或终点本身变为障碍物时路径仍然有效：普通查询在查缓存前就会拒绝，
+                    # 允许起点被占用的查询（设备从自身所在格子出发）仍可命中
+                    if affected_cell != cell or cell not in key:
+                        self._invalidate(key)
+            for listener in self.obstacle_listeners:
+                listener(cell, True)
+    
+    @synchronized
     def remove_obstacle(self, position: Position):
         """移除障碍物"""
         self.obstacles.discard((position.x, position.y))
+        if self.in_bounds(position) and self.grid[position.y, position.x]:
+            self.grid[position.y, position.x] = 0
+            self.grid_version += 1
+            self._jump_table_cache = None
+            self._invalidate_for_opened_cell(position)
+            for listener in self.obstacle_listeners:
+                listener(self.encode(position), False)
+    
+    # 路径缓存
+    @synchronized
+    def path_cache_stats(self) -> Dict[str, int]:
+        """获取路径缓存统计（命中、未命中、淘汰、失效次数和当前大小）"""
+        return dict(self.cache_stats, size=len(self._path_cache), capacity=self.cache_size)
+    
+    @synchronized
+    def clear_path_cache(self):
+        """清空路径缓存"""
+        self._path_cache.clear()
+        self._cache_keys_by_cell.clear()
+        self._unreachable_keys.clear()
+    
+    def _cache_get(self, key: Tuple[int, int]) -> Optional[Tuple[int, ...]]:
+        cells = self._path_cache.get(key)
+        if cells is None:
+            self.cache_stats['misses'] += 1
+            return None
+        self._path_cache.move_to_end(key)
+        self.cache_stats['hits'] += 1
+        return cells
+    
+    def _cache_put(self, key: Tuple[int, int], cells: Tuple[int, ...]):
+        if self.cache_size <= 0:
+            return
+        if key in self._path_cache:
+            self._invalidate(key, count=False)
+        self._path_cache[key] = cells
+        if cells:
+            for cell in cells:
+                self._cache_keys_by_cell.setdefault(cell, set()).add(key)
+        else:
+            self._unreachable_keys.add(key)
+        while len(self._path_cache) > self.cache_size:
+            oldest = next(iter(self._path_cache))
+            self._invalidate(oldest, count=False)
+            self.cache_stats['evictions'] += 1
+    
+    def _invalidate(self, key: Tuple[int, int], count: bool = True):
+        """移除一个缓存条目及其反向索引"""
+        cells = self._path_cache.pop(key, None)
+        if cells is None:
+            return
+        if count:
+            self.cache_stats['invalidations'] += 1
+        if not cells:
+            self._unreachable_keys.discard(key)
+            return
+        for cell in cells:
+            keys = self._cache_keys_by_cell.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._cache_keys_by_cell[cell]
+    
+    def _orthogonal_neighbors(self, position: Position) -> List[int]:
+        return [self.encode(Position(position.x + dx, position.y + dy)) for dx, dy in self.DIRECTIONS
+                if self.in_bounds(Position(position.x + dx, position.y + dy))]
+    
+    def _invalidate_for_opened_cell(self, position: Position):
+        """格子变为可通行后，失效可能因此变短的路径和所有不可达结果"""
+        if not self.is_uniform:
+            # 加权或8连通时路径长度不再是步数，无法用曼哈顿下界筛选
+            self.clear_path_cache()
+            return
+        for key in list(self._unreachable_keys):
+            self._invalidate(key)
+        width = self.grid_width
+        x, y = position.x, position.y
+        for key, cells in list(self._path_cache.items()):
+            start, goal = key
+            via_length = (abs(start % width - x) + abs(start // width - y) +
+                          abs(goal % width - x) + abs(goal // width - y))
+            if via_length < len(cells) - 1:
+                self._invalidate(key)
     
     def heuristic(self, pos1: Position, pos2: Position) -> float:
-        """启发式函数（曼哈顿距离）"""
-        return abs(pos1.x - pos2.x) + abs(pos1.y - pos2.y)
+        """启发式函数：最小通行代价乘以曼哈顿距离（4连通）或八方向距离（8连通）"""
+        dx, dy = abs(pos1.x - pos2.x), abs(pos1.y - pos2.y)
+        if self.connectivity == 8:
+            return self.min_cost * (max(dx, dy) + (math.sqrt(2) - 1) * min(dx, dy))
+        return self.min_cost * (dx + dy)
     
     def get_neighbors(self, position: Position) -> List[Position]:
-        """获取相邻位置"""
+        """获取可以一步到达的相邻位置（考虑连通性、方向限制和切角）"""
         neighbors = []
-        directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]  # 上右下左
+        cell = self.encode(position)
+        for dx, dy, _, _ in self.moves():
+            neighbor = Position(position.x + dx, position.y + dy)
+            if self.in_bounds(neighbor) and self.step_cost(cell, self.encode(neighbor)) < math.inf:
+                neighbors.append(neighbor)
+        return neighbors
+    
+    @synchronized
+    def a_star_path(self, start: Position, goal: Position, algorithm: str = "astar",
+                    allow_occupied_start: bool = False) -> List[Position]:
+        """A*路径规划算法
+
+        在格子编号上搜索：开放表为 (f, h, 格子) 元组，f相同时优先展开离目标更近的格子，
+        再按格子编号决定先后，结果是确定的；关闭表保证每个格子只展开一次。
+        algorithm="jps" 时使用跳点搜索，路径代价与A*相同，展开的节点少得多；
+        两种算法的结果代价一致，因此共用路径缓存。网格不均匀（加权、方向限制或8连通）时
+        两种算法都使用加权A*。
+        allow_occupied_start=True 时起点可以是障碍物（例如设备自身所在的格子）。
+        """
+        search = self._search_for(algorithm)
+        key = self._query_key(start, goal, allow_occupied_start)
+        if key is None:
+            return []
+        if search == self._jps_cells and self.grid[start.y, start.x]:
+            # 跳点表按障碍物预先计算，起点被占用时改用代价相同的A*
+            search = self._search_cells
         
-        for dx, dy in directions:
-            new_x, new_y = position.x + dx, position.y + dy
-            if (0 <= new_x < self.grid_width and 
-                0 <= new_y < self.grid_height and 
-                (new_x, new_y) not in self.obstacles):
-                neighbors.append(Position(new_x, new_y))
+        cells = self._cache_get(key)
+        if cells is None:
+            cells = tuple(search(*key))
+            self._cache_put(key, cells)
+        return [self.decode(cell) for cell in cells]
+    
+    def plan_many(self, requests: List[Tuple[Position, Position]], algorithm: str = "astar",
+                  max_workers: Optional[int] = None) -> List[List[Position]]:
+        """批量路径规划，返回与请求顺序一致的路径列表（不可达为空列表）
         
-        return neighbors
+        先查路径缓存，相同的 (起点, 终点) 只计算一次。未命中的查询不少于 PARALLEL_MIN_BATCH
+        且可用多个进程时，分块交给进程池计算，工作进程通过共享内存读取网格副本；
+        结果写回本进程的路径缓存。每个查询的路径代价与 a_star_path 相同。
+        并行计算时只在复制网格期间持有规划器的锁，等待进程池期间其他查询不受阻塞；
+        期间网格发生变化时，结果对应复制时的网格，不写入缓存。
+        """
+        with self._lock:
+            search = self._search_for(algorithm)
+            keys = [self._query_key(start, goal) for start, goal in requests]
+            
+            results: Dict[Tuple[int, int], Tuple[int, ...]] = {}
+            misses = []
+            for key in dict.fromkeys(keys):
+                if key is None:
+                    continue
+                cells = self._cache_get(key)
+                if cells is None:
+                    misses.append(key)
+                else:
+                    results[key] = cells
+            
+            workers = max_workers or os.cpu_count() or 1
+            parallel = len(misses) >= self.PARALLEL_MIN_BATCH and workers >= 2
+            if not parallel:
+                for key in misses:
+                    results[key] = tuple(search(*key))
+                    self._cache_put(key, results[key])
+            else:
+                terrain = (self.grid_version, self.min_cost, self._weighted_cells, self._restricted_cells)
+                layers = np.stack((self.grid, self.cost_grid, self.direction_mask))
+        
+        if parallel:
+            computed = self._plan_parallel(misses, algorithm, workers, terrain, layers)
+            results.update(computed)
+            with self._lock:
+                if self.grid_version == terrain[0]:
+                    for key in misses:
+                        self._cache_put(key, computed[key])
+        
+        return [[self.decode(cell) for cell in results[key]] if key is not None else []
+                for key in keys]
+    
+    def close_pool(self):
+        """关闭批量规划的进程池并释放共享内存"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+                self._pool_workers = 0
+                atexit.unregister(self.close_pool)
+            if self._shared_grid is not None:
+                self._shared_grid.close()
+                self._shared_grid.unlink()
+                self._shared_grid = None
+                self._shared_version = -1
+    
+    def _search_for(self, algorithm: str) -> Callable[[int, int], List[int]]:
+        """按算法和网格是否均匀选择搜索函数"""
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError(f"未知的路径规划算法: {algorithm}，可选值: {', '.join(self.ALGORITHMS)}")
+        if not self.is_uniform:
+            return self._weighted_search_cells
+        if algorithm == "jps":
+            return self._jps_cells
+        return self._search_cells
+    
+    def _query_key(self, start: Position, goal: Position,
+                   allow_occupied_start: bool = False) -> Optional[Tuple[int, int]]:
+        """查询的缓存键；起点或终点在网格外或为障碍物时返回None（起点可按需允许为障碍物）"""
+        if not self.in_bounds(start) or not self.in_bounds(goal):
+            return None
+        if (self.grid[start.y, start.x] and not allow_occupied_start) or self.grid[goal.y, goal.x]:
+            return None
+        return (self.encode(start), self.encode(goal))
     
-    def a_star_path(self, start: Position, goal: Position) -> List[Position]:
-        """A*路径规划算法"""
-        if (start.x, start.y) in self.obstacles or (goal.x, goal.y) in self.obstacles:
+    def _plan_parallel(self, keys: List[Tuple[int, int]], algorithm: str, workers: int,
+                       terrain: Tuple[int, int, int, int],
+                       layers: np.ndarray) -> Dict[Tuple[int, int], Tuple[int, ...]]:
+        """在进程池中计算查询；layers 为复制时的 (占用, 代价, 方向) 网格，terrain 为对应的版本等信息
+        
+        持有 ``_pool_lock`` 直到全部结果返回，其他批次不会在计算期间改写共享内存。
+        """
+        with self._pool_lock:
+            pool = self._ensure_pool(workers)
+            if self._shared_version != terrain[0]:
+                shared = np.ndarray(layers.shape, dtype=np.uint8, buffer=self._shared_grid.buf)
+                shared[:] = layers
+                del shared
+                self._shared_version = terrain[0]
+            
+            # 每个进程分到若干块，块太大时负载不均，太小时进程间通信开销占比高
+            chunk_size = -(-len(keys) // (workers * 4))
+            chunks = [keys[i:i + chunk_size] for i in range(0, len(keys), chunk_size)]
+            results = {}
+            for chunk, paths in zip(chunks, pool.map(_plan_chunk, itertools.repeat(terrain),
+                                                     chunks, itertools.repeat(algorithm))):
+                results.update(zip(chunk, paths))
+            return results
+    
+    def _ensure_pool(self, workers: int) -> ProcessPoolExecutor:
+        if self._pool is not None and self._pool_workers == workers:
+            return self._pool
+        if self._pool is not None:
+            self._pool.shutdown()
+            atexit.unregister(self.close_pool)
+        if self._shared_grid is None:
+            self._shared_grid = shared_memory.SharedMemory(create=True, size=3 * self.grid.size)
+            self._shared_version = -1
+        # 使用spawn启动工作进程，避免在有后台线程（写回队列）的进程中fork
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_plan_worker_init,
+            initargs=(self._shared_grid.name, (self.grid_height, self.grid_width), self.connectivity)
+        )
+        self._pool_workers = workers
+        atexit.register(self.close_pool)
+        return self._pool
+    
+    def _search_cells(self, start: int, goal: int) -> List[int]:
+        """A*核心：返回从start到goal的格子编号序列，不可达时返回空列表"""
+        width = self.grid_width
+        height = self.grid_height
+        occupied = memoryview(self.grid.reshape(-1))
+        goal_x, goal_y = goal % width, goal // width
+        
+        # ALT地标下界：(距离场, 地标到终点的距离)，与曼哈顿距离取最大值
+        landmark_bounds = self.route_table.landmark_bounds(start, goal) if self.route_table is not None else []
+        
+        closed = bytearray(width * height)
+        g_score = {start: 0}
+        came_from: Dict[int, int] = {}
+        start_h = abs(start % width - goal_x) + abs(start // width - goal_y)
+        for dist_field, goal_distance in landmark_bounds:
+            start_h = max(start_h, abs(goal_distance - dist_field[start]))
+        open_set = [(start_h, start_h, start)]
+        heappush, heappop = heapq.heappush, heapq.heappop
+        expanded = 0
+        found = False
+        
+        while open_set:
+            _, _, current = heappop(open_set)
+            if closed[current]:
+                continue
+            if current == goal:
+                found = True
+                break
+            closed[current] = 1
+            expanded += 1
+            
+            x, y = current % width, current // width
+            tentative_g = g_score[current] + 1
+            for dx, dy in self.DIRECTIONS:
+                nx, ny = x + dx, y + dy
+                if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                    continue
+                neighbor = ny * width + nx
+                if occupied[neighbor] or closed[neighbor]:
+                    continue
+                if tentative_g < g_score.get(neighbor, tentative_g + 1):
+                    h = abs(nx - goal_x) + abs(ny - goal_y)
+                    for dist_field, goal_distance in landmark_bounds:
+                        distance = dist_field[neighbor]
+                        if distance < 0:
+                            # 地标能到达终点却到不了该格子，说明该格子与终点不连通
+                            h = -1
+                            break
+                        bound = goal_distance - distance if goal_distance > distance else distance - goal_distance
+                        if bound > h:
+                            h = bound
+                    if h < 0:
+                        continue
+                    g_score[neighbor] = tentative_g
+                    came_from[neighbor] = current
+                    heappush(open_set, (tentative_g + h, h, neighbor))
+        
+        self.last_search_stats = {'algorithm': 'astar', 'expanded': expanded, 'found': found,
+                                  'landmarks': len(landmark_bounds)}
+        if not found:
+            return []
+        
+        # 重构路径
+        path = [goal]
+        while path[-1] != start:
+            path.append(came_from[path[-1]])
+        path.reverse()
+        return path
+
+    def _weighted_search_cells(self, start: int, goal: int) -> List[int]:
+        """加权A*：支持通行代价、方向限制和8连通，返回格子编号序列，不可达时返回空列表"""
+        width = self.grid_width
+        height = self.grid_height
+        occupied = memoryview(self.grid.reshape(-1))
+        costs = memoryview(self.cost_grid.reshape(-1))
+        masks = memoryview(self.direction_mask.reshape(-1))
+        goal_x, goal_y = goal % width, goal // width
+        min_cost = self.min_cost
+        octile = self.connectivity == 8
+        diagonal_extra = math.sqrt(2) - 1
+        moves = self.moves()
+        
+        def estimate(x: int, y: int) -> float:
+            dx, dy = abs(x - goal_x), abs(y - goal_y)
+            if octile:
+                return min_cost * (max(dx, dy) + diagonal_extra * min(dx, dy))
+            return min_cost * (dx + dy)
+        
+        closed = bytearray(width * height)
+        g_score = {start: 0.0}
+        came_from: Dict[int, int] = {}
+        start_h = estimate(start % width, start // width)
+        open_set = [(start_h, start_h, start)]
+        heappush, heappop = heapq.heappush, heapq.heappop
+        expanded = 0
+        found = False
+        
+        while open_set:
+            _, _, current = heappop(open_set)
+            if closed[current]:
+                continue
+            if current == goal:
+                found = True
+                break
+            closed[current] = 1
+            expanded += 1
+            
+            x, y = current % width, current // width
+            mask = masks[current]
+            base = g_score[current]
+            for dx, dy, bit, length in moves:
+                if not mask & bit:
+                    continue
+                nx, ny = x + dx, y + dy
+                if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                    continue
+                neighbor = ny * width + nx
+                if occupied[neighbor] or closed[neighbor]:
+                    continue
+                if dx and dy and (occupied[y * width + nx] or occupied[ny * width + x]):
+                    continue
+                tentative_g = base + length * costs[neighbor]
+                if tentative_g < g_score.get(neighbor, math.inf):
+                    g_score[neighbor] = tentative_g
+                    came_from[neighbor] = current
+                    h = estimate(nx, ny)
+                    heappush(open_set, (tentative_g + h, h, neighbor))
+        
+        self.last_search_stats = {'algorithm': 'weighted_astar', 'expanded': expanded, 'found': found}
+        if not found:
             return []
         
-        open_set = [(0, start)]
-        came_from: Dict[Tuple[int, int], Position] = {}
-        g_score = {(start.x, start.y): 0}
-        f_score = {(start.x, start.y): self.heuristic(start, goal)}
+        path = [goal]
+        while path[-1] != start:
+            path.append(came_from[path[-1]])
+        path.reverse()
+        return path
+    
+    def _jps_cells(self, start: int, goal: int) -> List[int]:
+        """跳点搜索（4连通网格）：返回与A*代价相同的格子编号序列，不可达时返回空列表
+
+        水平方向直线前进，遇到强迫邻居（侧方格子可走而其后方被挡）或终点时停下；
+        垂直方向除强迫邻居外，若从某格子向左右能找到跳点，该格子本身也是跳点。
+        与终点无关的停止位置由 ``_jump_tables`` 预先算好，每次跳跃只需查表。
+        开放表只保存跳点，跳点之间是直线，重建路径时再补齐中间格子。
+        """
+        width = self.grid_width
+        occupied = memoryview(self.grid.reshape(-1))
+        goal_x, goal_y = goal % width, goal // width
+        tables = self._jump_tables()
+        h_next, h_prev = tables['h_next'], tables['h_prev']
+        v_next, v_prev = tables['v_next'], tables['v_prev']
+        row_segment = tables['row_segment']
+        goal_segment = row_segment[goal]
+        height = self.grid_height
+        
+        def jump_horizontal(x: int, y: int, dx: int) -> int:
+            stop = h_next[y * width + x] if dx > 0 else h_prev[y * width + x]
+            if y == goal_y and (x < goal_x <= stop if dx > 0 else stop <= goal_x < x):
+                return goal
+            if stop < 0 or stop >= width or occupied[y * width + stop]:
+                return -1
+            return y * width + stop
+        
+        def jump_vertical(x: int, y: int, dy: int) -> int:
+            stop = v_next[y * width + x] if dy > 0 else v_prev[y * width + x]
+            if y < goal_y < stop if dy > 0 else stop < goal_y < y:
+                # 经过终点所在行：若与终点水平连通，向终点方向的水平扫描必然找到跳点
+                if x == goal_x or row_segment[goal_y * width + x] == goal_segment:
+                    return goal_y * width + x
+            if stop < 0 or stop >= height or occupied[stop * width + x]:
+                return -1
+            return stop * width + x
+        
+        closed = set()
+        g_score = {start: 0}
+        came_from: Dict[int, int] = {}
+        start_h = abs(start % width - goal_x) + abs(start // width - goal_y)
+        open_set = [(start_h, start_h, start)]
+        heappush, heappop = heapq.heappush, heapq.heappop
+        expanded = 0
+        found = False
         
         while open_set:
-            current_f, current = heapq.heappop(open_set)
+            _, _, current = heappop(open_set)
+            if current in closed:
+                continue
+            if current == goal:
+                found = True
+                break
+            closed.add(current)
+            expanded += 1
             
-            if current.x == goal.x and current.y == goal.y:
-                # 重构路径
-                path = []
-                current_pos = current
-                while (current_pos.x, current_pos.y) in came_from:
-                    path.append(current_pos)
-                    current_pos = came_from[(current_pos.x, current_pos.y)]
-                path.append(start)
-                path.reverse()
-                return path
+            x, y = current % width, current // width
+            parent = came_from.get(current)
+            if parent is None:
+                directions = self.DIRECTIONS
+            else:
+                px, py = parent % width, parent // width
+                if px != x:
+                    dx = 1 if x > px else -1
+                    directions = ((dx, 0), (0, 1), (0, -1))
+                else:
+                    dy = 1 if y > py else -1
+                    directions = ((0, dy), (1, 0), (-1, 0))
             
-            for neighbor in self.get_neighbors(current):
-                tentative_g_score = g_score[(current.x, current.y)] + 1
-                neighbor_key = (neighbor.x, neighbor.y)
-                
-                if neighbor_key not in g_score or tentative_g_score < g_score[neighbor_key]:
-                    came_from[neighbor_key] = current
-                    g_score[neighbor_key] = tentative_g_score
-                    f_score[neighbor_key] = tentative_g_score + self.heuristic(neighbor, goal)
-                    heapq.heappush(open_set, (f_score[neighbor_key], neighbor))
+            for dx, dy in directions:
+                if dx:
+                    jump_point = jump_horizontal(x, y, dx)
+                else:
+                    jump_point = jump_vertical(x, y, dy)
+                if jump_point < 0 or jump_point in closed:
+                    continue
+                jx, jy = jump_point % width, jump_point // width
+                tentative_g = g_score[current] + abs(jx - x) + abs(jy - y)
+                if tentative_g < g_score.get(jump_point, tentative_g + 1):
+                    g_score[jump_point] = tentative_g
+                    came_from[jump_point] = current
+                    h = abs(jx - goal_x) + abs(jy - goal_y)
+                    heappush(open_set, (tentative_g + h, h, jump_point))
         
-        return []  # 无法找到路径
+        self.last_search_stats = {'algorithm': 'jps', 'expanded': expanded, 'found': found}
+        if not found:
+            return []
+        
+        # 跳点之间是水平或垂直直线，逐段补齐中间格子
+        cells = [goal]
+        current = goal
+        while current != start:
+            parent = came_from[current]
+            step = 1 if parent // width == current // width else width
+            if parent < current:
+                step = -step
+            cell = current
+            while cell != parent:
+                cell += step
+                cells.append(cell)
+            current = parent
+        cells.reverse()
+        return cells
+    
+    def _jump_tables(self) -> Dict[str, memoryview]:
+        """跳点搜索的查表数据，网格变化后重新计算
+
+        h_next/h_prev: 从某格子向右/向左前进时，第一个障碍或强迫邻居所在的列（越界为 width/-1）；
+        v_next/v_prev: 向下/向上前进时，第一个障碍、强迫邻居或能水平找到跳点的格子所在的行；
+        row_segment: 每行到该格子为止的障碍数，同一行两个可通行格子数值相同即水平连通。
+        """
+        if self._jump_table_cache is not None:
+            return self._jump_table_cache
+        
+        height, width = self.grid_height, self.grid_width
+        blocked = self.grid.astype(bool)
+        free = np.pad(~blocked, 1, constant_values=False)
+        center = free[1:-1, 1:-1]
+        
+        def next_event(events: np.ndarray, axis: int, forward: bool) -> np.ndarray:
+            size = events.shape[axis]
+            coords = np.arange(size).reshape((1, -1) if axis == 1 else (-1, 1))
+            if forward:
+                index = np.where(events, coords, size)
+                nearest = np.flip(np.minimum.accumulate(np.flip(index, axis), axis=axis), axis)
+                result = np.full_like(nearest, size)
+                if axis == 1:
+                    result[:, :-1] = nearest[:, 1:]
+                else:
+                    result[:-1, :] = nearest[1:, :]
+            else:
+                index = np.where(events, coords, -1)
+                nearest = np.maximum.accumulate(index, axis=axis)
+                result = np.full_like(nearest, -1)
+                if axis == 1:
+                    result[:, 1:] = nearest[:, :-1]
+                else:
+                    result[1:, :] = nearest[:-1, :]
+            return result
+        
+        # 水平前进的强迫邻居：上/下方可走，而其后方（来时一侧）被挡
+        up, down = free[:-2, 1:-1], free[2:, 1:-1]
+        forced_right = (up & ~free[:-2, :-2]) | (down & ~free[2:, :-2])
+        forced_left = (up & ~free[:-2, 2:]) | (down & ~free[2:, 2:])
+        h_next = next_event(blocked | forced_right, 1, True)
+        h_prev = next_event(blocked | forced_left, 1, False)
+        
+        # 从该格子向左或向右能找到跳点（而不是先撞到障碍或边界）
+        rows = np.arange(height).reshape(-1, 1)
+        padded_blocked = ~free[1:-1, :]
+        finds_jump = (
+            ((h_next < width) & ~padded_blocked[rows, np.minimum(h_next, width - 1) + 1]) |
+            ((h_prev >= 0) & ~padded_blocked[rows, h_prev + 1])
+        ) & center
+        
+        # 垂直前进的强迫邻居：左/右方可走，而其后方被挡
+        left, right = free[1:-1, :-2], free[1:-1, 2:]
+        forced_down = (left & ~free[:-2, :-2]) | (right & ~free[:-2, 2:])
+        forced_up = (left & ~free[2:, :-2]) | (right & ~free[2:, 2:])
+        v_next = next_event(blocked | forced_down | finds_jump, 0, True)
+        v_prev = next_event(blocked | forced_up | finds_jump, 0, False)
+        
+        row_segment = np.cumsum(blocked, axis=1)
+        self._jump_table_cache = {
+            name: memoryview(np.ascontiguousarray(array, dtype=np.int32).reshape(-1))
+            for name, array in (('h_next', h_next), ('h_prev', h_prev), ('v_next', v_next),
+                                ('v_prev', v_prev), ('row_segment', row_segment))
+        }
+        return self._jump_table_cache
+
+# 地标路线表
+class RouteTable:
+    """地标（仓库位置）之间的距离/路线表
+
+    对每个地标在 ``PathPlanner`` 网格上做一次BFS得到距离场（int32数组，-1表示不可达），
+    任意两个地标间的距离查询为O(1)，路线沿距离场回溯得到。距离场同时为任意A*查询
+    提供ALT下界 ``|d(L, 终点) - d(L, n)|``。
+
+    障碍物变化时增量维护：只改变该格子自身距离的情况直接修补距离场；
+    可能影响其他格子的变化把该地标标记为过期，过期的距离场在重建前不参与ALT，
+    重建在下次查询该地标或调用 ``refresh`` 时进行。
+    
+    网格不均匀（加权、方向限制或8连通）时改用Dijkstra计算通行代价场（float64）并记录前驱，
+    任何地形或障碍物变化都使全部距离场过期，ALT下界也不再提供。
+    
+    每个距离场占用 4×格子数 字节（1000×1000网格上为4MB），地标数量以 ``max_landmarks`` 为上限，
+    超出上限的地标不会加入。
+    """
+    
+    def __init__(self, path_planner: PathPlanner, max_active_landmarks: int = 4,
+                 max_landmarks: int = 64):
+        # 距离场随网格变化，与规划器共用一把锁
+        self._lock = path_planner.lock
+        self.planner = path_planner
+        self.max_active_landmarks = max_active_landmarks
+        self.max_landmarks = max_landmarks
+        self._landmarks: Dict[str, int] = {}  # 地标名称 -> 格子
+        self._fields: Dict[str, np.ndarray] = {}
+        self._parents: Dict[str, np.ndarray] = {}  # 加权距离场的前驱格子
+        self._stale: set = set()  # 需要重建才能给出精确距离
+        self.stats = {'builds': 0, 'patches': 0}
+        
+        path_planner.obstacle_listeners.append(self.on_obstacle_changed)
+        path_planner.route_table = self
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._landmarks
+    
+    @synchronized
+    def landmarks(self) -> Dict[str, Position]:
+        """获取全部地标及其位置"""
+        return {name: self.planner.decode(cell) for name, cell in self._landmarks.items()}
+    
+    @synchronized
+    def add_landmark(self, name: str, position: Position) -> bool:
+        """添加或移动地标，距离场在首次使用时计算；地标数量已达上限时不添加并返回False"""
+        if not self.planner.in_bounds(position):
+            raise ValueError(f"地标位置 {position} 超出网格范围")
+        cell = self.planner.encode(position)
+        if self._landmarks.get(name) == cell:
+            return True
+        if name not in self._landmarks and len(self._landmarks) >= self.max_landmarks:
+            logger.warning(f"地标数量已达上限 {self.max_landmarks}，不添加地标 {name}")
+            return False
+        self._landmarks[name] = cell
+        self._fields.pop(name, None)
+        self._parents.pop(name, None)
+        self._stale.discard(name)
+        return True
+    
+    @synchronized
+    def remove_landmark(self, name: str):
+        """移除地标"""
+        self._landmarks.pop(name, None)
+        self._fields.pop(name, None)
+        self._parents.pop(name, None)
+        self._stale.discard(name)
+    
+    @synchronized
+    def refresh(self, names: Optional[List[str]] = None) -> int:
+        """计算缺失或过期的距离场，返回重建的数量"""
+        rebuilt = 0
+        for name in names if names is not None else list(self._landmarks):
+            if name not in self._fields or name in self._stale:
+                self._build(name)
+                rebuilt += 1
+        return rebuilt
+    
+    @synchronized
+    def distance_field(self, name: str) -> np.ndarray:
+        """获取地标的精确距离场（按需重建）"""
+        if name not in self._landmarks:
+            raise KeyError(f"地标不存在: {name}")
+        self.refresh([name])
+        return self._fields[name]
+    
+    @synchronized
+    def distance(self, from_name: str, to_name: str) -> Optional[float]:
+        """两个地标间的最短路径长度（加权网格上为通行代价），不可达时返回None"""
+        dist_field = self.distance_field(from_name)
+        if from_name in self._parents:
+            distance, _ = self._weighted_entry(dist_field, self._landmarks[to_name])
+            return None if distance < 0 else float(distance)
+        distance = self._distance_to_cell(dist_field, self._landmarks[to_name])
+        return None if distance < 0 else distance
+    
+    @synchronized
+    def cached_distance(self, from_name: str, to_name: str) -> Optional[float]:
+        """只读取已是最新的距离场给出两个地标间的距离，需要计算或重建时返回None（不触发计算）"""
+        dist_field = self._fields.get(from_name)
+        if dist_field is None or from_name in self._stale or to_name not in self._landmarks:
+            return None
+        if from_name in self._parents:
+            distance, _ = self._weighted_entry(dist_field, self._landmarks[to_name])
+            return None if distance < 0 else float(distance)
+        distance = self._distance_to_cell(dist_field, self._landmarks[to_name])
+        return None if distance < 0 else distance
+    
+    @synchronized
+    def route(self, from_name: str, to_name: str) -> List[Position]:
+        """两个地标间的最短路线，不可达时返回空列表"""
+        dist_field = self.distance_field(from_name)
+        width, height = self.planner.grid_width, self.planner.grid_height
+        cell = self._landmarks[to_name]
+        if from_name in self._parents:
+            return self._weighted_route(from_name, dist_field, cell)
+        if self._distance_to_cell(dist_field, cell) < 0:
+            return []
+        
+        cells = [cell]
+        while dist_field[cell] != 0:
+            x, y = cell % width, cell // width
+            target = dist_field[cell] - 1 if dist_field[cell] > 0 else None
+            best = None
+            for dx, dy in PathPlanner.DIRECTIONS:
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < width and 0 <= ny < height):
+                    continue
+                neighbor = ny * width + nx
+                distance = dist_field[neighbor]
+                if distance < 0:
+                    continue
+                # 终点是障碍格子（如设备停放位）时，从距离最小的邻居出发
+                if target is None:
+                    if best is None or distance < dist_field[best]:
+                        best = neighbor
+                elif distance == target:
+                    best = neighbor
+                    break
+            cell = best
+            cells.append(cell)
+        cells.reverse()
+        return [self.planner.decode(c) for c in cells]
+    
+    def landmark_bounds(self, start: int, goal: int) -> List[Tuple[memoryview, int]]:
+        """为一次A*查询挑选下界最紧的若干地标，返回 (距离场, 地标到终点的距离) 列表"""
+        if not self.planner.is_uniform:
+            return []
+        candidates = []
+        for name, dist_field in self._fields.items():
+            if name in self._stale or name in self._parents:
+                continue
+            goal_distance = int(dist_field[goal])
+            start_distance = int(dist_field[start])
+            if goal_distance < 0 or start_distance < 0:
+                continue
+            candidates.append((abs(goal_distance - start_distance), name, goal_distance))
+        candidates.sort(reverse=True)
+        return [(memoryview(self._fields[name]), goal_distance)
+                for _, name, goal_distance in candidates[:self.max_active_landmarks]]
+    
+    def on_obstacle_changed(self, cell: int, blocked: bool):
+        """障碍物变化回调：能局部修补的直接修补，否则标记过期"""
+        neighbors = self._neighbor_cells(cell)
+        uniform = self.planner.is_uniform
+        for name, dist_field in self._fields.items():
+            if not uniform or name in self._parents:
+                self._stale.add(name)
+                continue
+            if cell == self._landmarks[name]:
+                continue
+            distance = int(dist_field[cell])
+            if blocked:
+                if distance < 0:
+                    continue
+                # 没有邻居以该格子为前驱时，其他格子的距离不变
+                if any(dist_field[n] == distance + 1 for n in neighbors):
+                    self._stale.add(name)
+                else:
+                    dist_field[cell] = -1
+                    self.stats['patches'] += 1
+            else:
+                reachable = [int(dist_field[n]) for n in neighbors if dist_field[n] >= 0]
+                new_distance = min(reachable) + 1 if reachable else -1
+                free_unreachable = any(dist_field[n] < 0 and not self.planner.grid.flat[n] for n in neighbors)
+                improves = new_distance >= 0 and any(dist_field[n] > new_distance + 1 for n in neighbors)
+                if (new_distance >= 0 and free_unreachable) or improves:
+                    self._stale.add(name)
+                else:
+                    dist_field[cell] = new_distance
+                    self.stats['patches'] += 1
+    
+    def _neighbor_cells(self, cell: int) -> List[int]:
+        width, height = self.planner.grid_width, self.planner.grid_height
+        x, y = cell % width, cell // width
+        return [(y + dy) * width + (x + dx) for dx, dy in PathPlanner.DIRECTIONS
+                if 0 <= x + dx < width and 0 <= y + dy < height]
+    
+    def _distance_to_cell(self, dist_field: np.ndarray, cell: int) -> int:
+        """地标到某格子的距离；格子本身是障碍时取其可达邻居的最小距离加一"""
+        distance = int(dist_field[cell])
+        if distance >= 0 or not self.planner.grid.flat[cell]:
+            return distance
+        reachable = [int(dist_field[n]) for n in self._neighbor_cells(cell) if dist_field[n] >= 0]
+        return min(reachable) + 1 if reachable else -1
+    
+    def _weighted_entry(self, dist_field: np.ndarray, cell: int) -> Tuple[float, int]:
+        """加权距离场中到某格子的代价及其前驱；格子本身是障碍时取代价最小的可进入邻居"""
+        if dist_field[cell] >= 0 or not self.planner.grid.flat[cell]:
+            return float(dist_field[cell]), -1
+        planner = self.planner
+        width = planner.grid_width
+        x, y = cell % width, cell // width
+        best, best_parent = -1.0, -1
+        for dx, dy, bit, length in planner.moves():
+            nx, ny = x - dx, y - dy
+            if not (0 <= nx < width and 0 <= ny < planner.grid_height):
+                continue
+            neighbor = ny * width + nx
+            if dist_field[neighbor] < 0 or not planner.direction_mask.flat[neighbor] & bit:
+                continue
+            if dx and dy and (planner.grid.flat[ny * width + x] or planner.grid.flat[y * width + nx]):
+                continue
+            distance = float(dist_field[neighbor]) + length * int(planner.cost_grid.flat[cell])
+            if best < 0 or distance < best:
+                best, best_parent = distance, neighbor
+        return best, best_parent
+    
+    def _weighted_route(self, name: str, dist_field: np.ndarray, cell: int) -> List[Position]:
+        distance, parent = self._weighted_entry(dist_field, cell)
+        if distance < 0:
+            return []
+        parents = self._parents[name]
+        cells = [cell]
+        current = parent if parent >= 0 else parents[cell]
+        while current >= 0:
+            cells.append(int(current))
+            current = parents[current]
+        cells.reverse()
+        return [self.planner.decode(c) for c in cells]
+    
+    def _build(self, name: str):
+        """计算地标的距离场（地标格子本身即使是障碍也作为起点）"""
+        if self.planner.is_uniform:
+            self._fields[name] = grid_distance_field(self.planner.grid, self._landmarks[name])
+            self._parents.pop(name, None)
+        else:
+            self._fields[name], self._parents[name] = weighted_distance_field(
+                self.planner, self._landmarks[name])
+        self._stale.discard(name)
+        self.stats['builds'] += 1
+
+# 批量规划工作进程中的路径规划器及其共享内存，由 _plan_worker_init 创建
+_worker_planner: Optional[PathPlanner] = None
+_worker_shared_grid: Optional[shared_memory.SharedMemory] = None
+
+def _plan_worker_init(shm_name: str, shape: Tuple[int, int], connectivity: int):
+    """进程池初始化：创建直接读取共享内存网格的路径规划器"""
+    global _worker_planner, _worker_shared_grid
+    _worker_shared_grid = shared_memory.SharedMemory(name=shm_name)
+    layers = np.ndarray((3,) + shape, dtype=np.uint8, buffer=_worker_shared_grid.buf)
+    planner = PathPlanner((shape[1], shape[0]), cache_size=0, connectivity=connectivity)
+    planner.grid, planner.cost_grid, planner.direction_mask = layers[0], layers[1], layers[2]
+    planner.grid_version = -1
+    _worker_planner = planner
+
+def _plan_chunk(terrain: Tuple[int, int, int, int], keys: List[Tuple[int, int]],
+                algorithm: str) -> List[Tuple[int, ...]]:
+    """在工作进程中计算一块查询；terrain 为主进程网格的 (版本号, 最小代价, 加权格子数, 限向格子数)"""
+    planner = _worker_planner
+    version, min_cost, weighted_cells, restricted_cells = terrain
+    if planner.grid_version != version:
+        planner.grid_version = version
+        planner.min_cost = min_cost
+        planner._weighted_cells = weighted_cells
+        planner._restricted_cells = restricted_cells
+        planner._jump_table_cache = None
+    search = planner._search_for(algorithm)
+    return [tuple(search(*key)) for key in keys]
+
+def grid_distance_field(grid: np.ndarray, source: int,
+                        direction_mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """在占用网格上从source做逐层向量化BFS，返回展平的int32距离场（-1表示不可达）
+    
+    source格子本身即使被占用也作为起点；4连通，每步代价为1。给出 ``direction_mask``
+    （单行道）时沿反向边搜索，结果为从各格子出发到达source的距离。
+    """
+    height, width = grid.shape
+    free = grid.reshape(-1) == 0
+    mask = direction_mask.reshape(-1) if direction_mask is not None else None
+    dist_field = np.full(width * height, -1, dtype=np.int32)
+    dist_field[source] = 0
+    frontier = np.array([source], dtype=np.int64)
+    distance = 0
+    
+    while frontier.size:
+        distance += 1
+        x = frontier % width
+        # 前驱格子沿方向 (dx, dy) 移动一步到达frontier
+        predecessors = []
+        for bit, (dx, dy) in enumerate(PathPlanner.DIRECTIONS):
+            valid = (x - dx >= 0) & (x - dx < width)
+            valid &= (frontier - dy * width >= 0) & (frontier - dy * width < width * height)
+            cells = frontier[valid] - dx - dy * width
+            if mask is not None:
+                cells = cells[(mask[cells] & (1 << bit)) != 0]
+            predecessors.append(cells)
+        neighbors = np.concatenate(predecessors)
+        neighbors = neighbors[(dist_field[neighbors] < 0) & free[neighbors]]
+        frontier = np.unique(neighbors)
+        dist_field[frontier] = distance
+    
+    return dist_field
+
+def weighted_distance_field(planner: PathPlanner, source: int) -> Tuple[np.ndarray, np.ndarray]:
+    """在加权网格上从source做Dijkstra，返回 (通行代价场, 前驱格子)，不可达为-1
+    
+    遵循路径规划器的通行代价、方向限制和连通性；source格子本身即使被占用也作为起点。
+    """
+    width, height = planner.grid_width, planner.grid_height
+    occupied = memoryview(planner.grid.reshape(-1))
+    costs = memoryview(planner.cost_grid.reshape(-1))
+    masks = memoryview(planner.direction_mask.reshape(-1))
+    moves = planner.moves()
+    distances = {source: 0.0}
+    parents = {source: -1}
+    done = bytearray(width * height)
+    heap = [(0.0, source)]
+    
+    while heap:
+        distance, cell = heapq.heappop(heap)
+        if done[cell]:
+            continue
+        done[cell] = 1
+        x, y = cell % width, cell // width
+        mask = masks[cell]
+        for dx, dy, bit, length in moves:
+            if not mask & bit:
+                continue
+            nx, ny = x + dx, y + dy
+            if nx < 0 or ny < 0 or nx >= width or ny >= height:
+                continue
+            neighbor = ny * width + nx
+            if occupied[neighbor] or done[neighbor]:
+                continue
+            if dx and dy and (occupied[y * width + nx] or occupied[ny * width + x]):
+                continue
+            candidate = distance + length * costs[neighbor]
+            if candidate < distances.get(neighbor, math.inf):
+                distances[neighbor] = candidate
+                parents[neighbor] = cell
+                heapq.heappush(heap, (candidate, neighbor))
+    
+    dist_field = np.full(width * height, -1.0)
+    parent_array = np.full(width * height, -1, dtype=np.int64)
+    cells = np.fromiter(distances.keys(), dtype=np.int64, count=len(distances))
+    dist_field[cells] = np.fromiter(distances.values(), dtype=float, count=len(distances))
+    parent_array[cells] = np.fromiter((parents[c] for c in distances), dtype=np.int64, count=len(distances))
+    return dist_field, parent_array
+
+# 数据库行转换
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    """解析sqlite3默认适配器写入的时间字符串"""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+def _format_timestamp(value: Optional[datetime]) -> Optional[str]:
+    """把时间格式化为可由 ``_parse_timestamp`` 解析的字符串（用于JSON列）"""
+    return value.isoformat() if value is not None else None
+
+def _task_from_row(row: tuple) -> Task:
+    """由tasks表的一行构造任务（含子任务）"""
+    (task_id, task_type, status, priority, created_at, start_time, end_time,
+     deadline, assigned_equipment, metadata, sub_tasks) = row
+    task = Task(
+        id=task_id,
+        task_type=TaskType(task_type),
+        priority=priority,
+        status=TaskStatus(status),
+        created_at=_parse_timestamp(created_at),
+        start_time=_parse_timestamp(start_time),
+        end_time=_parse_timestamp(end_time),
+        deadline=_parse_timestamp(deadline),
+        assigned_equipment=assigned_equipment,
+        metadata=json.loads(metadata) if metadata else {}
+    )
+    for sub in json.loads(sub_tasks) if sub_tasks else []:
+        sub_task = Task(
+            id=sub['id'],
+            task_type=TaskType(sub['type']),
+            priority=sub.get('priority', 1),
+            status=TaskStatus(sub['status']),
+            start_time=_parse_timestamp(sub.get('start_time')),
+            end_time=_parse_timestamp(sub.get('end_time')),
+            deadline=_parse_timestamp(sub.get('deadline')),
+            metadata=sub.get('metadata', {})
+        )
+        # 旧版本保存的子任务没有创建时间，沿用父任务的创建时间
+        sub_task.created_at = _parse_timestamp(sub.get('created_at')) or task.created_at
+        task.sub_tasks.append(sub_task)
+    return task
 
 # 数据库管理
 class DatabaseManager:
-    """数据库管理器"""
-    
-    def __init__(self, db_path: str = "tms_system.db"):
+    """数据库管理器
+
+    通过有界连接池复用长连接，避免每次写入都重新建立连接；连接启用WAL日志模式，
+    并通过 ``cached_statements`` 复用预编译语句。
+    """
+    
+    # 固定的SQL文本，保证命中sqlite3的预编译语句缓存
+    SAVE_PRODUCT_SQL = '''
+        INSERT OR REPLACE INTO products 
+        (id, name, weight, volume, category, unit_price)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+    SAVE_WAREHOUSE_SQL = '''
+        INSERT OR REPLACE INTO warehouses 
+        (id, name, type, position_x, position_y, capacity, current_volume)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+    SAVE_TASK_SQL = '''
+        INSERT OR REPLACE INTO tasks 
+        (id, type, status, priority, created_at, start_time, end_time, 
+         deadline, assigned_equipment, metadata, sub_tasks)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    SAVE_EQUIPMENT_SQL = '''
+        INSERT OR REPLACE INTO equipment 
+        (id, name, type, position_x, position_y, status, capacity, warehouse_id, current_load)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    UPSERT_INVENTORY_SQL = '''
+        INSERT INTO inventory (warehouse_id, product_id, quantity, last_updated)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(warehouse_id, product_id) DO UPDATE SET
+            quantity = excluded.quantity,
+            last_updated = excluded.last_updated
+    '''
+    DELETE_INVENTORY_SQL = '''
+        DELETE FROM inventory WHERE warehouse_id = ? AND product_id = ?
+    '''
+    UPDATE_WAREHOUSE_VOLUME_SQL = '''
+        UPDATE warehouses SET current_volume = ? WHERE id = ?
+    '''
+    SAVE_SHIP_PLAN_SQL = '''
+        INSERT OR REPLACE INTO ship_plans 
+        (id, products, deadline, priority, ship_name, destination, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    '''
+    
+    SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+    JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+    
+    def __init__(self, db_path: str = "tms_system.db", journal_mode: str = "WAL",
+                 synchronous: str = "NORMAL", pool_size: int = 4,
+                 cached_statements: int = 128, busy_timeout: float = 5.0,
+                 write_behind: bool = False, flush_interval: float = 0.5,
+                 batch_size: int = 500):
+        synchronous = synchronous.upper()
+        if synchronous not in self.SYNCHRONOUS_LEVELS:
+            raise ValueError(f"无效的synchronous级别: {synchronous}")
+        journal_mode = journal_mode.upper()
+        if journal_mode not in self.JOURNAL_MODES:
+            raise ValueError(f"无效的journal_mode: {journal_mode}")
+        if pool_size < 1:
+            raise ValueError("连接池大小必须大于0")
+        
         self.db_path = db_path
+        # 内存数据库的每个连接都是一个独立的空库，因此只使用一个共享连接
+        self.in_memory = db_path in (":memory:", "")
+        if self.in_memory:
+            pool_size = 1
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.pool_size = pool_size
+        self.cached_statements = cached_statements
+        self.busy_timeout = busy_timeout
+        
+        # 有界连接池：空闲连接放在LIFO队列中，优先复用最近使用过的连接
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self._pool_lock = threading.Lock()
+        self._created_connections = 0
+        self._closed = False
+        
+        # 写回模式：任务状态和库存变更先入队，由后台线程批量落盘；否则每次变更同步提交
+        self.write_behind = write_behind
+        self.write_queue = WriteBehindQueue(self, flush_interval, batch_size)
+        
         self.init_database()
     
+    def _open_connection(self) -> sqlite3.Connection:
+        """打开并配置一个新连接"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False
+        )
+        # 内存数据库不支持WAL，PRAGMA会返回实际生效的模式
+        conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+    
+    def _acquire(self) -> sqlite3.Connection:
+        """从连接池借出连接，池未满时按需新建，否则等待归还"""
+        if self._closed:
+            raise RuntimeError("数据库管理器已关闭")
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._pool_lock:
+            if self._created_connections < self.pool_size:
+                self._created_connections += 1
+                try:
+                    return self._open_connection()
+                except Exception:
+                    self._created_connections -= 1
+                    raise
+        try:
+            return self._pool.get(timeout=self.busy_timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"等待数据库连接超时（{self.busy_timeout}秒，连接池大小 {self.pool_size}）"
+            ) from None
+    
+    def _release(self, conn: sqlite3.Connection):
+        """归还连接"""
+        if self._closed:
+            conn.close()
+            return
+        self._pool.put_nowait(conn)
+    
+    @contextmanager
+    def connection(self):
+        """借用一个连接，使用完毕后自动归还"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+    
+    @contextmanager
+    def transaction(self):
+        """借用连接并开启事务，正常退出时提交，异常时回滚"""
+        with self.connection() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def close(self):
+        """排空写回队列后关闭连接池中的所有连接"""
+        if self._closed:
+            return
+        self.write_queue.close()
+        self._closed = True
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+    
     def init_database(self):
         """初始化数据库表"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.transaction() as conn:
             cursor = conn.cursor()
             
             # 产品表
@@ -445,6 +2406,7 @@ class DatabaseManager:
                     status TEXT DEFAULT 'idle',
                     capacity REAL,
                     warehouse_id TEXT,
+                    current_load REAL DEFAULT 0.0,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
@@ -476,72 +2438,609 @@ class DatabaseManager:
                 )
             ''')
             
-            conn.commit()
+            # 船运计划表
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ship_plans (
+                    id TEXT PRIMARY KEY,
+                    products TEXT NOT NULL,
+                    deadline TIMESTAMP,
+                    priority INTEGER DEFAULT 1,
+                    ship_name TEXT,
+                    destination TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # 旧版本数据库没有子任务列
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(tasks)")}
+            if 'sub_tasks' not in columns:
+                cursor.execute("ALTER TABLE tasks ADD COLUMN sub_tasks TEXT")
+            # 旧版本数据库没有设备载重列
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(equipment)")}
+            if 'current_load' not in columns:
+                cursor.execute("ALTER TABLE equipment ADD COLUMN current_load REAL DEFAULT 0.0")
+    
+    @staticmethod
+    def _product_row(product: Product) -> tuple:
+        return (product.id, product.name, product.weight, product.volume, 
+                product.category, product.unit_price)
+    
+    @staticmethod
+    def _warehouse_row(warehouse: Warehouse) -> tuple:
+        return (warehouse.id, warehouse.name, warehouse.warehouse_type.value,
+                warehouse.position.x, warehouse.position.y, 
+                warehouse.capacity, warehouse.current_volume)
+    
+    @staticmethod
+    def _equipment_row(equipment: Equipment) -> tuple:
+        return (equipment.id, equipment.name, equipment.__class__.__name__,
+                equipment.position.x, equipment.position.y, equipment.status.value,
+                getattr(equipment, 'capacity', None), getattr(equipment, 'warehouse_id', None),
+                getattr(equipment, 'current_load', 0.0))
     
     def save_product(self, product: Product):
         """保存产品信息"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO products 
-                (id, name, weight, volume, category, unit_price)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (product.id, product.name, product.weight, product.volume, 
-                  product.category, product.unit_price))
-            conn.commit()
+        with self.transaction() as conn:
+            conn.execute(self.SAVE_PRODUCT_SQL, self._product_row(product))
+    
+    @staticmethod
+    def _inventory_rows(warehouse: Warehouse, timestamp: datetime) -> List[tuple]:
+        return [(warehouse.id, product_id, quantity, timestamp)
+                for product_id, quantity in warehouse.products.items()]
     
     def save_warehouse(self, warehouse: Warehouse):
-        """保存仓库信息"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO warehouses 
-                (id, name, type, position_x, position_y, capacity, current_volume)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (warehouse.id, warehouse.name, warehouse.warehouse_type.value,
-                  warehouse.position.x, warehouse.position.y, 
-                  warehouse.capacity, warehouse.current_volume))
-            conn.commit()
+        """保存仓库信息及其完整库存"""
+        self.save_warehouses_bulk([warehouse])
+    
+    def save_equipment(self, equipment: Equipment):
+        """保存设备信息（写回模式下仅入队，按设备合并，由后台线程批量落盘）"""
+        row = self._equipment_row(equipment)
+        if self.write_behind:
+            self.write_queue.enqueue(('equipment', equipment.id), self.SAVE_EQUIPMENT_SQL, row)
+            return
+        with self.transaction() as conn:
+            conn.execute(self.SAVE_EQUIPMENT_SQL, row)
+    
+    def save_products_bulk(self, products: List[Product]):
+        """在单个事务中批量保存产品"""
+        with self.transaction() as conn:
+            conn.executemany(self.SAVE_PRODUCT_SQL, [self._product_row(p) for p in products])
+    
+    def save_warehouses_bulk(self, warehouses: List[Warehouse]):
+        """在单个事务中批量保存仓库及其完整库存
+
+        完整快照会覆盖写回队列中这些仓库尚未落盘的增量变化，因此先将其丢弃。
+        """
+        now = datetime.now()
+        warehouse_ids = {w.id for w in warehouses}
+        with self.write_queue.paused():
+            self.write_queue.discard(
+                lambda key: key[0] in ('inventory', 'warehouse_volume') and key[1] in warehouse_ids
+            )
+            with self.transaction() as conn:
+                conn.executemany(self.SAVE_WAREHOUSE_SQL, [self._warehouse_row(w) for w in warehouses])
+                conn.executemany("DELETE FROM inventory WHERE warehouse_id = ?",
+                                 [(w.id,) for w in warehouses])
+                conn.executemany(self.UPSERT_INVENTORY_SQL,
+                                 [row for w in warehouses for row in self._inventory_rows(w, now)])
+    
+    def save_inventory_change(self, warehouse: Warehouse, product_id: str):
+        """记录一次库存变化
+
+        以增量upsert（库存为0时删除）更新该产品的库存行，并更新仓库的当前体积，
+        不会重写整行仓库数据。写回模式下两者进入写回队列，按 (仓库, 产品) 和仓库合并，
+        由后台线程批量落盘，持久性与写回队列相同（崩溃最多丢失一个刷新周期）；
+        否则在返回前同步提交。
+        """
+        quantity = warehouse.products.get(product_id, 0)
+        if quantity:
+            inventory_write = (self.UPSERT_INVENTORY_SQL,
+                               (warehouse.id, product_id, quantity, datetime.now()))
+        else:
+            inventory_write = (self.DELETE_INVENTORY_SQL, (warehouse.id, product_id))
+        volume_write = (self.UPDATE_WAREHOUSE_VOLUME_SQL, (warehouse.current_volume, warehouse.id))
+        
+        if self.write_behind:
+            self.write_queue.enqueue(('inventory', warehouse.id, product_id), *inventory_write)
+            self.write_queue.enqueue(('warehouse_volume', warehouse.id), *volume_write)
+            return
+        with self.transaction() as conn:
+            conn.execute(*inventory_write)
+            conn.execute(*volume_write)
+    
+    def save_equipment_bulk(self, equipment_list: List[Equipment]):
+        """在单个事务中批量保存设备
+        
+        写回队列中这些设备尚未落盘的旧版本会覆盖本次写入，因此先将其丢弃。
+        """
+        equipment_ids = {e.id for e in equipment_list}
+        with self.write_queue.paused():
+            self.write_queue.discard(lambda key: key[0] == 'equipment' and key[1] in equipment_ids)
+            with self.transaction() as conn:
+                conn.executemany(self.SAVE_EQUIPMENT_SQL, [self._equipment_row(e) for e in equipment_list])
     
     def save_task(self, task: Task):
-        """保存任务信息"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO tasks 
-                (id, type, status, priority, created_at, start_time, end_time, 
-                 deadline, assigned_equipment, metadata)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (task.id, task.task_type.value, task.status.value, task.priority,
-                  task.created_at, task.start_time, task.end_time, task.deadline,
-                  task.assigned_equipment, json.dumps(task.metadata)))
-            conn.commit()
+        """保存任务信息（写回模式下仅入队，由后台线程批量落盘）"""
+        sub_tasks = [
+            {
+                'id': st.id,
+                'type': st.task_type.value,
+                'status': st.status.value,
+                'priority': st.priority,
+                'created_at': _format_timestamp(st.created_at),
+                'start_time': _format_timestamp(st.start_time),
+                'end_time': _format_timestamp(st.end_time),
+                'deadline': _format_timestamp(st.deadline),
+                'metadata': st.metadata
+            } for st in task.sub_tasks
+        ]
+        row = (task.id, task.task_type.value, task.status.value, task.priority,
+               task.created_at, task.start_time, task.end_time, task.deadline,
+               task.assigned_equipment, json.dumps(task.metadata), json.dumps(sub_tasks))
+        if self.write_behind:
+            self.write_queue.enqueue(('tasks', task.id), self.SAVE_TASK_SQL, row)
+            return
+        with self.transaction() as conn:
+            conn.execute(self.SAVE_TASK_SQL, row)
+    
+    def save_ship_plan(self, ship_plan: ShipPlan):
+        """保存船运计划"""
+        with self.transaction() as conn:
+            conn.execute(self.SAVE_SHIP_PLAN_SQL,
+                         (ship_plan.id, json.dumps(ship_plan.products), ship_plan.deadline,
+                          ship_plan.priority, ship_plan.ship_name, ship_plan.destination,
+                          ship_plan.created_at))
+    
+    def flush(self) -> int:
+        """将写回队列中的待写数据同步落盘，返回写入的行数"""
+        return self.write_queue.flush()
+    
+    def iter_rows(self, sql: str, params: tuple = (), arraysize: int = 1000, dedicated: bool = False):
+        """流式读取查询结果，每次从游标取 ``arraysize`` 行，避免一次性载入内存
+        
+        dedicated=True 时使用单独的连接而不是从连接池借用，用于持续时间取决于客户端的流式导出，
+        避免慢客户端长时间占住连接池；WAL模式下该连接的读取不阻塞写入。
+        内存数据库无法打开第二个连接，此时在共享连接上一次读出全部结果后再逐行返回。
+        """
+        if dedicated and self.in_memory:
+            with self.connection() as conn:
+                rows = conn.execute(sql, params).fetchall()
+            yield from rows
+            return
+        if dedicated:
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+            context = closing(conn)
+        else:
+            context = self.connection()
+        with context as conn:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(arraysize)
+                if not rows:
+                    break
+                yield from rows
+
+# 批量写回队列
+class WriteBehindQueue:
+    """批量写回（write-behind）队列
+
+    变更先进入内存队列，按键合并（同一键只保留最新的一次写入），
+    由后台线程每隔 ``flush_interval`` 秒或积累 ``batch_size`` 条时，
+    在单个事务中用 ``executemany`` 批量写入。
+
+    持久性保证：
+    - ``enqueue`` 返回时数据只在内存中，进程崩溃最多丢失最近一个刷新周期内的变更；
+    - ``flush()`` 返回时，返回前入队的全部变更都已提交（落盘程度取决于synchronous级别）；
+    - ``close()`` 会先排空队列再退出，进程正常退出时通过atexit自动调用；
+    - 写入失败的批次会重新入队（若该键期间没有更新的写入），在下个周期重试。
+    """
+    
+    def __init__(self, db_manager: 'DatabaseManager', flush_interval: float = 0.5,
+                 batch_size: int = 500):
+        if flush_interval <= 0:
+            raise ValueError("刷新间隔必须大于0")
+        if batch_size < 1:
+            raise ValueError("批量大小必须大于0")
+        
+        self.db_manager = db_manager
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        
+        # 键 -> (SQL, 参数)，保持入队顺序
+        self._pending: Dict[Any, Tuple[str, tuple]] = {}
+        self._condition = threading.Condition()
+        # 串行化落盘，避免同一键的旧值晚于新值提交
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        
+        self.stats = {
+            'enqueued': 0,
+            'coalesced': 0,
+            'written': 0,
+            'batches': 0,
+            'failed_batches': 0
+        }
+    
+    def __len__(self) -> int:
+        return len(self._pending)
+    
+    def enqueue(self, key: Any, sql: str, params: tuple):
+        """加入一条待写记录，同一键的旧记录会被覆盖"""
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("写回队列已关闭")
+            if key in self._pending:
+                # 删除后重新插入，使合并后的记录按最新顺序写入
+                del self._pending[key]
+                self.stats['coalesced'] += 1
+            self._pending[key] = (sql, params)
+            self.stats['enqueued'] += 1
+            
+            if self._thread is None:
+                self._start_writer()
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+    
+    def flush(self) -> int:
+        """同步写入所有待写记录，返回写入的行数"""
+        written = 0
+        while True:
+            batch_written = self._write_next_batch()
+            if batch_written == 0:
+                return written
+            written += batch_written
+    
+    @contextmanager
+    def paused(self):
+        """暂停落盘：上下文内不会有批次正在写入或开始写入"""
+        with self._write_lock:
+            yield self
+    
+    def discard(self, predicate: Callable[[Any], bool]) -> int:
+        """丢弃键满足条件的待写记录，返回丢弃的条数"""
+        with self._condition:
+            keys = [key for key in self._pending if predicate(key)]
+            for key in keys:
+                del self._pending[key]
+        return len(keys)
+    
+    def close(self):
+        """停止后台线程并排空队列"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+            atexit.unregister(self.close)
+        self.flush()
+    
+    def _start_writer(self):
+        """启动后台写线程（调用方需持有条件锁）"""
+        self._thread = threading.Thread(target=self._run, name="tms-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def _run(self):
+        """后台写线程主循环"""
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopped or len(self._pending) >= self.batch_size,
+                    timeout=self.flush_interval
+                )
+                stopped = self._stopped
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"写回队列刷新失败: {e}")
+            if stopped:
+                return
+    
+    def _write_next_batch(self) -> int:
+        """取出至多batch_size条记录，在单个事务中写入"""
+        with self._write_lock:
+            with self._condition:
+                if not self._pending:
+                    return 0
+                keys = list(itertools.islice(self._pending, self.batch_size))
+                batch = [(key, self._pending.pop(key)) for key in keys]
+            
+            # 按SQL分组，同一语句使用executemany
+            grouped: Dict[str, List[tuple]] = {}
+            for _, (sql, params) in batch:
+                grouped.setdefault(sql, []).append(params)
+            
+            try:
+                with self.db_manager.transaction() as conn:
+                    for sql, rows in grouped.items():
+                        conn.executemany(sql, rows)
+            except Exception:
+                self.stats['failed_batches'] += 1
+                with self._condition:
+                    requeued = {key: item for key, item in batch if key not in self._pending}
+                    requeued.update(self._pending)
+                    self._pending = requeued
+                raise
+            
+            self.stats['written'] += len(batch)
+            self.stats['batches'] += 1
+            return len(batch)
 
 # 主系统类
 class TMSSystem:
-    """TMS运输管理系统主类"""
-    
-    def __init__(self, grid_size: Tuple[int, int] = (20, 20), db_path: str = "tms_system.db"):
+    """TMS运输管理系统主类
+    
+    线程安全：多个线程可以同时创建、分配和执行任务。设备的占用通过 ``Equipment.try_reserve``
+    原子完成，同一台设备不会被两个任务同时占用；内转任务按仓库ID顺序锁定源和目标仓库。
+    读取方可以使用 ``snapshot()`` 和各对象的 ``snapshot()`` 获取无需加锁的只读快照。
+    加锁顺序固定为 任务 -> 仓库/设备 -> 索引/计数器，以避免死锁。
+    """
+    
+    SCHEDULE_MODES = ('greedy', 'optimal')
+    # 任务锁的分段数
+    TASK_LOCK_STRIPES = 64
+    
+    def __init__(self, grid_size: Tuple[int, int] = (20, 20), db_path: str = "tms_system.db",
+                 db_synchronous: str = "NORMAL", write_behind: bool = False,
+                 flush_interval: float = 0.5, flush_batch_size: int = 500,
+                 load_from_db: bool = False, status_self_check: bool = False,
+                 path_connectivity: int = 4, state_store=None):
         self.grid_size = grid_size
-        self.path_planner = PathPlanner(grid_size)
-        self.db_manager = DatabaseManager(db_path)
+        self.path_planner = PathPlanner(grid_size, connectivity=path_connectivity)
+        # 路线表、多车规划器和增量重规划器都依附于规划器的网格，共用它的锁
+        self._planner_lock = self.path_planner.lock
+        # 仓库位置之间的路线表，同时为路径规划提供ALT下界
+        self.route_table = RouteTable(self.path_planner)
+        self.db_manager = DatabaseManager(
+            db_path,
+            synchronous=db_synchronous,
+            write_behind=write_behind,
+            flush_interval=flush_interval,
+            batch_size=flush_batch_size
+        )
         
         # 系统组件
         self.products: Dict[str, Product] = {}
         self.warehouses: Dict[str, Warehouse] = {}
         self.equipment: Dict[str, Equipment] = {}
-        self.tasks: Dict[str, Task] = {}
+        self.tasks = TaskRepository()
         self.ship_plans: Dict[str, ShipPlan] = {}
         
+        # 并发：注册表、状态计数器各有一把锁，任务按ID分段加锁（分配和执行同一任务互斥），
+        # 设备、仓库、任务仓库、空间索引和路径规划器各自持有自己的锁
+        self._registry_lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self._task_locks = [threading.RLock() for _ in range(self.TASK_LOCK_STRIPES)]
+        
+        # get_system_status 使用的增量计数器，随设备状态和库存变化更新
+        self._equipment_status_counts: Dict[EquipmentStatus, int] = {
+            status: 0 for status in EquipmentStatus
+        }
+        self._warehouse_utilization: Dict[str, float] = {}
+        # 空闲设备空间索引，供调度时查找最近的可用设备
+        self.equipment_index = EquipmentSpatialIndex(grid_size)
+        # 每个格子上的设备数量（在 _planner_lock 下维护）：设备位置是路径规划网格中的障碍物，
+        # 格子上的最后一台设备离开时才移除障碍物
+        self._equipment_cells: Dict[Tuple[int, int], int] = {}
+        # 最优匹配调度的代价权重，以及代价矩阵的规模上限（超过时回退到贪心）；
+        # 求解复杂度为 O(行数² × 列数)，1000×1000 约需1秒，更大的矩阵会长时间阻塞请求
+        self.assignment_weights = {'priority': 10.0, 'deadline': 1.0, 'slack_horizon_hours': 24.0}
+        self.max_assignment_cells = 1_000_000
+        # 多车协同规划器，首次调用 plan_equipment_moves 时创建
+        self._multi_agent_planner = None
+        # 设备在途路线的增量重规划器，首次调用 open_equipment_route 时创建
+        self._route_replanner = None
+        # 异步任务执行器，首次调用 submit_task_execution 时在 _executor_lock 下创建
+        self._task_executor = None
+        self._executor_lock = threading.Lock()
+        self.executor_workers = 8
+        # 状态变更版本号，每次修改状态（包括同步到其他进程的修改）时递增并通知监听者，
+        # 供长轮询等待状态变化；监听者在修改状态的线程中调用，应尽快返回
+        self.change_version = 0
+        self.change_listeners: List[Callable[[int], None]] = []
+        # 自检模式：每次获取状态时用全量扫描校验计数器（用于测试）
+        self.status_self_check = status_self_check
+        
         # 执行日志
         self.execution_log: List[str] = []
         
         logger.info("TMS系统初始化完成")
-    
+        
+        # 多进程共享的状态存储（``tms_state_store.StateStore``），为None时状态只在本进程内；
+        # 从数据库恢复状态之后才创建同步器，恢复的对象由 publish_all 整体发布
+        self.state_store = state_store
+        self.state_sync = None
+        # 执行任务遇到版本冲突时的重试次数
+        self.state_retries = 3
+        
+        if load_from_db:
+            self.load_state_from_db()
+        
+        if state_store is not None:
+            from tms_state_store import StateSynchronizer
+            self.state_sync = StateSynchronizer(self, state_store)
+            if state_store.last_seq() == 0:
+                self.state_sync.publish_all()
+            self.state_sync.sync()
+    
+    def load_state_from_db(self) -> Dict[str, Any]:
+        """从数据库恢复内存状态（冷启动）
+
+        按表流式读取，直接构造内存对象，不经过 add_* 方法，
+        因此不会产生逐条日志和重复写库。返回各类对象数量和耗时。
+        """
+        start = time.perf_counter()
+        db = self.db_manager
+        
+        for row in db.iter_rows("SELECT id, name, weight, volume, category, unit_price FROM products"):
+            product = Product(*row)
+            self.products[product.id] = product
+        
+        warehouse_classes = {
+            WarehouseType.TERMINAL.value: TerminalWarehouse,
+            WarehouseType.PRODUCT.value: ProductWarehouse
+        }
+        for wid, name, wtype, x, y, capacity, current_volume in db.iter_rows(
+                "SELECT id, name, type, position_x, position_y, capacity, current_volume FROM warehouses"):
+            warehouse_class = warehouse_classes.get(wtype)
+            if warehouse_class is None:
+                logger.warning(f"跳过未知类型的仓库 {wid}: {wtype}")
+                continue
+            warehouse = warehouse_class(wid, name, Position(x, y), capacity)
+            warehouse.current_volume = current_volume or 0.0
+            self._register_warehouse(warehouse)
+        
+        for warehouse_id, product_id, quantity in db.iter_rows(
+                "SELECT warehouse_id, product_id, quantity FROM inventory"):
+            warehouse = self.warehouses.get(warehouse_id)
+            if warehouse is not None and quantity:
+                warehouse.products[product_id] = quantity
+        
+        for eid, name, etype, x, y, status, capacity, warehouse_id, current_load in db.iter_rows(
+                "SELECT id, name, type, position_x, position_y, status, capacity, warehouse_id, "
+                "current_load FROM equipment"):
+            position = Position(x, y)
+            if etype == Crane.__name__:
+                equipment = Crane(eid, name, position, warehouse_id or "", capacity)
+            elif etype == FrameTruck.__name__:
+                equipment = FrameTruck(eid, name, position, capacity)
+            elif etype == Frame.__name__:
+                equipment = Frame(eid, name, position, capacity)
+            else:
+                logger.warning(f"跳过未知类型的设备 {eid}: {etype}")
+                continue
+            equipment.status = EquipmentStatus(status)
+            if hasattr(equipment, 'current_load'):
+                equipment.current_load = current_load or 0.0
+            self._register_equipment(equipment)
+        
+        for pid, products, deadline, priority, ship_name, destination, created_at in db.iter_rows(
+                "SELECT id, products, deadline, priority, ship_name, destination, created_at FROM ship_plans"):
+            ship_plan = ShipPlan(
+                id=pid,
+                products=json.loads(products),
+                deadline=_parse_timestamp(deadline),
+                priority=priority,
+                ship_name=ship_name or "",
+                destination=destination or "",
+                created_at=_parse_timestamp(created_at)
+            )
+            self.ship_plans[ship_plan.id] = ship_plan
+        
+        for row in db.iter_rows(
+                "SELECT id, type, status, priority, created_at, start_time, end_time, "
+                "deadline, assigned_equipment, metadata, sub_tasks FROM tasks"):
+            task = _task_from_row(row)
+            self.tasks[task.id] = task
+            # 恢复未完成任务对设备的占用
+            equipment = self.equipment.get(task.assigned_equipment)
+            if (equipment is not None and
+                    task.status in (TaskStatus.PENDING, TaskStatus.IN_PROGRESS)):
+                equipment.current_task_id = task.id
+                equipment.status = EquipmentStatus.BUSY
+        # 保存时为忙碌、但没有未完成任务占用的设备（例如移动过程中进程退出）恢复为空闲
+        for equipment in self.equipment.values():
+            if equipment.status == EquipmentStatus.BUSY and equipment.current_task_id is None:
+                equipment.status = EquipmentStatus.IDLE
+        
+        stats = {
+            'products': len(self.products),
+            'warehouses': len(self.warehouses),
+            'equipment': len(self.equipment),
+            'ship_plans': len(self.ship_plans),
+            'tasks': len(self.tasks),
+            'elapsed_seconds': time.perf_counter() - start
+        }
+        logger.info(f"从数据库恢复状态完成: {stats}")
+        return stats
+    
+    def flush(self) -> int:
+        """将写回队列中的待写数据同步落盘"""
+        return self.db_manager.flush()
+    
+    def iter_persisted_tasks(self, status: Optional[TaskStatus] = None,
+                             task_type: Optional[TaskType] = None) -> Iterator[Task]:
+        """流式读取数据库中的任务（先排空写回队列），按需逐行构造，内存占用与任务总数无关"""
+        self.flush()
+        conditions, params = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status.value)
+        if task_type is not None:
+            conditions.append("type = ?")
+            params.append(task_type.value)
+        sql = ("SELECT id, type, status, priority, created_at, start_time, end_time, "
+               "deadline, assigned_equipment, metadata, sub_tasks FROM tasks")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        for row in self.db_manager.iter_rows(sql, tuple(params), dedicated=True):
+            yield _task_from_row(row)
+    
+    def iter_persisted_inventory(self, warehouse_id: Optional[str] = None
+                                 ) -> Iterator[Tuple[str, str, int, Optional[datetime]]]:
+        """流式读取数据库中的库存（可只读取一个仓库），逐行返回 (仓库ID, 产品ID, 数量, 最后更新时间)"""
+        self.flush()
+        sql = "SELECT warehouse_id, product_id, quantity, last_updated FROM inventory"
+        params = ()
+        if warehouse_id is not None:
+            sql += " WHERE warehouse_id = ?"
+            params = (warehouse_id,)
+        for row_warehouse_id, product_id, quantity, last_updated in self.db_manager.iter_rows(
+                sql, params, dedicated=True):
+            yield row_warehouse_id, product_id, quantity, _parse_timestamp(last_updated)
+    
+    def shutdown(self):
+        """关闭系统：等待异步执行结束，排空写回队列并释放数据库连接"""
+        with self._executor_lock:
+            executor = self._task_executor
+        if executor is not None:
+            executor.shutdown()
+        self.path_planner.close_pool()
+        self.db_manager.close()
+        logger.info("TMS系统已关闭")
+    
+    def state_transaction(self):
+        """修改状态的操作所在的共享状态事务
+        
+        事务开始时拉取其他进程的修改，结束时按乐观并发提交本次修改过的行，
+        版本冲突时本地修改被撤销并抛出 ``VersionConflict``。未配置状态存储时为空操作。
+        """
+        if self.state_sync is None:
+            return nullcontext()
+        return self.state_sync.transaction()
+    
+    def mark_state_changed(self, kind: str, row_id: str):
+        """记录一行状态被修改（kind 取值见 ``StateStore.KINDS``）：计入当前事务并通知变更监听者"""
+        if self.state_sync is not None:
+            self.state_sync.mark_changed(kind, row_id)
+        self._notify_state_changed()
+    
+    def _notify_state_changed(self):
+        with self._stats_lock:
+            self.change_version += 1
+            version = self.change_version
+        for listener in list(self.change_listeners):
+            try:
+                listener(version)
+            except Exception as e:
+                logger.error(f"状态变更监听者出错: {e}")
+    
+    def sync_state(self) -> int:
+        """拉取其他进程提交的修改，返回应用的行数；未配置状态存储时返回0"""
+        if self.state_sync is None:
+            return 0
+        applied = self.state_sync.sync()
+        if applied:
+            self._notify_state_changed()
+        return applied
+    
+    @in_state_transaction
     def add_product(self, product: Product) -> bool:
         """添加产品"""
         try:
-            self.products[product.id] = product
+            self._register_product(product)
             self.db_manager.save_product(product)
             logger.info(f"添加产品: {product.name}")
             return True
@@ -549,10 +3048,11 @@ class TMSSystem:
             logger.error(f"添加产品失败: {e}")
             return False
     
+    @in_state_transaction
     def add_warehouse(self, warehouse: Warehouse) -> bool:
         """添加仓库"""
         try:
-            self.warehouses[warehouse.id] = warehouse
+            self._register_warehouse(warehouse)
             self.db_manager.save_warehouse(warehouse)
             logger.info(f"添加仓库: {warehouse.name}")
             return True
@@ -560,18 +3060,341 @@ class TMSSystem:
             logger.error(f"添加仓库失败: {e}")
             return False
     
+    @in_state_transaction
     def add_equipment(self, equipment: Equipment) -> bool:
         """添加设备"""
         try:
-            self.equipment[equipment.id] = equipment
-            # 将设备位置添加为临时障碍物
-            self.path_planner.add_obstacle(equipment.position)
+            if not self._is_position_in_grid(equipment.position):
+                raise ValueError(f"位置 {equipment.position} 超出网格范围")
+            # 注册设备，并将设备位置添加为临时障碍物
+            self._register_equipment(equipment)
+            self.db_manager.save_equipment(equipment)
             logger.info(f"添加设备: {equipment.name}")
             return True
         except Exception as e:
             logger.error(f"添加设备失败: {e}")
             return False
     
+    @in_state_transaction
+    def add_products_bulk(self, products: List[Product], atomic: bool = False,
+                          upsert: bool = False) -> Dict[str, Any]:
+        """批量添加产品：整批校验，在单个事务中写入，返回逐条错误"""
+        return self._bulk_import(
+            products, self._validate_product, self.db_manager.save_products_bulk,
+            self._register_product, self.products, "产品", atomic, upsert
+        )
+    
+    @in_state_transaction
+    def add_warehouses_bulk(self, warehouses: List[Warehouse], atomic: bool = False,
+                            upsert: bool = False) -> Dict[str, Any]:
+        """批量添加仓库：整批校验，在单个事务中写入，返回逐条错误"""
+        return self._bulk_import(
+            warehouses, self._validate_warehouse, self.db_manager.save_warehouses_bulk,
+            self._register_warehouse, self.warehouses, "仓库", atomic, upsert
+        )
+    
+    @in_state_transaction
+    def add_equipment_bulk(self, equipment_list: List[Equipment], atomic: bool = False,
+                           upsert: bool = False) -> Dict[str, Any]:
+        """批量添加设备：整批校验，在单个事务中写入，返回逐条错误"""
+        return self._bulk_import(
+            equipment_list, self._validate_equipment, self.db_manager.save_equipment_bulk,
+            self._register_equipment, self.equipment, "设备", atomic, upsert
+        )
+    
+    def _bulk_import(self, items: List[Any], validator, saver, register, registry: Dict[str, Any],
+                     label: str, atomic: bool, upsert: bool = False) -> Dict[str, Any]:
+        """批量导入的通用流程
+
+        先校验整批数据（包括批内ID重复，以及 ``upsert=False`` 时与已有对象的ID重复），
+        再将合法条目在一个事务中写入数据库，最后注册到内存模型。
+        ``atomic=True`` 时只要有一条不合法就整批放弃；``upsert=True`` 时用新对象替换ID相同的已有对象。
+        """
+        errors = []
+        valid_items = []
+        seen_ids = set()
+        
+        for index, item in enumerate(items):
+            error = validator(item)
+            if error is None and item.id in seen_ids:
+                error = f"批内ID重复: {item.id}"
+            if error is None and not upsert and item.id in registry:
+                error = f"ID已存在: {item.id}"
+            if error is not None:
+                errors.append({'index': index, 'id': getattr(item, 'id', None), 'error': error})
+                continue
+            seen_ids.add(item.id)
+            valid_items.append(item)
+        
+        result = {
+            'total': len(items),
+            'imported': 0,
+            'failed': len(errors),
+            'errors': errors
+        }
+        
+        if not valid_items or (atomic and errors):
+            logger.warning(f"批量添加{label}未写入: {len(errors)} 条校验失败")
+            return result
+        
+        try:
+            saver(valid_items)
+        except Exception as e:
+            logger.error(f"批量添加{label}失败: {e}")
+            result['failed'] = len(items)
+            result['errors'] = errors + [{'index': None, 'id': None, 'error': f"数据库写入失败: {e}"}]
+            return result
+        
+        for item in valid_items:
+            register(item)
+        
+        result['imported'] = len(valid_items)
+        logger.info(f"批量添加{label}: 成功 {len(valid_items)} 条, 失败 {len(errors)} 条")
+        return result
+    
+    def _is_position_in_grid(self, position: Position) -> bool:
+        """检查位置是否在网格范围内"""
+        return 0 <= position.x < self.grid_size[0] and 0 <= position.y < self.grid_size[1]
+    
+    def _validate_product(self, product: Product) -> Optional[str]:
+        """校验产品数据，返回错误信息或None"""
+        if not isinstance(product, Product):
+            return "不是有效的产品对象"
+        if not product.name:
+            return "产品名称不能为空"
+        if product.weight < 0 or product.volume < 0 or product.unit_price < 0:
+            return "重量、体积和单价不能为负数"
+        return None
+    
+    def _validate_warehouse(self, warehouse: Warehouse) -> Optional[str]:
+        """校验仓库数据，返回错误信息或None"""
+        if not isinstance(warehouse, Warehouse):
+            return "不是有效的仓库对象"
+        if not warehouse.name:
+            return "仓库名称不能为空"
+        if warehouse.capacity <= 0:
+            return "仓库容量必须大于0"
+        if not self._is_position_in_grid(warehouse.position):
+            return f"位置 {warehouse.position} 超出网格范围"
+        return None
+    
+    def _validate_equipment(self, equipment: Equipment) -> Optional[str]:
+        """校验设备数据，返回错误信息或None"""
+        if not isinstance(equipment, Equipment):
+            return "不是有效的设备对象"
+        if not equipment.name:
+            return "设备名称不能为空"
+        if getattr(equipment, 'capacity', 0) < 0:
+            return "设备容量不能为负数"
+        if not self._is_position_in_grid(equipment.position):
+            return f"位置 {equipment.position} 超出网格范围"
+        return None
+    
+    def _task_lock(self, task_id: str) -> threading.RLock:
+        """任务所在分段的锁"""
+        return self._task_locks[hash(task_id) % self.TASK_LOCK_STRIPES]
+    
+    @synchronized_on('_registry_lock')
+    def _register_product(self, product: Product):
+        self.products[product.id] = product
+        self.mark_state_changed('product', product.id)
+    
+    @synchronized_on('_registry_lock')
+    def _register_warehouse(self, warehouse: Warehouse):
+        replaced = self.warehouses.get(warehouse.id)
+        if replaced is not None and replaced is not warehouse:
+            replaced.observers.remove(self._on_inventory_changed)
+        self.warehouses[warehouse.id] = warehouse
+        if self._on_inventory_changed not in warehouse.observers:
+            warehouse.observers.append(self._on_inventory_changed)
+        self._warehouse_utilization[warehouse.id] = warehouse.get_utilization_rate()
+        self.route_table.add_landmark(f"warehouse:{warehouse.id}", warehouse.position)
+        self.mark_state_changed('warehouse', warehouse.id)
+    
+    @synchronized_on('_registry_lock')
+    def _unregister_warehouse(self, warehouse_id: str):
+        warehouse = self.warehouses.pop(warehouse_id, None)
+        if warehouse is None:
+            return
+        warehouse.observers.remove(self._on_inventory_changed)
+        self._warehouse_utilization.pop(warehouse_id, None)
+        self.route_table.remove_landmark(f"warehouse:{warehouse_id}")
+    
+    def _on_inventory_changed(self, warehouse: Warehouse, product_id: str):
+        """库存变化回调：更新利用率计数，并增量同步到inventory表"""
+        self._warehouse_utilization[warehouse.id] = warehouse.get_utilization_rate()
+        self.db_manager.save_inventory_change(warehouse, product_id)
+        self.mark_state_changed('warehouse', warehouse.id)
+    
+    @synchronized_on('_registry_lock')
+    def _register_equipment(self, equipment: Equipment):
+        replaced = self.equipment.get(equipment.id)
+        if replaced is not None and replaced is not equipment:
+            replaced.observers.remove(self._on_equipment_changed)
+            with self._stats_lock:
+                self._equipment_status_counts[replaced.status] -= 1
+            self._vacate_cell(replaced.position)
+        self.equipment[equipment.id] = equipment
+        if replaced is not equipment:
+            equipment.observers.append(self._on_equipment_changed)
+            with self._stats_lock:
+                self._equipment_status_counts[equipment.status] += 1
+            # 将设备位置添加为临时障碍物
+            self._occupy_cell(equipment.position)
+        self.equipment_index.add(equipment)
+        self.mark_state_changed('equipment', equipment.id)
+    
+    @synchronized_on('_registry_lock')
+    def _unregister_equipment(self, equipment_id: str):
+        equipment = self.equipment.pop(equipment_id, None)
+        if equipment is None:
+            return
+        equipment.observers.remove(self._on_equipment_changed)
+        with self._stats_lock:
+            self._equipment_status_counts[equipment.status] -= 1
+        self.equipment_index.remove(equipment_id)
+        self._vacate_cell(equipment.position)
+    
+    @synchronized_on('_planner_lock')
+    def _occupy_cell(self, position: Position):
+        cell = (position.x, position.y)
+        self._equipment_cells[cell] = self._equipment_cells.get(cell, 0) + 1
+        if self._equipment_cells[cell] == 1:
+            self.path_planner.add_obstacle(position)
+    
+    @synchronized_on('_planner_lock')
+    def _vacate_cell(self, position: Position):
+        cell = (position.x, position.y)
+        count = self._equipment_cells.get(cell, 0) - 1
+        if count > 0:
+            self._equipment_cells[cell] = count
+            return
+        self._equipment_cells.pop(cell, None)
+        self.path_planner.remove_obstacle(position)
+    
+    def _on_equipment_changed(self, equipment: Equipment, field_name: str, old_value: Any):
+        """设备字段变化回调：维护设备状态计数、空间索引和路径规划网格中的设备障碍，并保存到equipment表"""
+        if field_name == 'status':
+            with self._stats_lock:
+                self._equipment_status_counts[old_value] -= 1
+                self._equipment_status_counts[equipment.status] += 1
+        if field_name == 'position':
+            with self._planner_lock:
+                self._vacate_cell(old_value)
+                self._occupy_cell(equipment.position)
+        if field_name in ('status', 'position'):
+            self.equipment_index.update(equipment)
+            self.db_manager.save_equipment(equipment)
+        self.mark_state_changed('equipment', equipment.id)
+    
+    def precompute_routes(self, names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """计算（或重建过期的）地标距离场，names为None时处理全部地标"""
+        start_time = time.perf_counter()
+        rebuilt = self.route_table.refresh(names)
+        return {
+            'landmarks': len(self.route_table.landmarks()),
+            'rebuilt': rebuilt,
+            'elapsed_seconds': time.perf_counter() - start_time
+        }
+    
+    def get_route_distance(self, from_landmark: str, to_landmark: str) -> Optional[int]:
+        """查询两个地标间的最短路径长度，地标名称形如 'warehouse:ID'"""
+        return self.route_table.distance(from_landmark, to_landmark)
+    
+    def get_route(self, from_landmark: str, to_landmark: str) -> List[Position]:
+        """查询两个地标间的最短路线"""
+        return self.route_table.route(from_landmark, to_landmark)
+    
+    @synchronized_on('_planner_lock')
+    def get_route_distance_table(self, names: Optional[List[str]] = None) -> Dict[str, Dict[str, Optional[int]]]:
+        """获取地标之间的距离表：行为 names（默认全部地标），列为全部地标"""
+        columns = list(self.route_table.landmarks())
+        rows = columns if names is None else names
+        return {a: {b: self.route_table.distance(a, b) for b in columns} for a in rows}
+    
+    @synchronized_on('_planner_lock')
+    def plan_equipment_moves(self, moves: Dict[str, Position], execute: bool = False):
+        """为多台设备规划同一时段内互不冲突的移动路径
+        
+        moves 按优先级从高到低排列（设备ID -> 目标位置）。返回 ``MultiAgentPlan``，
+        其中包含每台设备按时刻排列的路径和本次规划耗时；execute=True 时将规划成功的
+        设备移动到路径终点（路径规划网格中的设备障碍随之移动）。执行时非空闲的设备不参与规划
+        （作为静态障碍留在原地），与移动失败的设备一起列入 ``failed``。
+        """
+        from tms_multi_agent import MultiAgentPlanner, MoveRequest
+        
+        for equipment_id, target in moves.items():
+            if equipment_id not in self.equipment:
+                raise ValueError(f"设备不存在: {equipment_id}")
+            if not self._is_position_in_grid(target):
+                raise ValueError(f"目标位置 {target} 超出网格范围")
+        
+        busy = []
+        if execute:
+            busy = [equipment_id for equipment_id in moves
+                    if self.equipment[equipment_id].status != EquipmentStatus.IDLE]
+        
+        if self._multi_agent_planner is None:
+            self._multi_agent_planner = MultiAgentPlanner(self.path_planner)
+        plan = self._multi_agent_planner.plan([
+            MoveRequest(equipment_id, self.equipment[equipment_id].position, target)
+            for equipment_id, target in moves.items() if equipment_id not in busy
+        ])
+        plan.failed.extend(busy)
+        
+        if execute:
+            moving = [self.equipment[equipment_id] for equipment_id, path in plan.paths.items()
+                      if path[-1] != path[0]]
+            for equipment in moving:
+                # 规划之后设备可能已被分配任务，此时它留在原地，路径作废
+                if not equipment.move_to(plan.paths[equipment.id][-1]):
+                    logger.warning(f"设备 {equipment.id} 已不空闲，放弃本次移动")
+                    del plan.paths[equipment.id]
+                    plan.failed.append(equipment.id)
+        return plan
+    
+    @synchronized_on('_planner_lock')
+    def open_equipment_route(self, equipment_id: str, goal: Position) -> List[Position]:
+        """为设备开始一条在途路线，之后障碍物变化时增量修复，返回初始路径"""
+        from tms_replanning import IncrementalReplanner
+        
+        if equipment_id not in self.equipment:
+            raise ValueError(f"设备不存在: {equipment_id}")
+        if not self._is_position_in_grid(goal):
+            raise ValueError(f"目标位置 {goal} 超出网格范围")
+        if self._route_replanner is None:
+            self._route_replanner = IncrementalReplanner(self.path_planner)
+        return self._route_replanner.open_route(equipment_id, self.equipment[equipment_id].position, goal)
+    
+    @synchronized_on('_planner_lock')
+    def equipment_route(self, equipment_id: str) -> List[Position]:
+        """获取设备从当前位置出发的剩余路径（按障碍物变化修复后），没有在途路线时返回空列表"""
+        if self._route_replanner is None or equipment_id not in self._route_replanner.routes:
+            return []
+        return self._route_replanner.advance(equipment_id, self.equipment[equipment_id].position)
+    
+    @synchronized_on('_planner_lock')
+    def close_equipment_route(self, equipment_id: str) -> bool:
+        """结束设备的在途路线"""
+        if self._route_replanner is None:
+            return False
+        return self._route_replanner.close_route(equipment_id)
+    
+    def simulate_shift(self, ship_plans: List[ShipPlan], arrival_interval: float = 0.0,
+                       config=None, until: Optional[float] = None):
+        """用离散事件仿真执行一批船运计划，第i个计划在 i * arrival_interval 秒到达
+        
+        任务的开始/结束时间为虚拟时钟下的时间，返回 ``tms_simulation.SimulationResult``。
+        """
+        from tms_simulation import Simulator
+        
+        with self.state_transaction():
+            simulator = Simulator(self, config)
+            for index, ship_plan in enumerate(ship_plans):
+                simulator.submit_ship_plan(ship_plan, at=index * arrival_interval)
+            return simulator.run(until)
+    
+    @in_state_transaction
     def create_ship_transport_task(self, ship_plan: ShipPlan) -> Optional[Task]:
         """创建船运任务"""
         try:
@@ -606,8 +3429,12 @@ class TMSSystem:
                 )
                 task.add_sub_task(transport_task)
             
+            self.ship_plans[ship_plan.id] = ship_plan
+            self.db_manager.save_ship_plan(ship_plan)
             self.tasks[task.id] = task
             self.db_manager.save_task(task)
+            self.mark_state_changed('ship_plan', ship_plan.id)
+            self.mark_state_changed('task', task.id)
             logger.info(f"创建船运任务: {task.id}")
             return task
             
@@ -615,6 +3442,7 @@ class TMSSystem:
             logger.error(f"创建船运任务失败: {e}")
             return None
     
+    @in_state_transaction
     def create_internal_transfer_task(self, source_warehouse_id: str, 
                                     target_warehouse_id: str, 
                                     products: Dict[str, int]) -> Optional[Task]:
@@ -632,6 +3460,7 @@ class TMSSystem:
             
             self.tasks[task.id] = task
             self.db_manager.save_task(task)
+            self.mark_state_changed('task', task.id)
             logger.info(f"创建内转任务: {task.id}")
             return task
             
@@ -640,7 +3469,19 @@ class TMSSystem:
             return None
     
     def assign_equipment_to_task(self, task_id: str, equipment_id: str) -> bool:
-        """为任务分配设备"""
+        """为任务分配设备
+        
+        配置了共享状态存储时，设备或任务已被其他进程修改（版本冲突）也返回False，
+        本地状态随之更新为存储中的最新状态。
+        """
+        try:
+            with self.state_transaction():
+                return self._assign_equipment(task_id, equipment_id)
+        except VersionConflict as e:
+            logger.warning(f"分配设备 {equipment_id} 给任务 {task_id} 时发生冲突: {e}")
+            return False
+    
+    def _assign_equipment(self, task_id: str, equipment_id: str) -> bool:
         if task_id not in self.tasks or equipment_id not in self.equipment:
             return False
         
@@ -650,93 +3491,174 @@ class TMSSystem:
         if not equipment.can_perform_task(task.task_type):
             return False
         
-        if equipment.status != EquipmentStatus.IDLE:
-            return False
-        
-        task.assigned_equipment = equipment_id
-        equipment.current_task_id = task_id
-        equipment.status = EquipmentStatus.BUSY
+        with self._task_lock(task_id):
+            # 任务仍占用着之前分配的设备时不能重复分配
+            assigned = self.equipment.get(task.assigned_equipment)
+            if assigned is not None and assigned.current_task_id == task_id:
+                return False
+            
+            if not equipment.try_reserve(task_id):
+                return False
+            task.assigned_equipment = equipment_id
+            self.mark_state_changed('task', task_id)
+            self.mark_state_changed('equipment', equipment_id)
         
         logger.info(f"设备 {equipment.name} 分配给任务 {task.id}")
         return True
     
+    @property
+    def task_executor(self):
+        """异步任务执行器（``tms_executor.TaskExecutor``），首次访问时创建
+        
+        多个线程同时首次访问时只创建一个执行器，否则多余的执行器及其线程池会被泄漏。
+        """
+        executor = self._task_executor
+        if executor is None:
+            with self._executor_lock:
+                if self._task_executor is None:
+                    from tms_executor import TaskExecutor
+                    self._task_executor = TaskExecutor(self, max_workers=self.executor_workers)
+                executor = self._task_executor
+        return executor
+    
+    def submit_task_execution(self, task_id: str, callback: Optional[Callable[[Any], None]] = None):
+        """把任务提交给执行线程池，立即返回执行句柄；同一设备的任务按提交顺序执行"""
+        return self.task_executor.submit(task_id, callback)
+    
     def execute_task(self, task_id: str) -> bool:
-        """执行任务"""
+        """执行任务
+        
+        只执行处于等待状态的任务（未分配设备的任务也可以执行），其他状态返回False。
+        配置了共享状态存储时，提交遇到版本冲突会撤销本地修改并重试（最多 ``state_retries`` 次）；
+        若冲突是因为其他进程已经改变了该任务的状态（例如已执行完成），则不再重试并返回False。
+        """
+        if self.state_sync is None:
+            return self._execute_task(task_id)
+        
+        observed = None
+        for _ in range(self.state_retries + 1):
+            try:
+                with self.state_transaction():
+                    task = self.tasks.get(task_id)
+                    observed = task.status if task is not None else None
+                    return self._execute_task(task_id)
+            except VersionConflict:
+                task = self.tasks.get(task_id)
+                if task is None or task.status != observed:
+                    logger.warning(f"任务 {task_id} 已被其他进程修改，放弃执行")
+                    return False
+        logger.error(f"任务 {task_id} 多次提交冲突，放弃执行")
+        return False
+    
+    def _execute_task(self, task_id: str) -> bool:
         if task_id not in self.tasks:
             return False
         
         task = self.tasks[task_id]
         
-        try:
-            task.start_execution()
-            
-            # 根据任务类型执行相应逻辑
-            if task.task_type == TaskType.SHIP_TRANSPORT:
-                self._execute_ship_transport_task(task)
-            elif task.task_type == TaskType.INTERNAL_TRANSFER:
-                self._execute_internal_transfer_task(task)
-            elif task.task_type == TaskType.LOADING:
-                self._execute_loading_task(task)
-            elif task.task_type == TaskType.UNLOADING:
-                self._execute_unloading_task(task)
-            
-            task.complete_task()
-            
-            # 释放设备
-            if task.assigned_equipment:
-                equipment = self.equipment[task.assigned_equipment]
-                equipment.status = EquipmentStatus.IDLE
-                equipment.current_task_id = None
+        with self._task_lock(task_id):
+            # 只执行仍在等待的任务：并发的重复请求在这里被拒绝，
+            # 任务进入执行状态之后才修改库存，同一任务不会被执行两次
+            if task.status != TaskStatus.PENDING:
+                logger.warning(f"任务 {task_id} 不在等待状态，不能执行")
+                return False
+            equipment = self.equipment.get(task.assigned_equipment) if task.assigned_equipment else None
             
-            self.db_manager.save_task(task)
-            return True
-            
-        except Exception as e:
-            task.fail_task(str(e))
-            logger.error(f"任务执行失败: {e}")
-            return False
+            self.mark_state_changed('task', task_id)
+            task.start_execution()
+            try:
+                self._apply_task(task)
+                task.complete_task()
+                
+                # 释放设备（只在设备仍被该任务占用时）
+                if equipment is not None:
+                    equipment.release(task_id)
+                
+                self.db_manager.save_task(task)
+                return True
+                
+            except Exception as e:
+                task.fail_task(str(e))
+                if equipment is not None:
+                    equipment.release(task_id)
+                logger.error(f"任务执行失败: {e}")
+                return False
+    
+    def _apply_task(self, task: Task) -> float:
+        """根据任务类型执行相应逻辑（库存和设备状态的变化），返回实际运输的吨数"""
+        if task.task_type == TaskType.SHIP_TRANSPORT:
+            return self._execute_ship_transport_task(task)
+        elif task.task_type == TaskType.INTERNAL_TRANSFER:
+            return self._execute_internal_transfer_task(task)
+        elif task.task_type == TaskType.LOADING:
+            self._execute_loading_task(task)
+        elif task.task_type == TaskType.UNLOADING:
+            self._execute_unloading_task(task)
+        return 0.0
     
-    def _execute_ship_transport_task(self, task: Task):
-        """执行船运任务"""
+    def _execute_ship_transport_task(self, task: Task) -> float:
+        """执行船运任务，返回实际出库的吨数"""
         products = task.metadata.get('products', {})
+        tons = 0.0
         
         for product_id, quantity in products.items():
             # 从成品库取货
-            product_warehouses = [w for w in self.warehouses.values() 
+            product_warehouses = [w for w in list(self.warehouses.values()) 
                                 if isinstance(w, ProductWarehouse)]
             
             for warehouse in product_warehouses:
                 if product_id in warehouse.products and warehouse.products[product_id] >= quantity:
                     product = self.products[product_id]
-                    warehouse.remove_product(product_id, quantity, product.volume)
+                    # 检查之后库存可能已被其他线程取走，以出库结果为准
+                    if not warehouse.remove_product(product_id, quantity, product.volume):
+                        continue
+                    tons += product.weight * quantity
                     self.execution_log.append(f"从 {warehouse.name} 取出 {quantity} 个 {product.name}")
                     break
+        return tons
     
-    def _execute_internal_transfer_task(self, task: Task):
-        """执行内转任务"""
+    def _execute_internal_transfer_task(self, task: Task) -> float:
+        """执行内转任务，返回实际转移的吨数"""
         source_id = task.metadata['source_warehouse_id']
         target_id = task.metadata['target_warehouse_id']
         products = task.metadata['products']
         
         source_warehouse = self.warehouses[source_id]
         target_warehouse = self.warehouses[target_id]
+        # 只读取已计算好的距离，不在执行任务时重建距离场（未预先计算时不记录）；
+        # 距离记在执行日志中，不修改调用方提供的任务元数据
+        route_distance = self.route_table.cached_distance(
+            f"warehouse:{source_id}", f"warehouse:{target_id}"
+        )
+        if route_distance is not None:
+            self.execution_log.append(
+                f"{source_warehouse.name} 到 {target_warehouse.name} 的路线距离为 {route_distance}"
+            )
         
-        for product_id, quantity in products.items():
-            if (product_id in source_warehouse.products and 
-                source_warehouse.products[product_id] >= quantity):
-                
-                product = self.products[product_id]
-                
-                # 从源仓库移除
-                source_warehouse.remove_product(product_id, quantity, product.volume)
-                
-                # 添加到目标仓库
-                target_warehouse.add_product(product_id, quantity, product.volume)
-                
-                self.execution_log.append(
-                    f"从 {source_warehouse.name} 转移 {quantity} 个 {product.name} "
-                    f"到 {target_warehouse.name}"
-                )
+        # 按仓库ID顺序同时锁定两个仓库，转移过程中其他线程看不到中间状态
+        tons = 0.0
+        first, second = sorted((source_warehouse, target_warehouse), key=lambda w: w.id)
+        with first.lock, second.lock:
+            for product_id, quantity in products.items():
+                if (product_id in source_warehouse.products and 
+                    source_warehouse.products[product_id] >= quantity):
+                    
+                    product = self.products[product_id]
+                    
+                    # 从源仓库移除
+                    source_warehouse.remove_product(product_id, quantity, product.volume)
+                    
+                    # 添加到目标仓库；目标仓库容量不足时退回源仓库
+                    if not target_warehouse.add_product(product_id, quantity, product.volume):
+                        source_warehouse.add_product(product_id, quantity, product.volume)
+                        continue
+                    
+                    tons += product.weight * quantity
+                    self.execution_log.append(
+                        f"从 {source_warehouse.name} 转移 {quantity} 个 {product.name} "
+                        f"到 {target_warehouse.name}"
+                    )
+        return tons
     
     def _execute_loading_task(self, task: Task):
         """执行装载任务"""
@@ -744,13 +3666,15 @@ class TMSSystem:
         quantity = task.metadata['quantity']
         
         # 查找可用的行车
-        available_cranes = [eq for eq in self.equipment.values() 
+        available_cranes = [eq for eq in list(self.equipment.values()) 
                            if isinstance(eq, Crane) and eq.status == EquipmentStatus.IDLE]
         
         if available_cranes:
             crane = available_cranes[0]
             product = self.products[product_id]
             crane.load_product(product, quantity)
+            self.db_manager.save_equipment(crane)
+            self.mark_state_changed('equipment', crane.id)
             self.execution_log.append(f"{crane.name} 装载 {quantity} 个 {product.name}")
     
     def _execute_unloading_task(self, task: Task):
@@ -759,42 +3683,75 @@ class TMSSystem:
         quantity = task.metadata['quantity']
         
         # 查找正在装载该产品的行车
-        loaded_cranes = [eq for eq in self.equipment.values() 
+        loaded_cranes = [eq for eq in list(self.equipment.values()) 
                         if isinstance(eq, Crane) and eq.current_load > 0]
         
         if loaded_cranes:
             crane = loaded_cranes[0]
             product = self.products[product_id]
             crane.unload_product(product, quantity)
+            self.db_manager.save_equipment(crane)
+            self.mark_state_changed('equipment', crane.id)
             self.execution_log.append(f"{crane.name} 卸载 {quantity} 个 {product.name}")
     
     def get_system_status(self) -> Dict[str, Any]:
-        """获取系统状态"""
+        """获取系统状态
+
+        所有数值都来自增量维护的计数器，无需扫描任务和设备；
+        开启 ``status_self_check`` 时会先做一次全量校验。
+        """
+        if self.status_self_check:
+            mismatches = self.verify_status_counters()
+            if mismatches:
+                raise AssertionError(f"系统状态计数器不一致: {mismatches}")
+        
+        with self._stats_lock:
+            equipment_counts = dict(self._equipment_status_counts)
         return {
             'total_products': len(self.products),
             'total_warehouses': len(self.warehouses),
             'total_equipment': len(self.equipment),
-            'active_tasks': len([t for t in self.tasks.values() 
-                               if t.status == TaskStatus.IN_PROGRESS]),
-            'pending_tasks': len([t for t in self.tasks.values() 
-                                if t.status == TaskStatus.PENDING]),
+            'active_tasks': self.tasks.count(TaskStatus.IN_PROGRESS),
+            'pending_tasks': self.tasks.count(TaskStatus.PENDING),
             'equipment_status': {
-                'idle': len([e for e in self.equipment.values() 
-                           if e.status == EquipmentStatus.IDLE]),
-                'busy': len([e for e in self.equipment.values() 
-                           if e.status == EquipmentStatus.BUSY]),
-                'maintenance': len([e for e in self.equipment.values() 
-                                 if e.status == EquipmentStatus.MAINTENANCE])
+                'idle': equipment_counts[EquipmentStatus.IDLE],
+                'busy': equipment_counts[EquipmentStatus.BUSY],
+                'maintenance': equipment_counts[EquipmentStatus.MAINTENANCE]
             },
-            'warehouse_utilization': {
-                wh.id: wh.get_utilization_rate() 
-                for wh in self.warehouses.values()
-            }
+            'warehouse_utilization': dict(self._warehouse_utilization)
         }
     
-    def optimize_task_schedule(self) -> List[str]:
-        """优化任务调度"""
-        pending_tasks = [t for t in self.tasks.values() if t.status == TaskStatus.PENDING]
+    def verify_status_counters(self) -> Dict[str, Tuple[Any, Any]]:
+        """用全量扫描校验增量计数器，返回 {名称: (计数器值, 实际值)} 形式的不一致项"""
+        mismatches = {}
+        
+        for status in TaskStatus:
+            actual = sum(1 for t in self.tasks.values() if t.status == status)
+            if self.tasks.count(status) != actual:
+                mismatches[f'tasks.{status.value}'] = (self.tasks.count(status), actual)
+        
+        for status in EquipmentStatus:
+            actual = sum(1 for e in self.equipment.values() if e.status == status)
+            if self._equipment_status_counts[status] != actual:
+                mismatches[f'equipment.{status.value}'] = (self._equipment_status_counts[status], actual)
+        
+        actual_utilization = {wh.id: wh.get_utilization_rate() for wh in self.warehouses.values()}
+        if self._warehouse_utilization != actual_utilization:
+            mismatches['warehouse_utilization'] = (dict(self._warehouse_utilization), actual_utilization)
+        
+        return mismatches
+    
+    def optimize_task_schedule(self, mode: str = "greedy") -> List[str]:
+        """优化任务调度
+
+        ``mode="greedy"``：按优先级和截止时间逐个为任务分配最近的空闲设备；
+        ``mode="optimal"``：构建任务×设备代价矩阵，一次求解全局最小代价匹配，
+        求解失败或规模过大时回退到贪心分配。
+        """
+        if mode not in self.SCHEDULE_MODES:
+            raise ValueError(f"未知的调度模式: {mode}")
+        
+        pending_tasks = self.tasks.with_status(TaskStatus.PENDING)
         
         # 按优先级和截止时间排序
         sorted_tasks = sorted(
@@ -802,26 +3759,113 @@ class TMSSystem:
             key=lambda x: (-x.priority, x.deadline or datetime.max)
         )
         
+        if mode == "optimal":
+            try:
+                return self._optimal_schedule(sorted_tasks)
+            except Exception as e:
+                logger.warning(f"最优匹配调度失败，回退到贪心调度: {e}")
+        
         optimized_schedule = []
         for task in sorted_tasks:
-            # 为任务分配最合适的设备
-            suitable_equipment = [
-                eq for eq in self.equipment.values()
-                if eq.can_perform_task(task.task_type) and eq.status == EquipmentStatus.IDLE
-            ]
-            
-            if suitable_equipment:
-                # 选择距离最近的设备
-                best_equipment = min(
-                    suitable_equipment,
-                    key=lambda eq: self._calculate_task_equipment_distance(task, eq)
+            # 通过空间索引为任务选择距离最近的空闲设备；设备在查询之后被其他线程占用时
+            # 它已离开索引，重新查询下一台
+            while True:
+                best_equipment = self.equipment_index.nearest(
+                    task.task_type, self._get_task_position(task)
                 )
-                
+                if best_equipment is None:
+                    break
                 if self.assign_equipment_to_task(task.id, best_equipment.id):
                     optimized_schedule.append(task.id)
+                    break
+                if best_equipment.status == EquipmentStatus.IDLE:
+                    break
         
         return optimized_schedule
     
+    def build_assignment_cost_matrix(self, tasks: List[Task], equipment_list: List[Equipment],
+                                     now: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """构建任务×设备的代价矩阵和可行性矩阵
+
+        代价 = 设备到任务起点的距离
+             + 优先级权重 × (最高优先级 - 任务优先级)
+             + 截止时间权重 × 剩余时间(小时，截断到 slack_horizon_hours)
+        即优先级越高、截止时间越近的任务代价越低，越容易被选中。
+        """
+        now = now or datetime.now()
+        weights = self.assignment_weights
+        n_tasks, n_equipment = len(tasks), len(equipment_list)
+        
+        # 任务位置，无位置的任务距离项记为0
+        task_xy = np.zeros((n_tasks, 2))
+        has_position = np.zeros(n_tasks, dtype=bool)
+        priorities = np.empty(n_tasks)
+        slack_hours = np.full(n_tasks, float(weights['slack_horizon_hours']))
+        type_index = np.empty(n_tasks, dtype=np.int64)
+        task_types = list(TaskType)
+        
+        for i, task in enumerate(tasks):
+            position = self._get_task_position(task)
+            if position is not None:
+                task_xy[i] = (position.x, position.y)
+                has_position[i] = True
+            priorities[i] = task.priority
+            if task.deadline is not None:
+                reference = now if task.deadline.tzinfo is None else datetime.now(task.deadline.tzinfo)
+                remaining_hours = (task.deadline - reference).total_seconds() / 3600.0
+                slack_hours[i] = min(max(remaining_hours, 0.0), weights['slack_horizon_hours'])
+            type_index[i] = task_types.index(task.task_type)
+        
+        equipment_xy = np.array([(eq.position.x, eq.position.y) for eq in equipment_list],
+                                dtype=np.float64).reshape(n_equipment, 2)
+        capability = np.array([[eq.can_perform_task(task_type) for eq in equipment_list]
+                               for task_type in task_types], dtype=bool).reshape(len(task_types), n_equipment)
+        
+        distance = (np.abs(task_xy[:, 0:1] - equipment_xy[None, :, 0]) +
+                    np.abs(task_xy[:, 1:2] - equipment_xy[None, :, 1]))
+        distance[~has_position] = 0.0
+        
+        task_cost = (weights['priority'] * (priorities.max() - priorities) +
+                     weights['deadline'] * slack_hours)
+        cost = distance + task_cost[:, None]
+        feasible = capability[type_index]
+        return cost, feasible
+    
+    def _optimal_schedule(self, sorted_tasks: List[Task]) -> List[str]:
+        """最小代价匹配调度"""
+        idle_equipment = [eq for eq in list(self.equipment.values()) if eq.status == EquipmentStatus.IDLE]
+        pending_types = {task.task_type for task in sorted_tasks}
+        idle_equipment = [eq for eq in idle_equipment
+                          if any(eq.can_perform_task(t) for t in pending_types)]
+        tasks = [task for task in sorted_tasks
+                 if any(eq.can_perform_task(task.task_type) for eq in idle_equipment)]
+        if not tasks or not idle_equipment:
+            return []
+        
+        if len(tasks) * len(idle_equipment) > self.max_assignment_cells:
+            raise ValueError(f"代价矩阵过大 ({len(tasks)}×{len(idle_equipment)})")
+        
+        cost, feasible = self.build_assignment_cost_matrix(tasks, idle_equipment)
+        # 不可行配对赋予足够大的代价，使其只在没有其他选择时才被匹配，求解后再剔除
+        infeasible_cost = (cost[feasible].max() + 1.0) * (min(cost.shape) + 1) if feasible.any() else 1.0
+        cost = np.where(feasible, cost, infeasible_cost)
+        rows, cols = solve_assignment(cost)
+        
+        # rows已升序，即按任务的优先级顺序分配
+        optimized_schedule = []
+        for row, col in zip(rows.tolist(), cols.tolist()):
+            if not feasible[row, col]:
+                continue
+            task = tasks[row]
+            if self.assign_equipment_to_task(task.id, idle_equipment[col].id):
+                optimized_schedule.append(task.id)
+        return optimized_schedule
+    
+    def _get_task_position(self, task: Task) -> Optional[Position]:
+        """获取任务的起始位置（用于设备选择），没有位置信息时返回None"""
+        warehouse = self.warehouses.get(task.metadata.get('source_warehouse_id'))
+        return warehouse.position if warehouse else None
+    
     def _calculate_task_equipment_distance(self, task: Task, equipment: Equipment) -> float:
         """计算任务与设备的距离（用于设备选择）"""
         # 简化实现，实际应根据任务类型和位置计算
@@ -830,9 +3874,21 @@ class TMSSystem:
             return equipment.position.distance_to(source_warehouse.position)
         return 0.0
     
+    def snapshot(self) -> Dict[str, Any]:
+        """全部仓库和设备的只读快照以及系统状态
+        
+        各对象的快照在其上次变化后只构建一次，读取时不持有写入方使用的锁，
+        因此适合高频的查询接口；不同对象的快照之间不保证是同一时刻的。
+        """
+        return {
+            'warehouses': {wh.id: wh.snapshot() for wh in list(self.warehouses.values())},
+            'equipment': {eq.id: eq.snapshot() for eq in list(self.equipment.values())},
+            'status': self.get_system_status()
+        }
+    
     def generate_report(self) -> Dict[str, Any]:
         """生成系统报告"""
-        completed_tasks = [t for t in self.tasks.values() if t.status == TaskStatus.COMPLETED]
+        completed_tasks = self.tasks.with_status(TaskStatus.COMPLETED)
         
         total_execution_time = sum([
             (t.end_time - t.start_time).total_seconds() 
@@ -853,7 +3909,7 @@ class TMSSystem:
                         'utilization_rate': wh.get_utilization_rate(),
                         'available_capacity': wh.get_available_capacity()
                     }
-                    for wh in self.warehouses.values()
+                    for wh in list(self.warehouses.values())
                 },
                 'equipment_status': {
                     eq.id: {
@@ -861,7 +3917,7 @@ class TMSSystem:
                         'status': eq.status.value,
                         'current_task': eq.current_task_id
                     }
-                    for eq in self.equipment.values()
+                    for eq in list(self.equipment.values())
                 }
             },
             'recent_logs': self.execution_log[-20:]  # 最近20条日志
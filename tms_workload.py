@@ -0,0 +1,138 @@
+"""
+TMS合成负载生成模块
+Synthetic Workload Generator
+
+按随机种子生成可复现的大规模场景：N个产品、M个仓库（成品库和末端库）、K台设备
+（车头和行车），以及按泊松过程到达的船运计划。同一配置和种子总是生成相同的场景，
+便于在不同版本之间比较基准测试结果。
+"""
+
+import random
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta
+from typing import List, Dict, Tuple, Any
+
+from tms_system import (
+    TMSSystem, Product, Warehouse, TerminalWarehouse, ProductWarehouse,
+    Equipment, Crane, FrameTruck, Position, ShipPlan
+)
+
+@dataclass
+class WorkloadConfig:
+    """负载规模和到达率"""
+    seed: int = 42
+    grid_size: Tuple[int, int] = (200, 200)
+    products: int = 100
+    warehouses: int = 20
+    equipment: int = 50
+    ship_plans: int = 500
+    arrival_rate: float = 60.0  # 每小时到达的船运计划数（泊松过程）
+    products_per_plan: Tuple[int, int] = (1, 3)  # 每个计划包含的产品种类数范围
+    quantity_range: Tuple[int, int] = (1, 20)  # 每种产品的数量范围
+    product_warehouse_ratio: float = 0.5  # 仓库中成品库的比例，其余为末端库
+    crane_ratio: float = 0.3  # 设备中行车的比例，其余为车头
+    deadline_hours: Tuple[float, float] = (2.0, 24.0)  # 截止时间距到达时间的范围
+    start_time: datetime = field(default_factory=lambda: datetime(2024, 1, 1, 8))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['start_time'] = self.start_time.isoformat()
+        return data
+
+@dataclass
+class Workload:
+    """生成的场景：主数据、初始库存和按到达时刻排序的船运计划"""
+    config: WorkloadConfig
+    products: List[Product]
+    warehouses: List[Warehouse]
+    equipment: List[Equipment]
+    inventory: Dict[str, Dict[str, int]]  # 仓库ID -> 产品ID -> 数量
+    arrivals: List[Tuple[float, ShipPlan]]  # (到达时刻，距 start_time 的秒数, 船运计划)
+    
+    def populate(self, tms: TMSSystem) -> Dict[str, Any]:
+        """把产品、仓库、设备和初始库存批量导入系统（在一个共享状态事务中），返回各批量导入的结果"""
+        with tms.state_transaction():
+            results = {
+                'products': tms.add_products_bulk(self.products),
+                'warehouses': tms.add_warehouses_bulk(self.warehouses),
+                'equipment': tms.add_equipment_bulk(self.equipment)
+            }
+            volumes = {product.id: product.volume for product in self.products}
+            for warehouse_id, stock in self.inventory.items():
+                warehouse = tms.warehouses[warehouse_id]
+                for product_id, quantity in stock.items():
+                    warehouse.add_product(product_id, quantity, volumes[product_id])
+        return results
+
+def generate_workload(config: WorkloadConfig) -> Workload:
+    """按配置生成场景，相同的配置（含种子）生成的场景完全相同"""
+    rng = random.Random(config.seed)
+    width, height = config.grid_size
+    if config.warehouses + config.equipment > width * height:
+        raise ValueError("网格容纳不下全部仓库和设备")
+    if config.arrival_rate <= 0:
+        raise ValueError("到达率必须大于0")
+    
+    # 仓库和设备占用互不相同的格子（设备位置在路径规划网格中是障碍物）
+    cells = rng.sample(range(width * height), config.warehouses + config.equipment)
+    positions = [Position(cell % width, cell // width) for cell in cells]
+    
+    products = [
+        Product(f"P{i:05d}", f"产品{i}", round(rng.uniform(0.5, 20.0), 2),
+                round(rng.uniform(0.5, 10.0), 2), rng.choice(("金属", "建材", "化工")),
+                round(rng.uniform(100.0, 5000.0), 2))
+        for i in range(config.products)
+    ]
+    
+    n_product_warehouses = max(1, round(config.warehouses * config.product_warehouse_ratio))
+    warehouses: List[Warehouse] = []
+    for i in range(config.warehouses):
+        if i < n_product_warehouses:
+            warehouses.append(ProductWarehouse(f"PW{i:04d}", f"成品库{i}", positions[i], 1e9))
+        else:
+            warehouses.append(TerminalWarehouse(f"TW{i:04d}", f"末端库{i}", positions[i], 1e9))
+    product_warehouses = warehouses[:n_product_warehouses]
+    
+    n_cranes = round(config.equipment * config.crane_ratio)
+    equipment: List[Equipment] = []
+    for i in range(config.equipment):
+        position = positions[config.warehouses + i]
+        if i < n_cranes:
+            # 行车轮流分配给成品库
+            warehouse = product_warehouses[i % len(product_warehouses)]
+            equipment.append(Crane(f"C{i:05d}", f"行车{i}", position, warehouse.id))
+        else:
+            equipment.append(FrameTruck(f"F{i:05d}", f"车头{i}", position))
+    
+    arrivals = []
+    at = 0.0
+    for i in range(config.ship_plans):
+        at += rng.expovariate(config.arrival_rate / 3600)
+        low, high = config.products_per_plan
+        chosen = rng.sample(products, min(len(products), rng.randint(low, high)))
+        arrival_time = config.start_time + timedelta(seconds=at)
+        plan = ShipPlan(
+            id=f"SP{i:06d}",
+            products={product.id: rng.randint(*config.quantity_range) for product in chosen},
+            deadline=arrival_time + timedelta(hours=rng.uniform(*config.deadline_hours)),
+            priority=rng.randint(1, 5),
+            ship_name=f"船{i % 50}",
+            destination=rng.choice(("上海", "宁波", "青岛", "天津", "广州")),
+            created_at=arrival_time
+        )
+        arrivals.append((at, plan))
+    
+    # 每种产品存放在至多两个成品库中，每处库存都足以满足该产品的全部需求，
+    # 船运任务总能从单个仓库取齐货物
+    demand: Dict[str, int] = {}
+    for _, plan in arrivals:
+        for product_id, quantity in plan.products.items():
+            demand[product_id] = demand.get(product_id, 0) + quantity
+    inventory: Dict[str, Dict[str, int]] = {}
+    for product in products:
+        holders = rng.sample(product_warehouses, min(len(product_warehouses), 2))
+        for warehouse in holders:
+            stock = inventory.setdefault(warehouse.id, {})
+            stock[product.id] = demand.get(product.id, 0) + config.quantity_range[1]
+    
+    return Workload(config, products, warehouses, equipment, inventory, arrivals)